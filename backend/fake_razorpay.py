@@ -0,0 +1,63 @@
+# fake_razorpay.py
+"""Local stand-in for the Razorpay orders API.
+
+Run with `uvicorn fake_razorpay:app --port 8100` and set
+RAZORPAY_API_URL=http://127.0.0.1:8100/v1 to exercise /payment/create-order
+without reaching the real gateway. FAKE_RAZORPAY_LATENCY_MS delays every
+response, which is handy for checking that slow payments don't stall other
+requests.
+"""
+
+from fastapi import FastAPI, Body, HTTPException, Request
+import asyncio
+import base64
+import os
+import time
+import uuid
+
+LATENCY_MS = int(os.getenv("FAKE_RAZORPAY_LATENCY_MS", "0"))
+
+app = FastAPI(title="Fake Razorpay")
+
+orders = {}
+
+def check_auth(request: Request):
+    header = request.headers.get("authorization", "")
+    if not header.startswith("Basic "):
+        raise HTTPException(401, "Authentication failed")
+    key_id, _, _ = base64.b64decode(header[6:]).decode().partition(":")
+    if not key_id:
+        raise HTTPException(401, "Authentication failed")
+
+@app.post("/v1/orders")
+async def create_order(request: Request, payload: dict = Body(...)):
+    check_auth(request)
+    if LATENCY_MS:
+        await asyncio.sleep(LATENCY_MS / 1000)
+
+    amount = payload.get("amount")
+    if not isinstance(amount, int) or amount < 100:
+        raise HTTPException(400, "The amount must be atleast INR 1.00")
+
+    order = {
+        "id": f"order_{uuid.uuid4().hex[:14]}",
+        "entity": "order",
+        "amount": amount,
+        "amount_paid": 0,
+        "amount_due": amount,
+        "currency": payload.get("currency", "INR"),
+        "receipt": payload.get("receipt"),
+        "status": "created",
+        "attempts": 0,
+        "notes": payload.get("notes", []),
+        "created_at": int(time.time()),
+    }
+    orders[order["id"]] = order
+    return order
+
+@app.get("/v1/orders/{order_id}")
+async def get_order(order_id: str, request: Request):
+    check_auth(request)
+    if order_id not in orders:
+        raise HTTPException(400, "The id provided does not exist")
+    return orders[order_id]
@@ -3,32 +3,56 @@ print("🔥 BACKEND LOADED FROM:", __file__)
 print("🔥 SERVER LOADED FROM:", __file__)
 print("🔥🔥🔥 THIS IS THE TOP OF THE REAL SERVER FILE:", __file__)
 
-from fastapi import FastAPI, APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Body, Query
+from fastapi import FastAPI, APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Body, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List, Dict, Any
+from starlette.datastructures import Headers, MutableHeaders
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, field_validator
+from typing import Optional, List, Dict, Any, Tuple, Set
 from datetime import datetime, timezone, timedelta
 from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import UpdateOne, ReplaceOne, ReturnDocument, IndexModel, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
 from dotenv import load_dotenv
 from pathlib import Path
 import bcrypt
 import jwt
 import uuid
+import asyncio
 import logging
 import os
 import certifi
 import re
 import json
+import orjson
+import time
+import base64
+import bisect
+import heapq
+import math
+from array import array
+from collections import Counter, OrderedDict
 import pyotp
 import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-import razorpay
+import httpx
 import hmac
 import hashlib
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # only needed for PRODUCT_CACHE_BACKEND=redis
+    aioredis = None
+
+try:
+    import brotli
+except ImportError:  # br is offered only when installed; gzip always is
+    brotli = None
 
 # ================= CONFIG =====================
 ROOT_DIR = Path(__file__).parent
@@ -47,18 +71,270 @@ SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 OTP_EXPIRY_MINUTES = int(os.getenv("OTP_EXPIRY_MINUTES", "5"))
 
+# Pagination
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "50"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "200"))
+LIST_LIMIT_MAX = 1000  # un-paginated (legacy) list responses
+
+# Caching
+FACET_CACHE_TTL_SECONDS = float(os.getenv("FACET_CACHE_TTL_SECONDS", "30"))
+FACET_CACHE_SIZE = int(os.getenv("FACET_CACHE_SIZE", "512"))
+PRODUCT_CACHE_BACKEND = os.getenv("PRODUCT_CACHE_BACKEND", "memory")  # or "redis" (shared by all workers)
+PRODUCT_CACHE_TTL_SECONDS = float(os.getenv("PRODUCT_CACHE_TTL_SECONDS", "60"))
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "2000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CATALOG_MAX_AGE_SECONDS = int(os.getenv("CATALOG_MAX_AGE_SECONDS", "30"))  # 0 = always revalidate
+CATALOG_VERSION_TTL_SECONDS = float(os.getenv("CATALOG_VERSION_TTL_SECONDS", "1"))  # other workers' writes show in ETags within this
+CATALOG_STOCK_BUMP_SECONDS = float(os.getenv("CATALOG_STOCK_BUMP_SECONDS", "1"))  # stock-only writes bump the listing version at most this often
+
+# Search
+TRIGRAM_MAX_SCAN = int(os.getenv("TRIGRAM_MAX_SCAN", "100000"))  # candidate posting entries per fuzzy query
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "1"))
+
+# Realtime
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+EVENT_BUS_BACKEND = os.getenv("EVENT_BUS_BACKEND", "change_stream")  # or "inprocess"
+EVENT_COALESCE_MS = int(os.getenv("EVENT_COALESCE_MS", "250"))
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "10"))
+SSE_REPLAY_EVENTS = int(os.getenv("SSE_REPLAY_EVENTS", "10000"))  # capped seller_events size
+SSE_MAX_REPLAY = int(os.getenv("SSE_MAX_REPLAY", "500"))  # per reconnect, beyond that send reset
+SSE_GAP_WAIT_SECONDS = float(os.getenv("SSE_GAP_WAIT_SECONDS", "2"))  # how long a stream holds events behind a missing seq
+CATALOG_EVENTS_MAX = int(os.getenv("CATALOG_EVENTS_MAX", "1000"))  # capped catalog_events size
+
+# Checkout
+RESERVATION_TIMEOUT_SECONDS = int(os.getenv("RESERVATION_TIMEOUT_SECONDS", "300"))  # unfinished checkouts older than this are swept
+RESERVATION_SWEEP_INTERVAL_SECONDS = int(os.getenv("RESERVATION_SWEEP_INTERVAL_SECONDS", "60"))
+
+# Password hashing (bcrypt runs on a dedicated pool, off the event loop)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+
+# Response compression
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))  # bytes; smaller bodies go out as-is
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+COMPRESS_OFFLOAD_SIZE = int(os.getenv("COMPRESS_OFFLOAD_SIZE", "262144"))  # bytes; larger chunks compress on a worker thread
+COMPRESS_WORKERS = int(os.getenv("COMPRESS_WORKERS", "2"))
+
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET", "")
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+GOOGLE_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
 
 # Razorpay Config
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID", "")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET", "")
-razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET)) if RAZORPAY_KEY_ID else None
+RAZORPAY_API_URL = os.getenv("RAZORPAY_API_URL", "https://api.razorpay.com/v1")
+RAZORPAY_TIMEOUT_SECONDS = float(os.getenv("RAZORPAY_TIMEOUT_SECONDS", "10"))
+RAZORPAY_MAX_CONCURRENCY = int(os.getenv("RAZORPAY_MAX_CONCURRENCY", "20"))
+
+# ================= PAYMENT GATEWAY =====================
+class RazorpayGateway:
+    """Async Razorpay orders client over one pooled, keep-alive HTTP client.
+
+    `timeout` bounds each call as a whole, on top of httpx's per-phase
+    timeouts, so a response trickling in slowly can't hold a slot for longer.
+    `transport` lets tests mount fake_razorpay.app in-process.
+    """
+
+    def __init__(
+        self, key_id: str, key_secret: str, base_url: str, timeout: float, max_concurrency: int,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            auth=(key_id, key_secret),
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            transport=transport,
+        )
+        self._timeout = timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def create_order(self, amount_in_paise: int, currency: str) -> dict:
+        async with self._slots:
+            try:
+                async with asyncio.timeout(self._timeout):
+                    resp = await self._http.post("/orders", json={
+                        "amount": amount_in_paise,
+                        "currency": currency,
+                        "payment_capture": 1  # Auto capture payment
+                    })
+            except TimeoutError:
+                raise httpx.TimeoutException(f"Razorpay did not answer within {self._timeout}s")
+        resp.raise_for_status()
+        return resp.json()
+
+    async def close(self):
+        await self._http.aclose()
+
+payment_gateway = RazorpayGateway(
+    RAZORPAY_KEY_ID,
+    RAZORPAY_KEY_SECRET,
+    RAZORPAY_API_URL,
+    RAZORPAY_TIMEOUT_SECONDS,
+    RAZORPAY_MAX_CONCURRENCY,
+) if RAZORPAY_KEY_ID else None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("server")
 
-app = FastAPI(title="LiveMART API (Full)")
+# ================= JSON RESPONSES =====================
+def json_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    """JSON rendered by orjson; datetimes come out as ISO 8601 strings"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+def fast_json(body: Any, response: Optional[Response] = None) -> FastJSONResponse:
+    """Return `body` as-is, skipping FastAPI's jsonable_encoder walk.
+
+    Only for plain Mongo documents (which orjson encodes natively). Headers
+    set on the endpoint's injected `response` (ETag etc.) are carried over.
+    """
+    return FastJSONResponse(body, headers=response_headers(response))
+
+def response_headers(response: Optional[Response]) -> Optional[dict]:
+    if response is None:
+        return None
+    return {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+
+class StreamingJSONArray(StreamingResponse):
+    """A JSON array written out as documents arrive from a cursor.
+
+    Encoded items are flushed in chunks of about `chunk_size` bytes, so the
+    first bytes go out before the whole list is in memory.
+    """
+
+    def __init__(self, docs, headers: Optional[dict] = None, chunk_size: int = 64 * 1024):
+        super().__init__(self.encode(docs, chunk_size), media_type="application/json", headers=headers)
+
+    @staticmethod
+    async def encode(docs, chunk_size: int):
+        buf = bytearray(b"[")
+        first = True
+        async for doc in docs:
+            if not first:
+                buf += b","
+            buf += orjson.dumps(doc, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+            first = False
+            if len(buf) >= chunk_size:
+                yield bytes(buf)
+                buf.clear()
+        buf += b"]"
+        yield bytes(buf)
+
+app = FastAPI(title="LiveMART API (Full)", default_response_class=FastJSONResponse)
+
+# ================= COMPRESSION =====================
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+compress_pool = ThreadPoolExecutor(max_workers=COMPRESS_WORKERS, thread_name_prefix="compress")
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, or None"""
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            q = safe_float(params.strip()[2:], 0)
+        offered[name.strip()] = q
+    for enc in ("br", "gzip") if brotli else ("gzip",):
+        if offered.get(enc, offered.get("*", 0)) > 0:
+            return enc
+    return None
+
+def new_compressor(encoding: str):
+    if encoding == "br":
+        return brotli.Compressor(quality=BROTLI_QUALITY)
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31 = gzip framing
+
+def compress_chunk(encoding: str, compressor, data: bytes, last: bool) -> bytes:
+    if encoding == "br":
+        return compressor.process(data) + (compressor.finish() if last else compressor.flush())
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    """gzip/brotli for response bodies, negotiated via Accept-Encoding.
+
+    Whole bodies under COMPRESS_MIN_SIZE, non-text types and event streams
+    pass through untouched. Streaming bodies are compressed chunk by chunk
+    with a sync flush, so clients still see each chunk as it is sent. Chunks
+    of COMPRESS_OFFLOAD_SIZE or more are compressed on compress_pool rather
+    than on the event loop.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message  # held back until the first body chunk decides
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                content_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or content_type.startswith("text/event-stream")
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (not more and len(body) < COMPRESS_MIN_SIZE)
+                ):
+                    passthrough = True
+                    await send(start)
+                    return await send(message)
+
+                compressor = new_compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more:
+                    del headers["Content-Length"]
+                else:
+                    body = await self.compress(encoding, compressor, body, True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    return await send({"type": "http.response.body", "body": body})
+                await send(start)
+
+            await send({
+                "type": "http.response.body",
+                "body": await self.compress(encoding, compressor, body, not more),
+                "more_body": more,
+            })
+
+        await self.app(scope, receive, compressing_send)
+
+    @staticmethod
+    async def compress(encoding: str, compressor, data: bytes, last: bool) -> bytes:
+        if len(data) < COMPRESS_OFFLOAD_SIZE:
+            return compress_chunk(encoding, compressor, data, last)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(compress_pool, compress_chunk, encoding, compressor, data, last)
+
+app.add_middleware(CompressionMiddleware)
 
 # ================= IMPROVED CORS CONFIGURATION =====================
 app.add_middleware(
@@ -87,18 +363,217 @@ async def connect_db():
 
     logger.info("MongoDB connected")
 
+    # seller_events: bounded replay buffer for the SSE stream, shared by all workers
+    # catalog_events: product/category writes for every worker's search indexes
+    for name, cap in (("seller_events", SSE_REPLAY_EVENTS), ("catalog_events", CATALOG_EVENTS_MAX)):
+        try:
+            if name not in await db.list_collection_names():
+                await db.create_collection(name, capped=True, size=cap * 512, max=cap)
+        except Exception:
+            logger.exception(f"{name} creation skipped or failed (non-fatal)")
+
     try:
-        # create indexes used in your app
-        await db.products.create_index("id", unique=True)
-        await db.categories.create_index("id", unique=True)
-        await db.users.create_index("email", unique=True)
-        await db.orders.create_index("id", unique=True)
-        await db.transactions.create_index("id", unique=True)
-        await db.cart.create_index("user_id", unique=True)
-        await db.purchases.create_index("id", unique=True)
-        await db.feedback.create_index("id", unique=True)  # ADD THIS LINE
-    except Exception:
-        logger.exception("Index creation skipped or failed (non-fatal)")
+        await ensure_product_schema()
+    except OperationFailure as e:
+        logger.warning(f"⚠️ products validator not installed (needs collMod rights): {e}")
+
+# Products are typed on write (ProductCreate/ProductUpdate and the
+# products_typed_fields migration), so read paths return them as stored.
+# "moderate" validates inserts and updates to already-valid documents only.
+PRODUCT_SCHEMA = {
+    "$jsonSchema": {
+        "bsonType": "object",
+        "required": ["id", "price", "stock", "rating"],
+        "properties": {
+            "id": {"bsonType": "string"},
+            "price": {"bsonType": "double", "minimum": 0},
+            "stock": {"bsonType": ["int", "long"], "minimum": 0},
+            "rating": {"bsonType": "double", "minimum": 0},
+        },
+    }
+}
+
+async def ensure_product_schema():
+    if "products" in await db.list_collection_names():
+        await db.command("collMod", "products", validator=PRODUCT_SCHEMA, validationLevel="moderate")
+    else:
+        await db.create_collection("products", validator=PRODUCT_SCHEMA, validationLevel="moderate")
+
+# =============== INDEXES =================
+# Declared index catalogue. Each hot query shape in this file should be
+# served by one of these; `python server.py check-query-plans` verifies it.
+INDEX_CATALOGUE: Dict[str, List[IndexModel]] = {
+    "products": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("seller_id", ASCENDING), ("stock", ASCENDING)]),
+        IndexModel([("category_id", ASCENDING), ("stock", ASCENDING), ("price", ASCENDING)]),
+        IndexModel([("stock", ASCENDING), ("price", ASCENDING)]),
+        IndexModel([("price", ASCENDING), ("id", ASCENDING)]),
+        IndexModel(
+            [("name", TEXT), ("description", TEXT)],
+            weights={"name": 10, "description": 2},
+            name="product_text",
+        ),
+    ],
+    "categories": [IndexModel([("id", ASCENDING)], unique=True)],
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("role", ASCENDING), ("pincode", ASCENDING)]),
+    ],
+    "otps": [IndexModel([("email", ASCENDING)])],
+    "orders": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("items.seller_id", ASCENDING)]),  # multikey
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "transactions": [IndexModel([("id", ASCENDING)], unique=True)],
+    "cart": [IndexModel([("user_id", ASCENDING)], unique=True)],
+    "purchases": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("retailer_id", ASCENDING)]),
+        IndexModel([("wholesaler_key", ASCENDING)]),
+    ],
+    "feedback": [IndexModel([("id", ASCENDING)], unique=True)],
+    "seller_stats": [IndexModel([("id", ASCENDING)], unique=True)],
+    "migrations": [IndexModel([("id", ASCENDING)], unique=True)],
+    "seller_events": [IndexModel([("seller_id", ASCENDING), ("seq", ASCENDING)])],
+    "reservations": [
+        IndexModel([("order_id", ASCENDING), ("product_id", ASCENDING)], unique=True),
+        IndexModel([("created_at", ASCENDING)]),
+    ],
+    "shops": [IndexModel([("id", ASCENDING)], unique=True)],
+}
+
+def index_signature(key, unique) -> tuple:
+    fields = []
+    for field, direction in key:
+        if field == "_ftsx":
+            continue
+        if direction == TEXT:
+            # Text indexes are stored as (_fts, _ftsx) whatever fields they cover
+            if ("_fts", TEXT) not in fields:
+                fields.append(("_fts", TEXT))
+        else:
+            fields.append((field, int(direction)))
+    return tuple(fields), bool(unique)
+
+async def diff_indexes() -> Dict[str, dict]:
+    """Compare INDEX_CATALOGUE with the indexes that actually exist"""
+    report = {}
+    for coll, models in INDEX_CATALOGUE.items():
+        actual = {
+            index_signature(info["key"], info.get("unique")): name
+            for name, info in (await db[coll].index_information()).items()
+            if name != "_id_"
+        }
+        declared = {index_signature(m.document["key"].items(), m.document.get("unique")): m for m in models}
+        missing = [m for sig, m in declared.items() if sig not in actual]
+        extra = [name for sig, name in actual.items() if sig not in declared]
+        if missing or extra:
+            report[coll] = {"missing": missing, "extra": extra}
+    return report
+
+async def ensure_indexes(dry_run: bool = False) -> Dict[str, dict]:
+    """Build declared-but-missing indexes; undeclared ones are only reported"""
+    report = await diff_indexes()
+    for coll, diff in report.items():
+        for name in diff["extra"]:
+            logger.warning(f"Index {coll}.{name} is not in INDEX_CATALOGUE")
+        if diff["missing"] and not dry_run:
+            names = await db[coll].create_indexes(diff["missing"])
+            logger.info(f"Built indexes on {coll}: {', '.join(names)}")
+    return {
+        coll: {"missing": [m.document["name"] for m in diff["missing"]], "extra": diff["extra"]}
+        for coll, diff in report.items()
+    }
+
+index_build_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def build_indexes():
+    """Kick off index builds without holding up startup"""
+    global index_build_task
+
+    async def run():
+        try:
+            await ensure_indexes()
+        except Exception:
+            logger.exception("Index creation skipped or failed (non-fatal)")
+
+    index_build_task = asyncio.create_task(run())
+
+# Representative filters for every hot read path
+HOT_QUERIES = [
+    ("products", {"id": "p"}, None),
+    # checkout: build_order_items, reserve/release/commit, low-stock deltas, purchases
+    ("products", {"id": {"$in": ["p1", "p2"]}}, None),
+    ("products", {"id": "p", "stock": {"$gte": 1}}, None),
+    ("products", {"id": "p", "reserved_by": "o"}, None),
+    ("products", {"id": {"$in": ["p1", "p2"]}, "reserved_by": "o"}, None),
+    ("products", {"id": {"$in": ["p1", "p2"]}, "stock": {"$lte": 10}}, None),
+    ("products", {"stock": {"$gt": 0}}, None),
+    ("products", {"stock": {"$gt": 0}, "price": {"$gte": 10, "$lte": 100}}, None),
+    ("products", {"seller_id": "s", "stock": {"$gt": 0}}, None),
+    ("products", {"category_id": "c", "stock": {"$gt": 0}, "price": {"$gte": 10, "$lte": 100}}, None),
+    ("products", {"stock": {"$gt": 0}}, [("price", 1), ("id", 1)]),
+    ("products", {"$text": {"$search": "apple"}, "stock": {"$gt": 0}}, None),
+    ("users", {"email": "a@b.c"}, None),
+    ("users", {"id": "u"}, None),  # order placement and payment verify
+    ("users", {"role": "retailer", "pincode": "110001"}, None),
+    ("cart", {"user_id": "u"}, None),
+    ("cart", {"user_id": "u", "items.product_id": "p"}, None),
+    ("orders", {"id": "o"}, None),
+    ("orders", {"user_id": "u"}, [("created_at", -1), ("id", -1)]),
+    ("orders", {"items.seller_id": "s"}, None),
+    ("purchases", {"wholesaler_key": "w"}, None),
+    ("purchases", {"retailer_id": "r"}, None),
+    ("seller_stats", {"id": "s"}, None),
+    ("seller_events", {"seller_id": "s", "seq": {"$gt": 1}}, [("seq", 1)]),
+    ("reservations", {"order_id": "o"}, None),
+    ("reservations", {"created_at": {"$lt": "2024-01-01T00:00:00+00:00"}}, None),
+    ("shops", {}, [("id", 1)]),  # paginated /shops
+]
+
+def plan_stages(plan) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+async def check_query_plans() -> bool:
+    """Explain every HOT_QUERIES entry; False if any winning plan is a COLLSCAN"""
+    ok = True
+    for coll, q, sort in HOT_QUERIES:
+        cursor = db[coll].find(q)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages:
+            ok = False
+            logger.error(f"❌ COLLSCAN: {coll} {q} sort={sort}")
+        else:
+            logger.info(f"✅ {coll} {q} -> {' <- '.join(stages)}")
+    return ok
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    password_pool.shutdown(wait=False, cancel_futures=True)
+    compress_pool.shutdown(wait=False, cancel_futures=True)
+    search_pool.shutdown(wait=False, cancel_futures=True)
+    if reservation_sweep_task:
+        reservation_sweep_task.cancel()
+    await google_http.aclose()
+    if payment_gateway:
+        await payment_gateway.close()
+    await product_cache.close()
 
 # ================= MODELS ==========================
 class User(BaseModel):
@@ -135,13 +610,63 @@ class OTPVerify(BaseModel):
 class GoogleAuthRequest(BaseModel):
     token: str  # Google ID token
 
+class ProductCreate(BaseModel):
+    """Typed product fields; any other keys are stored as sent"""
+    model_config = ConfigDict(extra="allow")
+
+    id: Optional[str] = None
+    price: float = Field(0.0, ge=0)
+    stock: int = Field(0, ge=0)
+    rating: float = Field(0.0, ge=0)
+
+class ProductUpdate(BaseModel):
+    """Partial update; typed fields may be omitted but not set to null"""
+    model_config = ConfigDict(extra="allow")
+
+    price: Optional[float] = Field(None, ge=0)
+    stock: Optional[int] = Field(None, ge=0)
+    rating: Optional[float] = Field(None, ge=0)
+
+    @field_validator("price", "stock", "rating")
+    @classmethod
+    def not_null(cls, value):
+        # Defaults skip validation, so this only sees values actually sent
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
 # ================ HELPERS ===========================
+password_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+password_jobs_pending = 0
+
 def hash_pw(pwd: str) -> str:
-    return bcrypt.hashpw(pwd.encode(), bcrypt.gensalt()).decode()
+    return bcrypt.hashpw(pwd.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
 
 def verify_pw(pwd: str, hashed: str) -> bool:
     return bcrypt.checkpw(pwd.encode(), hashed.encode())
 
+async def run_password_job(fn, *args):
+    """Run a bcrypt call on the password pool so it never blocks the event loop"""
+    global password_jobs_pending
+    password_jobs_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_pool, fn, *args)
+    finally:
+        password_jobs_pending -= 1
+
+async def hash_password(pwd: str) -> str:
+    return await run_password_job(hash_pw, pwd)
+
+async def verify_password(pwd: str, hashed: str) -> bool:
+    return await run_password_job(verify_pw, pwd, hashed)
+
+def password_pool_stats() -> dict:
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "pending": password_jobs_pending,
+        "queue_depth": max(0, password_jobs_pending - PASSWORD_HASH_WORKERS),
+    }
+
 def create_token(data: dict) -> str:
     payload = data.copy()
     payload["exp"] = (datetime.now(timezone.utc) + timedelta(minutes=TOKEN_EXP)).timestamp()
@@ -159,8 +684,49 @@ def safe_int(x, default=0):
     except Exception:
         return default
 
-def regex_icase(s: str):
-    return {"$regex": re.escape(s), "$options": "i"}
+# Keyset pagination helpers
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, n: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+    if not isinstance(values, list) or len(values) != n:
+        raise HTTPException(400, "Invalid cursor")
+    return values
+
+def keyset_filter(sort: List[Tuple[str, int]], values: list) -> dict:
+    """Documents strictly after `values` in `sort` order"""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {f: v for (f, _), v in zip(sort[:i], values[:i])}
+        clause[field] = {"$gt" if direction > 0 else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+def clamp_page_size(page_size: Optional[int]) -> int:
+    return min(max(page_size or PAGE_SIZE_DEFAULT, 1), PAGE_SIZE_MAX)
+
+async def fetch_page(
+    collection, q: dict, sort: List[Tuple[str, int]], cursor: Optional[str], page_size: Optional[int],
+    projection: Optional[dict] = None,
+) -> dict:
+    """One page of `q` ordered by `sort` (which must end on a unique key)"""
+    size = clamp_page_size(page_size)
+    if cursor:
+        q = {"$and": [q, keyset_filter(sort, decode_cursor(cursor, len(sort)))]}
+
+    docs = await collection.find(q, projection or {"_id": 0}).sort(sort).limit(size + 1).to_list(size + 1)
+    next_cursor = None
+    if len(docs) > size:
+        docs = docs[:size]
+        next_cursor = encode_cursor([docs[-1].get(field) for field, _ in sort])
+    return {"items": docs, "next_cursor": next_cursor}
+
+def paginated(cursor: Optional[str], page_size: Optional[int]) -> bool:
+    return cursor is not None or page_size is not None
 
 # OTP Helper Functions
 def generate_otp() -> str:
@@ -205,16 +771,89 @@ async def send_otp_email(email: str, otp: str):
         logger.error(f"❌ Failed to send OTP email: {e}")
         logger.info(f"📧 OTP for {email}: {otp}")  # Log OTP as fallback
 
+# Google ID token verification
+def cache_max_age(cache_control: Optional[str], default: int = 300) -> int:
+    """Read max-age (seconds) from a Cache-Control header"""
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return int(match.group(1)) if match else default
+
+class GoogleJWKSSource:
+    """Fetches Google's signing keys (JWKS) over a shared HTTP session"""
+
+    def __init__(self, http: httpx.AsyncClient, url: str):
+        self._http = http
+        self._url = url
+
+    async def fetch(self) -> Tuple[Dict[str, Any], int]:
+        resp = await self._http.get(self._url)
+        resp.raise_for_status()
+        keys = {k["kid"]: jwt.PyJWK(k).key for k in resp.json()["keys"]}
+        return keys, cache_max_age(resp.headers.get("cache-control"))
+
+class StaticKeySource:
+    """Fixed key set, e.g. locally generated keys for tests"""
+
+    def __init__(self, keys: Dict[str, Any], max_age: int = 3600):
+        self._keys = keys
+        self._max_age = max_age
+
+    async def fetch(self) -> Tuple[Dict[str, Any], int]:
+        return dict(self._keys), self._max_age
+
+class GoogleTokenVerifier:
+    """Verifies Google ID tokens against cached signing keys.
+
+    Keys are kept until the max-age the key source reported. An unknown kid
+    forces a refetch, at most once per min_refetch_seconds, to pick up key
+    rotation early. Signature checks run in the default executor.
+    """
+
+    def __init__(self, source, client_id: str, min_refetch_seconds: int = 60):
+        self._source = source
+        self._client_id = client_id
+        self._min_refetch = min_refetch_seconds
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._fetched_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    def _needs_refresh(self, kid: str) -> bool:
+        now = time.monotonic()
+        if now >= self._expires_at:
+            return True
+        return kid not in self._keys and now - self._fetched_at >= self._min_refetch
+
+    async def _signing_key(self, kid: str):
+        if self._needs_refresh(kid):
+            async with self._lock:
+                if self._needs_refresh(kid):
+                    keys, max_age = await self._source.fetch()
+                    now = time.monotonic()
+                    self._keys = keys
+                    self._fetched_at = now
+                    self._expires_at = now + max_age
+
+        if kid not in self._keys:
+            raise ValueError("Unknown signing key")
+        return self._keys[kid]
+
+    async def verify(self, token: str) -> dict:
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = await self._signing_key(kid)
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: jwt.decode(token, key, algorithms=["RS256"], audience=self._client_id),
+        )
+
+google_http = httpx.AsyncClient(timeout=httpx.Timeout(10.0))
+google_verifier = GoogleTokenVerifier(GoogleJWKSSource(google_http, GOOGLE_CERTS_URL), GOOGLE_CLIENT_ID)
+
 async def verify_google_token(token: str) -> dict:
     """Verify Google ID token and return user info"""
     try:
-        idinfo = id_token.verify_oauth2_token(
-            token, 
-            google_requests.Request(), 
-            GOOGLE_CLIENT_ID
-        )
+        idinfo = await google_verifier.verify(token)
         
-        if idinfo['iss'] not in ['accounts.google.com', 'https://accounts.google.com']:
+        if idinfo['iss'] not in GOOGLE_ISSUERS:
             raise ValueError('Wrong issuer.')
         
         return {
@@ -234,7 +873,7 @@ async def register(data: UserCreate):
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed = hash_pw(data.password)
+    hashed = await hash_password(data.password)
     user_dict = data.model_dump()
     user_dict.pop("password", None)
     
@@ -261,7 +900,7 @@ async def register(data: UserCreate):
 @api.post("/auth/login", response_model=Token)
 async def login(data: UserLogin):
     user_doc = await db.users.find_one({"email": data.email})
-    if not user_doc or not verify_pw(data.password, user_doc.get("password", "")):
+    if not user_doc or not await verify_password(data.password, user_doc.get("password", "")):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     user_doc.pop("password", None)
@@ -441,7 +1080,7 @@ async def google_auth(data: GoogleAuthRequest):
             
             user = User(**user_dict)
             doc = user.model_dump()
-            doc["password"] = hash_pw(str(uuid.uuid4()))  # Random password for OAuth users
+            doc["password"] = await hash_password(str(uuid.uuid4()))  # Random password for OAuth users
             doc["google_id"] = google_user.get("google_id")
             doc["picture"] = google_user.get("picture")
             
@@ -550,6 +1189,19 @@ async def health_check():
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
 
+@api.get("/metrics")
+async def get_metrics():
+    """Runtime counters for worker pools and caches"""
+    return {
+        "password_pool": password_pool_stats(),
+        "websocket": ws_hub.stats(),
+        "sse": seller_streams.stats(),
+        "facet_cache": facet_cache.stats(),
+        "catalog_versions": catalog_versions.stats(),
+        "product_cache": await product_cache.stats(),
+        "single_flight": read_flights.stats(),
+    }
+
 # ============== TEST CART ENDPOINT ==================
 @api.get("/test-cart/{uid}")
 async def test_cart(uid: str):
@@ -648,10 +1300,11 @@ async def get_product_feedback(product_id: str):
 # ============== SEED-DATA ============================
 @api.post("/seed-data")
 async def seed_data():
+    seed_pw = await hash_password("password")
     wholesalers = [
-        {"id": "wh1", "name": "Wholesaler One", "role": "wholesaler", "email": "wh1@example.com", "phone": "000", "password": hash_pw("password"), "pincode": "110001", "address": "Wholesale Market, Delhi"},
-        {"id": "ret1", "name": "Retailer One", "role": "retailer", "email": "ret1@example.com", "phone": "111", "password": hash_pw("password"), "pincode": "110001", "address": "Retail Store, Delhi"},
-        {"id": "9b155690-f6b4-4119-b3d0-4f4e8d717e18", "name": "Default Retailer", "role": "retailer", "email": "retailer@default.com", "phone": "222", "password": hash_pw("password"), "pincode": "400001", "address": "Default Store, Mumbai"},
+        {"id": "wh1", "name": "Wholesaler One", "role": "wholesaler", "email": "wh1@example.com", "phone": "000", "password": seed_pw, "pincode": "110001", "address": "Wholesale Market, Delhi"},
+        {"id": "ret1", "name": "Retailer One", "role": "retailer", "email": "ret1@example.com", "phone": "111", "password": seed_pw, "pincode": "110001", "address": "Retail Store, Delhi"},
+        {"id": "9b155690-f6b4-4119-b3d0-4f4e8d717e18", "name": "Default Retailer", "role": "retailer", "email": "retailer@default.com", "phone": "222", "password": seed_pw, "pincode": "400001", "address": "Default Store, Mumbai"},
     ]
 
     categories = [
@@ -672,23 +1325,753 @@ async def seed_data():
 
     for c in categories:
         await db.categories.update_one({"id": c["id"]}, {"$set": c}, upsert=True)
+        await publish_catalog_change("category", c)
+    await bump_catalog_version("categories")
 
     for p in products:
-        await db.products.update_one({"id": p["id"]}, {"$set": p}, upsert=True)
+        await db.products.update_one({"id": p["id"]}, {"$set": p, "$setOnInsert": {"rating": 0.0}}, upsert=True)
+        await publish_catalog_change("product", p)
+
+    await rebuild_seller_stats()
+    await invalidate_products([p["id"] for p in products])
 
     return {"message": "seeded"}
 
+# ================= CACHES ==================
+class TTLCache:
+    """In-process LRU cache with a per-entry TTL and hit/miss/eviction counters"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def peek(self, key, default=None):
+        """Like get() but leaves the LRU order and counters alone"""
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            return default
+        return item[1]
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+# Facet counts are a browsing aid, not stock truth: they expire on the TTL
+# only, so a burst of product writes can't force a whole-catalogue
+# $facet aggregation per listing request.
+facet_cache = TTLCache(FACET_CACHE_SIZE, FACET_CACHE_TTL_SECONDS)
+
+class LocalProductCache:
+    """Product documents cached in this worker only.
+
+    Every eviction bumps the product's generation. A loader reads the
+    generation before it queries Mongo and passes it to set(), which drops
+    the document if an eviction happened in between: that read may predate
+    the write, and caching it would serve the old copy until the TTL.
+    Generations are opaque strings, as in RedisProductCache.
+    """
+
+    backend = "memory"
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize, ttl)
+        self._generations: Dict[str, int] = {}  # pid -> evictions; bounded by the catalogue
+        self.stale_sets = 0
+
+    async def get(self, pid: str) -> Optional[dict]:
+        return self._cache.get(pid)
+
+    async def generation(self, pid: str) -> Optional[str]:
+        return str(self._generations.get(pid, 0))
+
+    async def set(self, pid: str, doc: dict, generation: Optional[str]):
+        if generation != str(self._generations.get(pid, 0)):
+            self.stale_sets += 1
+            return
+        self._cache.set(pid, doc)
+
+    async def evict(self, pids: List[str]):
+        for pid in pids:
+            self._cache.pop(pid)
+            self._generations[pid] = self._generations.get(pid, 0) + 1
+
+    async def stats(self) -> dict:
+        return {"backend": self.backend, **self._cache.stats(), "stale_sets": self.stale_sets}
+
+    async def close(self):
+        pass
+
+class RedisProductCache:
+    """Product documents cached in Redis, shared by every worker.
+
+    An eviction by one worker is seen by all of them, so a stock change made
+    through one process never leaves a stale copy behind in another. As in
+    LocalProductCache, evictions bump a per-product generation key and set()
+    only writes (atomically, in a script) if it still matches the one read
+    before the Mongo query. Redis errors are logged and treated as misses;
+    Mongo stays the source of truth.
+    """
+
+    backend = "redis"
+    GENERATION_TTL = 3600  # seconds; far longer than any read-to-set window
+    SET_IF_CURRENT = """
+    if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[2] then
+        return 0
+    end
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+    return 1
+    """
+
+    def __init__(self, url: str, ttl: float):
+        if aioredis is None:
+            raise RuntimeError("PRODUCT_CACHE_BACKEND=redis requires the redis package")
+        self._redis = aioredis.from_url(url)
+        self._set_if_current = self._redis.register_script(self.SET_IF_CURRENT)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_sets = 0
+
+    @staticmethod
+    def key(pid: str) -> str:
+        return f"product:{pid}"
+
+    @staticmethod
+    def generation_key(pid: str) -> str:
+        return f"product:{pid}:gen"
+
+    async def get(self, pid: str) -> Optional[dict]:
+        try:
+            raw = await self._redis.get(self.key(pid))
+        except aioredis.RedisError as e:
+            logger.warning(f"⚠️ product cache read failed: {e}")
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def generation(self, pid: str) -> Optional[str]:
+        """None when Redis is unreachable; set() then skips the write"""
+        try:
+            raw = await self._redis.get(self.generation_key(pid))
+        except aioredis.RedisError as e:
+            logger.warning(f"⚠️ product cache read failed: {e}")
+            return None
+        return raw.decode() if raw is not None else "0"
+
+    async def set(self, pid: str, doc: dict, generation: Optional[str]):
+        if generation is None:
+            return
+        try:
+            written = await self._set_if_current(
+                keys=[self.key(pid), self.generation_key(pid)],
+                args=[json.dumps(doc, default=str), generation, max(1, int(self.ttl))],
+            )
+        except aioredis.RedisError as e:
+            logger.warning(f"⚠️ product cache write failed: {e}")
+            return
+        if not written:
+            self.stale_sets += 1
+
+    async def evict(self, pids: List[str]):
+        if not pids:
+            return
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                for pid in pids:
+                    pipe.delete(self.key(pid))
+                    pipe.incr(self.generation_key(pid))
+                    pipe.expire(self.generation_key(pid), self.GENERATION_TTL)
+                await pipe.execute()
+        except aioredis.RedisError as e:
+            logger.error(f"❌ product cache eviction failed, entries expire in {self.ttl}s: {e}")
+
+    async def stats(self) -> dict:
+        out = {"backend": self.backend, "hits": self.hits, "misses": self.misses, "stale_sets": self.stale_sets}
+        try:
+            info = await self._redis.info("stats")
+            out["evictions"] = info.get("evicted_keys", 0)
+            out["size"] = await self._redis.dbsize()
+        except aioredis.RedisError:
+            pass
+        return out
+
+    async def close(self):
+        await self._redis.aclose()
+
+product_cache = (
+    RedisProductCache(REDIS_URL, PRODUCT_CACHE_TTL_SECONDS)
+    if PRODUCT_CACHE_BACKEND == "redis"
+    else LocalProductCache(PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL_SECONDS)
+)
+
+async def invalidate_products(pids: List[str], listing_changed: bool = True):
+    """Drop cached copies of products after a write.
+
+    Stock-only changes (orders, reservations) pass listing_changed=False:
+    they fold their listing version bumps into one per
+    CATALOG_STOCK_BUMP_SECONDS instead of a write to the shared counter per
+    checkout. Facet counts are left to expire on their TTL either way.
+    """
+    await product_cache.evict(pids)
+    if listing_changed:
+        await bump_catalog_version("products")
+    else:
+        stock_bumps.add("products")
+
+# ----------------- HTTP VALIDATORS (ETag) -------------------
+# Listing ETags come from per-collection version counters kept in Mongo, so
+# every worker hands out the same tag. `epoch` is set once per counter and
+# keeps a recreated database from reusing version numbers clients cached.
+# The tag is read before the body and is part of the single-flight key, so
+# a body is never older than the tag it goes out with. Each worker keeps
+# the counters for CATALOG_VERSION_TTL_SECONDS, so a conditional GET costs
+# no Mongo round trip. Its own bumps apply at once; another worker's show
+# up within the TTL, and until then a client may get one extra 304 for the
+# old version. Product detail is tagged by content instead (body_etag).
+catalog_versions = TTLCache(16, CATALOG_VERSION_TTL_SECONDS)
+
+def remember_catalog_version(name: str, doc: Optional[dict]) -> Tuple[str, int]:
+    """Cache a counter read from Mongo unless a newer one is already cached"""
+    doc = doc or {}
+    version = (doc.get("epoch", "0"), doc.get("v", 0))
+    current = catalog_versions.peek(name)
+    # concurrent bumps can finish out of order; never step a counter back
+    if current is not None and current[0] == version[0] and current[1] > version[1]:
+        return current
+    catalog_versions.set(name, version)
+    return version
+
+async def bump_catalog_version(name: str):
+    doc = await db.catalog_versions.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"v": 1}, "$setOnInsert": {"epoch": uuid.uuid4().hex[:8]}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    remember_catalog_version(name, doc)
+
+async def load_catalog_version(name: str) -> Tuple[str, int]:
+    return remember_catalog_version(name, await db.catalog_versions.find_one({"_id": name}))
+
+class DeferredVersionBumps:
+    """Bumps catalog versions once per window for any number of writes.
+
+    Listings revalidated within the window may get a 304 for the previous
+    stock levels, as they already may for another worker's writes until
+    its bump shows up through the version TTL.
+    """
+
+    def __init__(self, window: float):
+        self._window = window
+        self._pending: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def add(self, name: str):
+        self._pending.add(name)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self._window)
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, set()
+        self._flush_task = None
+        for name in pending:
+            try:
+                await bump_catalog_version(name)
+            except PyMongoError as e:
+                logger.error(f"❌ catalog version bump for {name} failed: {e}")
+
+stock_bumps = DeferredVersionBumps(CATALOG_STOCK_BUMP_SECONDS)
+
+async def catalog_etag(name: str) -> str:
+    version = catalog_versions.get(name)
+    if version is None:
+        version = await read_flights.do(("catalog_version", name), lambda: load_catalog_version(name))
+    epoch, v = version
+    return f'W/"{name}.{epoch}.{v}"'
+
+def body_etag(body) -> str:
+    digest = hashlib.sha1(orjson.dumps(
+        body, default=json_default, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+    )).hexdigest()
+    return f'W/"{digest[:16]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison against an If-None-Match header"""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in {t.removeprefix("W/") for t in tags}
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """A 304 when the client already has `etag`; otherwise tags `response`"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CATALOG_MAX_AGE_SECONDS}" if CATALOG_MAX_AGE_SECONDS > 0 else "no-cache",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one.
+
+    The first caller starts the work as a task; callers arriving while it is
+    in flight await the same task instead of querying again. Keys are tuples
+    whose first element names the endpoint, which the counters are kept by.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self.calls: Counter = Counter()
+        self.coalesced: Counter = Counter()
+
+    async def do(self, key: tuple, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls[key[0]] += 1
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.coalesced[key[0]] += 1
+        # shield: one caller disconnecting must not cancel the others' result
+        return await asyncio.shield(task)
+
+    def _done(self, key: tuple, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every waiter went away
+
+    def stats(self) -> dict:
+        out = {}
+        for name, calls in self.calls.items():
+            shared = self.coalesced[name]
+            out[name] = {
+                "calls": calls,
+                "coalesced": shared,
+                "fan_in": round((calls + shared) / calls, 2),
+            }
+        return {"inflight": len(self._inflight), "endpoints": out}
+
+read_flights = SingleFlight()
+
+# ================= SUGGEST (PREFIX INDEX) ==================
+class PrefixIndex:
+    """In-memory trie over the words of a label, for type-ahead suggestions.
+
+    Every node caches its best `cap` entries, so a lookup is one walk down
+    the prefix. Invariant: node.top is the best `cap` of the node's own
+    entries (node.own, kept sorted) and its children's tops. A removal
+    repairs the affected path bottom-up from those lists, so it costs
+    O(depth * children * cap) however large the subtree is.
+    """
+
+    class Node:
+        __slots__ = ("children", "own", "top")
+
+        def __init__(self):
+            self.children: Dict[str, "PrefixIndex.Node"] = {}
+            self.own: List[tuple] = []  # sorted (sort_key, key) of terms ending here
+            self.top: List[tuple] = []  # sorted (sort_key, key), best first
+
+    def __init__(self, cap: int = 20, max_depth: int = 32):
+        self.cap = cap
+        self.max_depth = max_depth
+        self._root = self.Node()
+        self._entries: Dict[str, Tuple[tuple, dict, List[str]]] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+    def _terms(self, label: str) -> List[str]:
+        words = self.normalize(label).split()
+        # Whole label plus every word, so "milk" finds "Fresh Milk"
+        return list(dict.fromkeys([" ".join(words)] + words)) if words else []
+
+    def _item(self, key: str) -> tuple:
+        rank = self._entries[key][0]
+        return (tuple(-x for x in rank) + (key,), key)
+
+    def _path(self, term: str) -> List["PrefixIndex.Node"]:
+        nodes = []
+        node = self._root
+        for ch in term[:self.max_depth]:
+            node = node.children.get(ch)
+            if node is None:
+                break
+            nodes.append(node)
+        return nodes
+
+    def upsert(self, key: str, label: str, rank: tuple, payload: dict):
+        if key in self._entries:
+            self.remove(key)
+        terms = self._terms(label)
+        self._entries[key] = (rank, payload, terms)
+        item = self._item(key)
+        for term in terms:
+            node = self._root
+            for ch in term[:self.max_depth]:
+                node = node.children.setdefault(ch, self.Node())
+                if (len(node.top) < self.cap or item < node.top[-1]) and item not in node.top:
+                    bisect.insort(node.top, item)
+                    del node.top[self.cap:]
+            i = bisect.bisect_left(node.own, item)
+            if i == len(node.own) or node.own[i] != item:  # two terms may truncate alike
+                node.own.insert(i, item)
+
+    def remove(self, key: str):
+        if key not in self._entries:
+            return
+        item = self._item(key)
+        terms = self._entries.pop(key)[2]
+        affected: Dict[int, Tuple[int, "PrefixIndex.Node"]] = {}
+        for term in terms:
+            path = self._path(term)
+            if len(path) == len(term[:self.max_depth]):
+                i = bisect.bisect_left(path[-1].own, item)
+                if i < len(path[-1].own) and path[-1].own[i] == item:
+                    del path[-1].own[i]
+            for depth, node in enumerate(path):
+                affected[id(node)] = (depth, node)
+        # Deepest first, so every child is repaired before its parent reads it
+        for _, node in sorted(affected.values(), key=lambda dn: -dn[0]):
+            i = bisect.bisect_left(node.top, item)
+            if i < len(node.top) and node.top[i] == item:
+                if len(node.top) < self.cap:
+                    del node.top[i]  # not full: the cache held the whole subtree
+                else:
+                    self._refill(node)
+
+    def _refill(self, node: "PrefixIndex.Node"):
+        top: List[tuple] = []
+        seen: Set[str] = set()
+        sources = [node.own[:self.cap]] + [child.top for child in node.children.values()]
+        for item in heapq.merge(*sources):
+            if item[1] not in seen:
+                seen.add(item[1])
+                top.append(item)
+                if len(top) == self.cap:
+                    break
+        node.top = top
+
+    def suggest(self, prefix: str, k: int = 10) -> List[dict]:
+        prefix = self.normalize(prefix)
+        if not prefix:
+            return []
+        node = self._root
+        for ch in prefix[:self.max_depth]:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return [self._entries[key][1] for _, key in node.top[:k]]
+
+product_suggest = PrefixIndex()
+category_suggest = PrefixIndex()
+
+def index_product_suggestion(doc: dict):
+    stock = safe_int(doc.get("stock", 0))
+    rating = safe_float(doc.get("rating", 0))
+    product_suggest.upsert(
+        doc["id"],
+        doc.get("name", ""),
+        (1 if stock > 0 else 0, rating, stock),
+        {"id": doc["id"], "name": doc.get("name", ""), "stock": stock, "rating": rating},
+    )
+
+def index_category_suggestion(doc: dict):
+    category_suggest.upsert(doc["id"], doc.get("name", ""), (), {"id": doc["id"], "name": doc.get("name", "")})
+
+# ================= FUZZY NAME SEARCH (TRIGRAMS) ==================
+EMPTY_POSTING = array("I")
+
+class TrigramIndex:
+    """Typo-tolerant name matching by trigram similarity (like pg_trgm).
+
+    Each name is indexed as a whole and word by word, and a document scores
+    its best-matching slot, so "bred" still finds "Bread (Retail)". Slots are
+    dense integers: each trigram's posting list is an array('I') of slots
+    (4 bytes per (slot, trigram) pair), and every slot also costs a 2-byte
+    trigram count, a `_keys` pointer and an int object in its key's `_slots`
+    list. For 200k grocery names (1M slots, 9.6M pairs) that is ~114 MiB,
+    ~12 bytes per pair; see tests/benchmarks/bench_trigram.py. Postings stay
+    sorted because slots are only appended. Updates tombstone the old slots
+    and append new ones; the arrays are compacted once tombstones pass a
+    quarter of slots.
+    """
+
+    def __init__(self):
+        self._keys: List[Optional[str]] = []  # slot -> document key
+        self._sizes = array("H")  # slot -> trigram count
+        self._slots: Dict[str, List[int]] = {}  # document key -> slots
+        self._postings: Dict[str, array] = {}
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    @staticmethod
+    def trigrams(text: str) -> Set[str]:
+        grams = set()
+        for word in re.findall(r"\w+", (text or "").lower()):
+            padded = f"  {word} "
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+        return grams
+
+    def upsert(self, key: str, text: str):
+        self.remove(key)
+        words = re.findall(r"\w+", (text or "").lower())
+        terms = list(dict.fromkeys([" ".join(words)] + words)) if len(words) > 1 else words
+        slots = []
+        for term in terms:
+            grams = self.trigrams(term)
+            slot = len(self._keys)
+            self._keys.append(key)
+            self._sizes.append(min(len(grams), 0xFFFF))
+            slots.append(slot)
+            for g in grams:
+                posting = self._postings.get(g)
+                if posting is None:
+                    posting = self._postings[g] = array("I")
+                posting.append(slot)
+        if slots:
+            self._slots[key] = slots
+
+    def remove(self, key: str):
+        slots = self._slots.pop(key, None)
+        if not slots:
+            return
+        for slot in slots:
+            self._keys[slot] = None
+        self._dead += len(slots)
+        if self._dead * 4 > len(self._keys):
+            self._compact()
+
+    def _compact(self):
+        remap = array("I", [0]) * len(self._keys)
+        keys: List[Optional[str]] = []
+        sizes = array("H")
+        slots: Dict[str, List[int]] = {}
+        for slot, key in enumerate(self._keys):
+            if key is not None:
+                remap[slot] = len(keys)
+                slots.setdefault(key, []).append(len(keys))
+                keys.append(key)
+                sizes.append(self._sizes[slot])
+        live = self._keys
+        postings = {}
+        for g, posting in self._postings.items():
+            kept = array("I", (remap[s] for s in posting if live[s] is not None))
+            if kept:
+                postings[g] = kept
+        self._keys, self._sizes, self._slots, self._postings, self._dead = keys, sizes, slots, postings, 0
+
+    PROBE_COST = 8  # a bisect probe costs about as much as counting 8 posting entries
+
+    def search(self, text: str, threshold: float = 0.3, limit: int = 100,
+               max_scan: Optional[int] = TRIGRAM_MAX_SCAN) -> List[Tuple[str, float]]:
+        """(key, similarity) pairs with similarity >= threshold, best first.
+
+        A slot sharing c of the query's n trigrams scores at most c/n, so a
+        hit shares at least need = ceil(threshold*n) of them and must appear
+        in one of the n - need + 1 rarest postings. Only those are scanned
+        for candidates, at most max_scan entries: a posting that no longer
+        fits is skipped (or, for the first, cut to its oldest slots), which
+        drops the hits found only there. Every other posting is then counted
+        for the candidates alone, by bisection when that is cheaper than
+        scanning it, so each query costs at most about max_scan * PROBE_COST
+        per trigram. None scans everything.
+        """
+        grams = self.trigrams(text)
+        if not grams:
+            return []
+        # snapshot: _compact rebinds these, so a search on a worker thread
+        # keeps a consistent slot numbering
+        keys, sizes, index = self._keys, self._sizes, self._postings
+        n = len(grams)
+        postings = sorted((index.get(g, EMPTY_POSTING) for g in grams), key=len)
+        need = max(1, math.ceil(threshold * n - 1e-9))
+        budget = max_scan if max_scan is not None else sys.maxsize
+
+        shared: Counter = Counter()
+        rest = postings[n - need + 1:]
+        for posting in postings[:n - need + 1]:
+            if len(posting) <= budget:
+                shared.update(posting)
+                budget -= len(posting)
+            elif not shared:
+                shared.update(posting[:budget])
+                budget = 0
+            else:
+                rest.append(posting)
+        candidates = list(shared) if rest else []
+        probes = len(candidates) * self.PROBE_COST
+        for posting in rest:
+            if len(posting) <= probes:
+                shared.update(posting)  # non-candidates counted here can only score low
+                continue
+            size = len(posting)
+            for slot in candidates:
+                i = bisect.bisect_left(posting, slot)
+                if i < size and posting[i] == slot:
+                    shared[slot] += 1
+
+        best: Dict[str, float] = {}
+        for slot in [slot for slot, common in shared.items() if common >= need]:
+            key = keys[slot]
+            if key is None:
+                continue
+            common = shared[slot]
+            similarity = common / (n + sizes[slot] - common)
+            if similarity >= threshold and similarity > best.get(key, 0):
+                best[key] = similarity
+        return heapq.nlargest(limit, best.items(), key=lambda kv: kv[1])
+
+product_trigrams = TrigramIndex()
+search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="trigram")
+
+def index_product_search(doc: dict):
+    """Refresh a product in the in-memory suggest and fuzzy indexes"""
+    index_product_suggestion(doc)
+    product_trigrams.upsert(doc["id"], doc.get("name", ""))
+
+def unindex_product_search(pid: str):
+    product_suggest.remove(pid)
+    product_trigrams.remove(pid)
+
+# Catalog writes are applied here and also inserted into the capped
+# catalog_events collection. The event bus carries that insert to every
+# worker, so the other workers' tries and trigram indexes follow edits and
+# deletes too. Applying an event twice is harmless.
+def apply_catalog_event(event: dict):
+    if event["kind"] == "category":
+        if event.get("deleted"):
+            category_suggest.remove(event["id"])
+        else:
+            index_category_suggestion(event)
+    elif event.get("deleted"):
+        unindex_product_search(event["id"])
+    else:
+        index_product_search(event)
+
+async def publish_catalog_change(kind: str, doc: dict, deleted: bool = False):
+    event = {"kind": kind, "id": doc["id"], "deleted": deleted}
+    if not deleted:
+        event.update({f: doc[f] for f in ("name", "stock", "rating") if f in doc})
+    apply_catalog_event(event)
+    await db.catalog_events.insert_one(event)
+    await event_bus.publish("catalog_events", event)
+
+async def build_search_indexes(batch_size: int = 5000):
+    """Load every product and category name into the in-memory indexes"""
+    fields = {"_id": 0, "id": 1, "name": 1, "stock": 1, "rating": 1}
+    count = 0
+    async for doc in db.products.find({}, fields, batch_size=batch_size):
+        index_product_search(doc)
+        count += 1
+        if count % 500 == 0:
+            await asyncio.sleep(0)  # let requests run between slices of the build
+    async for doc in db.categories.find({}, {"_id": 0, "id": 1, "name": 1}):
+        index_category_suggestion(doc)
+    logger.info(
+        f"Search indexes ready: {len(product_suggest)} products, "
+        f"{len(category_suggest)} categories, {len(product_trigrams)} fuzzy names"
+    )
+
+search_build_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_search_indexes():
+    global search_build_task
+
+    async def run():
+        try:
+            await build_search_indexes()
+        except Exception:
+            logger.exception("Search index build failed")
+
+    search_build_task = asyncio.create_task(run())
+
 # ================= PRODUCTS ===========================
-@api.get("/products")
-async def get_products(
-    category_id: Optional[str] = None,
-    search: Optional[str] = None,
-    min_price: Optional[float] = None,
-    max_price: Optional[float] = None,
-    available_only: Optional[bool] = True,
-    seller_id: Optional[str] = None,
-    limit: int = 1000,
-):
+# reserved_by holds the ids of checkouts holding stock (see reserve_stock);
+# it is bookkeeping, so every product read leaves it out.
+PRODUCT_PROJECTION = {"_id": 0, "reserved_by": 0}
+
+PRODUCT_SORTS = {
+    "id": [("id", 1)],
+    "price": [("price", 1), ("id", 1)],
+}
+
+async def search_products(q: dict, search: str, cursor: Optional[str], size: int) -> dict:
+    """Relevance-ranked text search; the other listing filters ride along in $match.
+
+    Pages are keyed on (score desc, id) so cursors work for searches too.
+    """
+    pipeline: List[dict] = [
+        {"$match": {"$text": {"$search": search}, **q}},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    sort = [("score", -1), ("id", 1)]
+    if cursor:
+        pipeline.append({"$match": keyset_filter(sort, decode_cursor(cursor, len(sort)))})
+    pipeline += [
+        {"$sort": dict(sort)},
+        {"$limit": size + 1},
+        {"$project": PRODUCT_PROJECTION},
+    ]
+
+    docs = await db.products.aggregate(pipeline).to_list(size + 1)
+    next_cursor = None
+    if len(docs) > size:
+        docs = docs[:size]
+        next_cursor = encode_cursor([docs[-1]["score"], docs[-1]["id"]])
+    return {"items": docs, "next_cursor": next_cursor}
+
+def product_filters(category_id, min_price, max_price, available_only, seller_id) -> Dict[str, Any]:
+    """Listing filters keyed by the field they constrain"""
     q: Dict[str, Any] = {}
 
     if seller_id:
@@ -697,12 +2080,6 @@ async def get_products(
     if category_id and category_id != "all":
         q["category_id"] = category_id
 
-    if search:
-        q["$or"] = [
-            {"name": regex_icase(search)},
-            {"description": regex_icase(search)},
-        ]
-
     if min_price is not None or max_price is not None:
         pf = {}
         if min_price is not None:
@@ -714,85 +2091,287 @@ async def get_products(
     if available_only:
         q["stock"] = {"$gt": 0}
 
-    items = await db.products.find(q, {"_id": 0}).to_list(length=limit)
+    return q
 
-    for it in items:
-        it["price"] = safe_float(it.get("price", 0))
-        it["stock"] = safe_int(it.get("stock", 0))
-        it["rating"] = safe_float(it.get("rating", 0))
+PRICE_BANDS = [0, 50, 100, 250, 500, 1000, 5000]
 
+async def product_facets(filters: Dict[str, Any], search: Optional[str]) -> dict:
+    """Category, price-band and stock counts in one $facet aggregation.
+
+    Each facet ignores the filter on its own field, so picking a category
+    still shows counts for the other categories.
+    """
+    key = (json.dumps(filters, sort_keys=True), search)
+    cached = facet_cache.get(key)
+    if cached is not None:
+        return cached
+
+    def others(*fields):
+        return {"$match": {f: c for f, c in filters.items() if f not in fields and f != "seller_id"}}
+
+    base: Dict[str, Any] = {"seller_id": filters["seller_id"]} if "seller_id" in filters else {}
+    if search:
+        base["$text"] = {"$search": search}
+
+    pipeline = [
+        {"$match": base},
+        {"$facet": {
+            "categories": [
+                others("category_id"),
+                {"$group": {"_id": "$category_id", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}},
+            ],
+            "price_bands": [
+                others("price"),
+                {"$bucket": {
+                    "groupBy": "$price",
+                    "boundaries": PRICE_BANDS,
+                    "default": "other",
+                    "output": {"count": {"$sum": 1}},
+                }},
+            ],
+            "stock": [
+                others("stock"),
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "in_stock": {"$sum": {"$cond": [{"$gt": ["$stock", 0]}, 1, 0]}},
+                }},
+            ],
+        }},
+    ]
+    raw = (await db.products.aggregate(pipeline).to_list(1))[0]
+
+    bands = []
+    for b in raw["price_bands"]:
+        if b["_id"] == "other":
+            bands.append({"min": None, "max": None, "count": b["count"]})
+        else:
+            i = PRICE_BANDS.index(b["_id"])
+            bands.append({"min": b["_id"], "max": PRICE_BANDS[i + 1], "count": b["count"]})
+    stock = raw["stock"][0] if raw["stock"] else {"total": 0, "in_stock": 0}
+
+    result = {
+        "categories": [{"category_id": c["_id"], "count": c["count"]} for c in raw["categories"]],
+        "price_bands": bands,
+        "in_stock": stock["in_stock"],
+        "total": stock["total"],
+    }
+    facet_cache.set(key, result)
+    return result
+
+FUZZY_CANDIDATES = 500
+
+async def fuzzy_search_products(q: dict, search: str, threshold: float, size: int) -> dict:
+    """Trigram matches on name, post-filtered by the listing filters in Mongo"""
+    # tens of ms of pure Python on a large catalogue; keep it off the loop
+    hits = await asyncio.get_running_loop().run_in_executor(
+        search_pool, product_trigrams.search, search, threshold, FUZZY_CANDIDATES)
+    if not hits:
+        return {"items": [], "next_cursor": None}
+    scores = dict(hits)
+    docs = await db.products.find({**q, "id": {"$in": list(scores)}}, PRODUCT_PROJECTION).to_list(None)
+    for doc in docs:
+        doc["similarity"] = round(scores[doc["id"]], 4)
+    docs.sort(key=lambda d: (-d["similarity"], d["id"]))
+    return {"items": docs[:size], "next_cursor": None}
+
+@api.get("/products")
+async def get_products(
+    request: Request,
+    response: Response,
+    category_id: Optional[str] = None,
+    search: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    available_only: Optional[bool] = True,
+    seller_id: Optional[str] = None,
+    limit: int = 1000,
+    cursor: Optional[str] = None,
+    page_size: Optional[int] = None,
+    sort: str = "id",
+    fuzzy: bool = False,
+    similarity: float = Query(0.3, ge=0, le=1),
+    facets: bool = False,
+    stream: bool = False,
+):
+    """Product listing.
+
+    Pass cursor and/or page_size for keyset pages ({"items", "next_cursor"})
+    ordered by id or by (price, id); otherwise a plain list of up to `limit`.
+    With `search`, results come from the text index ranked by relevance;
+    add `fuzzy=true` for typo-tolerant trigram matching on names instead.
+    `facets=true` adds category, price-band and stock counts (and always
+    returns the {"items", ...} envelope).
+    Identical concurrent queries share one database round trip.
+    `stream=true` writes a plain list straight from the cursor instead.
+    """
+    etag = await catalog_etag("products")
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+
+    if stream and not (search or facets or paginated(cursor, page_size)):
+        q = product_filters(category_id, min_price, max_price, available_only, seller_id)
+        docs = db.products.find(q, PRODUCT_PROJECTION).limit(min(limit, LIST_LIMIT_MAX))
+        return StreamingJSONArray(docs, headers=response_headers(response))
+
+    if paginated(cursor, page_size):
+        page_size = clamp_page_size(page_size)
+    else:
+        limit = min(limit, LIST_LIMIT_MAX)
+    if search:
+        search = search.strip().lower() or None
+    key = (
+        "products", etag, category_id, search, min_price, max_price, available_only, seller_id,
+        limit, cursor, page_size, sort, fuzzy, similarity, facets,
+    )
+    body = await read_flights.do(key, lambda: load_products(
+        category_id, search, min_price, max_price, available_only, seller_id,
+        limit, cursor, page_size, sort, fuzzy, similarity, facets,
+    ))
+    return fast_json(body, response)
+
+async def load_products(
+    category_id, search, min_price, max_price, available_only, seller_id,
+    limit, cursor, page_size, sort, fuzzy, similarity, facets,
+):
+    filters = product_filters(category_id, min_price, max_price, available_only, seller_id)
+    q: Dict[str, Any] = dict(filters)
+
+    if search and fuzzy:
+        size = clamp_page_size(page_size) if paginated(cursor, page_size) else min(limit, LIST_LIMIT_MAX)
+        page = await fuzzy_search_products(q, search, similarity, size)
+        items = page["items"]
+    elif search:
+        size = clamp_page_size(page_size) if paginated(cursor, page_size) else min(limit, LIST_LIMIT_MAX)
+        page = await search_products(q, search, cursor, size)
+        items = page["items"]
+    elif paginated(cursor, page_size):
+        if sort not in PRODUCT_SORTS:
+            raise HTTPException(400, f"sort must be one of {', '.join(PRODUCT_SORTS)}")
+        page = await fetch_page(db.products, q, PRODUCT_SORTS[sort], cursor, page_size, PRODUCT_PROJECTION)
+        items = page["items"]
+    else:
+        items = await db.products.find(q, PRODUCT_PROJECTION).to_list(length=min(limit, LIST_LIMIT_MAX))
+
+    if facets:
+        page = page if paginated(cursor, page_size) else {"items": items}
+        page["facets"] = await product_facets(filters, search)
+        return page
+    if paginated(cursor, page_size):
+        return page
     return items
 
+@api.get("/products/suggest")
+async def suggest_products(q: str = Query(..., min_length=1), k: int = Query(10, ge=1, le=20)):
+    """Type-ahead suggestions for product and category names"""
+    return {
+        "query": q,
+        "products": product_suggest.suggest(q, k),
+        "categories": category_suggest.suggest(q, k),
+    }
+
 @api.get("/products/retailer/{rid}")
 async def get_products_by_retailer(rid: str):
     items = await db.products.find(
-        {"seller_id": rid, "stock": {"$gt": 0}}, {"_id": 0}
+        {"seller_id": rid, "stock": {"$gt": 0}}, PRODUCT_PROJECTION
     ).to_list(1000)
 
-    for it in items:
-        it["price"] = safe_float(it.get("price", 0))
-        it["stock"] = safe_int(it.get("stock", 0))
-        it["rating"] = safe_float(it.get("rating", 0))
-
     return items
 
 @api.get("/products/{pid}")
-async def get_product(pid: str):
-    item = await db.products.find_one({"id": pid}, {"_id": 0})
+async def get_product(pid: str, request: Request, response: Response):
+    item = await product_cache.get(pid)
+    if item is None:
+        item = await read_flights.do(("product", pid), lambda: load_product(pid))
+    # Tagged by content: a worker's cached copy can be older than the
+    # catalog version, and the tag must describe the body actually sent
+    cached = not_modified(request, response, body_etag(item))
+    if cached:
+        return cached
+    return fast_json(item, response)
+
+async def load_product(pid: str):
+    # read before the query: an invalidation racing it makes the set a no-op
+    generation = await product_cache.generation(pid)
+    item = await db.products.find_one({"id": pid}, PRODUCT_PROJECTION)
     if not item:
         raise HTTPException(404, "Product not found")
 
-    item["price"] = safe_float(item.get("price", 0))
-    item["stock"] = safe_int(item.get("stock", 0))
-    item["rating"] = safe_float(item.get("rating", 0))
-
+    await product_cache.set(pid, item, generation)
     return item
 
 @api.post("/products")
-async def create_product(payload: dict = Body(...)):
-    if "id" not in payload or not payload["id"]:
+async def create_product(product: ProductCreate):
+    payload = product.model_dump()
+    if not payload["id"]:
         payload["id"] = str(uuid.uuid4())
 
-    payload["price"] = safe_float(payload.get("price", 0))
-    payload["stock"] = safe_int(payload.get("stock", 0))
-
-    if "rating" not in payload:
-        payload["rating"] = 0
-
-    await db.products.update_one({"id": payload["id"]}, {"$set": payload}, upsert=True)
-    doc = await db.products.find_one({"id": payload["id"]}, {"_id": 0})
+    before = await db.products.find_one_and_update(
+        {"id": payload["id"]},
+        {"$set": payload},
+        projection=PRODUCT_PROJECTION,
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+    doc = {**(before or {}), **payload}
+    await move_product_count((before or {}).get("seller_id"), doc.get("seller_id"))
+    await publish_catalog_change("product", doc)
+    await invalidate_products([doc["id"]])
 
     return doc
 
 @api.put("/products/{pid}")
-async def update_product(pid: str, payload: dict = Body(...)):
-    if "price" in payload:
-        payload["price"] = safe_float(payload["price"])
-    if "stock" in payload:
-        payload["stock"] = safe_int(payload["stock"])
-    if "rating" in payload:
-        payload["rating"] = safe_float(payload["rating"])
-
-    await db.products.update_one({"id": pid}, {"$set": payload})
-
-    doc = await db.products.find_one({"id": pid}, {"_id": 0})
-    if not doc:
+async def update_product(pid: str, product: ProductUpdate):
+    payload = product.model_dump(exclude_unset=True)
+    if not payload:
+        raise HTTPException(400, "Nothing to update")
+
+    before = await db.products.find_one_and_update(
+        {"id": pid},
+        {"$set": payload},
+        projection=PRODUCT_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
+    )
+    if not before:
         raise HTTPException(404, "Product not found")
 
-    doc["rating"] = safe_float(doc.get("rating", 0))
+    doc = {**before, **payload}
+    await move_product_count(before.get("seller_id"), doc.get("seller_id"))
+    await publish_catalog_change("product", doc)
+    await invalidate_products([pid])
+
     return doc
 
 @api.delete("/products/{pid}")
 async def delete_product(pid: str):
-    res = await db.products.delete_one({"id": pid})
-    if res.deleted_count == 0:
+    doc = await db.products.find_one_and_delete({"id": pid}, projection={"_id": 0, "seller_id": 1})
+    if not doc:
         raise HTTPException(404, "Product not found")
+    await move_product_count(doc.get("seller_id"), None)
+    await publish_catalog_change("product", {"id": pid}, deleted=True)
+    await invalidate_products([pid])
     return {"message": "Product deleted"}
 
 # ================= CATEGORIES ========================
 @api.get("/categories")
-async def get_categories():
-    return await db.categories.find({}, {"_id": 0}).to_list(1000)
+async def get_categories(request: Request, response: Response, cursor: Optional[str] = None, page_size: Optional[int] = None):
+    etag = await catalog_etag("categories")
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+
+    if paginated(cursor, page_size):
+        page_size = clamp_page_size(page_size)
+        return await read_flights.do(
+            ("categories", etag, cursor, page_size),
+            lambda: fetch_page(db.categories, {}, [("id", 1)], cursor, page_size),
+        )
+    return await read_flights.do(
+        ("categories", etag),
+        lambda: db.categories.find({}, {"_id": 0}).to_list(LIST_LIMIT_MAX),
+    )
 
 @api.post("/categories")
 async def create_category(payload: dict = Body(...)):
@@ -804,11 +2383,41 @@ async def create_category(payload: dict = Body(...)):
     await db.categories.update_one({"id": payload["id"]}, {"$set": payload}, upsert=True)
 
     doc = await db.categories.find_one({"id": payload["id"]}, {"_id": 0})
+    await publish_catalog_change("category", doc)
+    await bump_catalog_version("categories")
     return doc
 
 # ================= CART ============================
+CART_PRODUCT_FIELDS = {"_id": 0, "id": 1, "name": 1, "price": 1, "stock": 1, "image_url": 1, "unit": 1, "seller_id": 1}
+
+async def hydrate_cart(cart: dict) -> dict:
+    """Attach product details, line totals and stock flags with one $in query"""
+    pids = list({it["product_id"] for it in cart["items"]})
+    products = await db.products.find({"id": {"$in": pids}}, CART_PRODUCT_FIELDS).to_list(None)
+    by_id = {p["id"]: p for p in products}
+
+    subtotal = 0.0
+    item_count = 0
+    all_in_stock = True
+    for it in cart["items"]:
+        product = by_id.get(it["product_id"])
+        if product:
+            it["line_total"] = product["price"] * it["quantity"]
+            it["in_stock"] = product["stock"] >= it["quantity"]
+        else:
+            it["line_total"] = 0.0
+            it["in_stock"] = False
+        it["product"] = product
+
+        subtotal += it["line_total"]
+        item_count += it["quantity"]
+        all_in_stock = all_in_stock and it["in_stock"]
+
+    cart["totals"] = {"subtotal": subtotal, "item_count": item_count, "all_in_stock": all_in_stock}
+    return cart
+
 @api.get("/cart/{uid}")
-async def get_cart(uid: str):
+async def get_cart(uid: str, hydrate: bool = False):
     # Validate user ID format
     if not uid or len(uid) < 5:
         raise HTTPException(400, "Invalid user ID format")
@@ -817,13 +2426,15 @@ async def get_cart(uid: str):
 
     # FIX: If cart does not exist or items is not a list, normalize
     if not cart or not isinstance(cart.get("items"), list):
-        return {"user_id": uid, "items": []}
+        cart = {"user_id": uid, "items": []}
 
     # Optional: Ensure quantity is safe
     for it in cart["items"]:
         it["quantity"] = safe_int(it.get("quantity", 1))
 
-    return cart
+    if hydrate:
+        return fast_json(await hydrate_cart(cart))
+    return fast_json(cart)
 
 @api.post("/cart/{uid}")
 async def add_to_cart(uid: str, payload: dict = Body(...)):
@@ -837,30 +2448,37 @@ async def add_to_cart(uid: str, payload: dict = Body(...)):
     if not pid:
         raise HTTPException(400, "product_id required")
 
-    product = await db.products.find_one({"id": pid}, {"_id": 0})
+    product = await db.products.find_one({"id": pid}, {"_id": 1})
     if not product:
         raise HTTPException(400, f"Invalid product ID: {pid}")
 
-    # FIX: Always return items=[] if broken
-    cart = await db.cart.find_one({"user_id": uid}) or {"user_id": uid, "items": []}
-    if not isinstance(cart.get("items"), list):
-        cart["items"] = []
-
-    updated = False
-    for item in cart["items"]:
-        if item["product_id"] == pid:
-            item["quantity"] = safe_int(item["quantity"]) + qty
-            updated = True
-            break
-
-    if not updated:
-        cart["items"].append({"product_id": pid, "quantity": qty})
+    # Bump the existing line in place, or push a new one (creating the cart if
+    # needed). The $ne guard makes a racing push fall back to the $inc path.
+    while True:
+        cart = await db.cart.find_one_and_update(
+            {"user_id": uid, "items.product_id": pid},
+            {"$inc": {"items.$.quantity": qty}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        if cart:
+            return cart
 
-    await db.cart.replace_one({"user_id": uid}, cart, upsert=True)
-    
-    # Return the updated cart without MongoDB _id
-    cart.pop('_id', None)
-    return cart
+        # Reset a malformed `items` (legacy carts) so the $push can't fail on it
+        await db.cart.update_one(
+            {"user_id": uid, "items": {"$not": {"$type": "array"}}},
+            {"$set": {"items": []}},
+        )
+        try:
+            return await db.cart.find_one_and_update(
+                {"user_id": uid, "items.product_id": {"$ne": pid}},
+                {"$push": {"items": {"product_id": pid, "quantity": qty}}},
+                projection={"_id": 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            continue
 
 @api.put("/cart/{uid}/{itemId}")
 async def update_cart_item(uid: str, itemId: str, quantity: int = Query(...)):
@@ -868,25 +2486,18 @@ async def update_cart_item(uid: str, itemId: str, quantity: int = Query(...)):
     if not uid or len(uid) < 5:
         raise HTTPException(400, "Invalid user ID format")
     
-    cart = await db.cart.find_one({"user_id": uid})
-    if not cart:
-        raise HTTPException(404, "Cart not found")
-
-    found = False
-    for item in cart["items"]:
-        if item["product_id"] == itemId:
-            item["quantity"] = safe_int(quantity)
-            found = True
-            break
-
-    if not found:
-        raise HTTPException(404, "Item not in cart")
+    cart = await db.cart.find_one_and_update(
+        {"user_id": uid, "items.product_id": itemId},
+        {"$set": {"items.$.quantity": safe_int(quantity)}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if cart:
+        return cart
 
-    await db.cart.replace_one({"user_id": uid}, cart)
-    
-    # Return without MongoDB _id
-    cart.pop('_id', None)
-    return cart
+    if not await db.cart.count_documents({"user_id": uid}, limit=1):
+        raise HTTPException(404, "Cart not found")
+    raise HTTPException(404, "Item not in cart")
 
 @api.delete("/cart/{uid}/{itemId}")
 async def remove_cart_item(uid: str, itemId: str):
@@ -894,16 +2505,15 @@ async def remove_cart_item(uid: str, itemId: str):
     if not uid or len(uid) < 5:
         raise HTTPException(400, "Invalid user ID format")
     
-    cart = await db.cart.find_one({"user_id": uid})
+    cart = await db.cart.find_one_and_update(
+        {"user_id": uid},
+        {"$pull": {"items": {"product_id": itemId}}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
     if not cart:
         raise HTTPException(404, "Cart not found")
 
-    cart["items"] = [i for i in cart["items"] if i["product_id"] != itemId]
-
-    await db.cart.replace_one({"user_id": uid}, cart)
-    
-    # Return without MongoDB _id
-    cart.pop('_id', None)
     return cart
 
 @api.delete("/cart/{uid}")
@@ -915,6 +2525,829 @@ async def clear_cart(uid: str):
     await db.cart.delete_one({"user_id": uid})
     return {"message": "Cart cleared"}
 
+# ================= ORDER BUILDING ==================
+async def build_order_items(items: List[dict]):
+    """Fetch every basket product in one query, check stock and price the lines"""
+    if not items:
+        raise HTTPException(400, "Basket is empty")
+    lines = []
+    for it in items:
+        if not isinstance(it, dict) or not it.get("product_id"):
+            raise HTTPException(400, "Every item needs a product_id")
+        qty = safe_int(it.get("quantity"))
+        if qty < 1:
+            raise HTTPException(400, f"Quantity must be at least 1 for {it['product_id']}")
+        lines.append((it["product_id"], qty))
+
+    requested: Dict[str, int] = {}
+    for pid, qty in lines:
+        requested[pid] = requested.get(pid, 0) + qty
+
+    products = await db.products.find(
+        {"id": {"$in": list(requested)}}, PRODUCT_PROJECTION
+    ).to_list(None)
+    by_id = {p["id"]: p for p in products}
+
+    # CHECK STOCK FIRST
+    for pid, qty in requested.items():
+        product = by_id.get(pid)
+        if not product:
+            raise HTTPException(404, f"Product not found: {pid}")
+        if product["stock"] < qty:
+            raise HTTPException(400, f"Insufficient stock for {product['name']}")
+
+    # BUILD ORDER ITEMS
+    order_items = []
+    total = 0.0
+    for pid, qty in lines:
+        product = by_id[pid]
+        subtotal = product["price"] * qty
+        total += subtotal
+
+        order_items.append({
+            "product_id": pid,
+            "product_name": product["name"],
+            "quantity": qty,
+            "price": product["price"],
+            "total": subtotal,
+            "seller_id": product["seller_id"]
+        })
+
+    return order_items, total
+
+# ================= STOCK RESERVATION ==================
+def order_quantities(order_items: List[dict]) -> Dict[str, int]:
+    """Total quantity per product across all order lines"""
+    requested: Dict[str, int] = {}
+    for it in order_items:
+        requested[it["product_id"]] = requested.get(it["product_id"], 0) + it["quantity"]
+    return requested
+
+def drop_reservation_marker(order_id: str) -> dict:
+    """Pipeline stage removing one order's marker from products.reserved_by"""
+    remaining = {"$setDifference": [{"$ifNull": ["$reserved_by", []]}, [order_id]]}
+    return {"$set": {"reserved_by": {"$cond": [{"$eq": [remaining, []]}, "$$REMOVE", remaining]}}}
+
+async def reserve_stock(order_id: str, order_items: List[dict]):
+    """Decrement stock for every line in one bulk_write, or for none of them.
+
+    Each update only matches while stock >= qty, so concurrent checkouts can't
+    drive stock negative. Matched products are tagged with the order id in the
+    same update, so a partial reservation can be rolled back precisely. Every
+    marker lookup is scoped to the basket's ids, so it rides the unique id
+    index. The tag never leaves the server: product reads project it out.
+
+    One db.reservations row per line is written first. If the process dies
+    before the order is committed or released, sweep_reservations finds the
+    rows and either finishes the commit or gives the stock back.
+    """
+    requested = order_quantities(order_items)
+    now = datetime.now(timezone.utc).isoformat()
+    await db.reservations.insert_many([
+        {"order_id": order_id, "product_id": pid, "quantity": qty, "created_at": now}
+        for pid, qty in requested.items()
+    ])
+    ops = [
+        UpdateOne(
+            {"id": pid, "stock": {"$gte": qty}},
+            {"$inc": {"stock": -qty}, "$addToSet": {"reserved_by": order_id}},
+        )
+        for pid, qty in requested.items()
+    ]
+    result = await db.products.bulk_write(ops, ordered=False)
+    await invalidate_products(list(requested), listing_changed=False)
+    if result.matched_count == len(ops):
+        return
+
+    reserved = await db.products.distinct("id", {"id": {"$in": list(requested)}, "reserved_by": order_id})
+    await release_stock(order_id, {pid: requested[pid] for pid in reserved})
+
+    short = [it["product_name"] for it in order_items if it["product_id"] not in reserved]
+    raise HTTPException(400, f"Insufficient stock for {short[0] if short else 'item'}")
+
+async def release_stock(order_id: str, requested: Dict[str, int]):
+    """Give back stock taken by reserve_stock and drop the order's reservation.
+
+    Only products still tagged with the order are touched, so releasing a
+    line whose stock was never taken, or releasing twice, is a no-op.
+    """
+    if requested:
+        ops = [
+            UpdateOne(
+                {"id": pid, "reserved_by": order_id},
+                [{"$set": {"stock": {"$add": ["$stock", qty]}}}, drop_reservation_marker(order_id)],
+            )
+            for pid, qty in requested.items()
+        ]
+        await db.products.bulk_write(ops, ordered=False)
+        await invalidate_products(list(requested), listing_changed=False)
+    await db.reservations.delete_many({"order_id": order_id})
+
+async def commit_reservation(order_id: str, pids: List[str]):
+    """Clear the reservation markers once the order is saved"""
+    await db.products.update_many(
+        {"id": {"$in": pids}, "reserved_by": order_id},
+        [drop_reservation_marker(order_id)],
+    )
+    await db.reservations.delete_many({"order_id": order_id})
+
+async def save_reserved_order(order: dict):
+    """Reserve stock for every line, then insert the order"""
+    await reserve_stock(order["id"], order["items"])
+    try:
+        await db.orders.insert_one(order)
+    except Exception:
+        await release_stock(order["id"], order_quantities(order["items"]))
+        raise
+    await commit_reservation(order["id"], list(order_quantities(order["items"])))
+
+async def sweep_reservations(older_than: float = RESERVATION_TIMEOUT_SECONDS) -> int:
+    """Settle reservations left behind by checkouts that never finished.
+
+    A reservation whose order was saved is committed; any other is released.
+    Checkouts take milliseconds, so `older_than` only has to be long enough
+    not to race one still in flight. Returns the number of orders settled.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=older_than)).isoformat()
+    stale: Dict[str, Dict[str, int]] = {}
+    async for r in db.reservations.find({"created_at": {"$lt": cutoff}}, {"_id": 0}):
+        stale.setdefault(r["order_id"], {})[r["product_id"]] = r["quantity"]
+
+    for order_id, requested in stale.items():
+        if await db.orders.count_documents({"id": order_id}, limit=1):
+            await commit_reservation(order_id, list(requested))
+        else:
+            await release_stock(order_id, requested)
+            logger.warning(f"Released stock held by unfinished checkout {order_id}")
+    return len(stale)
+
+reservation_sweep_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_reservation_sweeper():
+    global reservation_sweep_task
+
+    async def run():
+        while True:
+            try:
+                await sweep_reservations()
+            except Exception:
+                logger.exception("Reservation sweep failed")
+            await asyncio.sleep(RESERVATION_SWEEP_INTERVAL_SECONDS)
+
+    reservation_sweep_task = asyncio.create_task(run())
+
+# ================= SELLER STATS ==================
+# seller_stats holds one pre-aggregated document per seller, keyed by the
+# lowercased seller id, so the dashboards are single point reads:
+#   products_count                      listings owned by the seller
+#   sales_orders / sales_revenue        customer orders containing the seller's items
+#   purchases_count                     wholesale purchases made (retailers)
+#   wholesale_orders / wholesale_revenue  purchases received (wholesalers)
+#   units_sold.<product_id>             units sold per product
+def seller_key(seller_id: str) -> str:
+    return (seller_id or "").lower()
+
+async def bump_seller_stats(incs: Dict[str, Dict[str, float]]):
+    """Apply {seller_id: {field: delta}} increments in one bulk_write"""
+    ops = [
+        UpdateOne({"id": seller_key(sid)}, {"$inc": inc}, upsert=True)
+        for sid, inc in incs.items() if sid and inc
+    ]
+    if ops:
+        await db.seller_stats.bulk_write(ops, ordered=False)
+
+async def record_order_stats(order_items: List[dict]):
+    incs: Dict[str, Dict[str, float]] = {}
+    for it in order_items:
+        inc = incs.setdefault(it["seller_id"], {"sales_orders": 1, "sales_revenue": 0})
+        inc["sales_revenue"] += it["total"]
+        units = f"units_sold.{it['product_id']}"
+        inc[units] = inc.get(units, 0) + it["quantity"]
+    await bump_seller_stats(incs)
+
+async def move_product_count(old_seller: Optional[str], new_seller: Optional[str]):
+    """Keep products_count right when a listing is created, deleted or re-owned"""
+    if seller_key(old_seller) == seller_key(new_seller):
+        return
+    incs = {}
+    if old_seller:
+        incs[old_seller] = {"products_count": -1}
+    if new_seller:
+        incs[new_seller] = {"products_count": 1}
+    await bump_seller_stats(incs)
+
+def empty_seller_stats(key: str) -> dict:
+    return {
+        "id": key,
+        "products_count": 0,
+        "sales_orders": 0,
+        "sales_revenue": 0,
+        "purchases_count": 0,
+        "wholesale_orders": 0,
+        "wholesale_revenue": 0,
+        "units_sold": {},
+    }
+
+async def get_seller_stats(seller_id: str) -> dict:
+    """The dashboard counters; units_sold grows with the catalogue and is left out"""
+    key = seller_key(seller_id)
+    doc = await db.seller_stats.find_one({"id": key}, {"_id": 0, "units_sold": 0})
+    # Rows created by $inc upserts only carry the fields touched so far
+    stats = {**empty_seller_stats(key), **(doc or {})}
+    del stats["units_sold"]
+    return stats
+
+async def rebuild_seller_stats(batch_size: int = 1000) -> int:
+    """Regenerate seller_stats from products, orders and purchases.
+
+    History is streamed with bounded cursor batches and the rollups are
+    written back batch_size sellers at a time. Writes that land while the
+    rebuild runs may be overwritten, so run it during quiet periods.
+    """
+    stats: Dict[str, dict] = {}
+
+    def row(seller_id):
+        key = seller_key(seller_id)
+        if key not in stats:
+            stats[key] = empty_seller_stats(key)
+        return stats[key]
+
+    async for p in db.products.find({}, {"_id": 0, "seller_id": 1}, batch_size=batch_size):
+        if p.get("seller_id"):
+            row(p["seller_id"])["products_count"] += 1
+
+    async for o in db.orders.find({}, {"_id": 0, "items": 1}, batch_size=batch_size):
+        sellers = set()
+        for it in o.get("items", []):
+            r = row(it.get("seller_id"))
+            r["sales_revenue"] += it.get("total", 0)
+            units = r["units_sold"]
+            units[it["product_id"]] = units.get(it["product_id"], 0) + it.get("quantity", 0)
+            sellers.add(r["id"])
+        for key in sellers:
+            stats[key]["sales_orders"] += 1
+
+    purchase_fields = {"_id": 0, "retailer_id": 1, "wholesaler_key": 1, "product_id": 1, "quantity": 1, "total_amount": 1}
+    async for pu in db.purchases.find({}, purchase_fields, batch_size=batch_size):
+        if pu.get("retailer_id"):
+            row(pu["retailer_id"])["purchases_count"] += 1
+        if pu.get("wholesaler_key"):
+            w = row(pu["wholesaler_key"])
+            w["wholesale_orders"] += 1
+            w["wholesale_revenue"] += pu.get("total_amount", 0)
+            if pu.get("product_id"):
+                w["units_sold"][pu["product_id"]] = w["units_sold"].get(pu["product_id"], 0) + pu.get("quantity", 0)
+
+    stats.pop("", None)
+    docs = list(stats.values())
+    for i in range(0, len(docs), batch_size):
+        ops = [ReplaceOne({"id": d["id"]}, d, upsert=True) for d in docs[i:i + batch_size]]
+        await db.seller_stats.bulk_write(ops, ordered=False)
+    await db.seller_stats.delete_many({"id": {"$nin": list(stats)}})
+
+    logger.info(f"Rebuilt seller_stats for {len(docs)} sellers")
+    return len(docs)
+
+# ================= REALTIME HUB (WEBSOCKET) ==================
+class WSSubscriber:
+    """One socket with its own bounded send queue.
+
+    A slow client never blocks publishers: when its queue is full the oldest
+    pending message is dropped to make room.
+    """
+
+    def __init__(self, ws: WebSocket, max_queue: int):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self.seller_ids: Set[str] = set()
+        self.dropped = 0
+
+    def offer(self, message: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def pump(self, hub: "WebSocketHub"):
+        while True:
+            message = await self.queue.get()
+            try:
+                await self.ws.send_text(message)
+            except Exception as e:
+                # A dead socket must not stay subscribed with a filling queue
+                logger.info(f"WS send failed, dropping subscriber: {e}")
+                hub.disconnect(self)
+                try:
+                    await self.ws.close()
+                except Exception:
+                    pass
+                return
+
+class WebSocketHub:
+    """seller_id -> subscribers index for targeted event fan-out"""
+
+    def __init__(self, max_queue: int):
+        self._max_queue = max_queue
+        self._by_seller: Dict[str, Set[WSSubscriber]] = {}
+        self._subscribers: Set[WSSubscriber] = set()
+        self.published = 0
+        self.delivered = 0
+
+    def connect(self, ws: WebSocket) -> WSSubscriber:
+        sub = WSSubscriber(ws, self._max_queue)
+        self._subscribers.add(sub)
+        return sub
+
+    def subscribe(self, sub: WSSubscriber, seller_id: str):
+        sub.seller_ids.add(seller_id)
+        self._by_seller.setdefault(seller_id, set()).add(sub)
+
+    def unsubscribe(self, sub: WSSubscriber, seller_id: str):
+        sub.seller_ids.discard(seller_id)
+        subs = self._by_seller.get(seller_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._by_seller[seller_id]
+
+    def disconnect(self, sub: WSSubscriber):
+        for seller_id in list(sub.seller_ids):
+            self.unsubscribe(sub, seller_id)
+        self._subscribers.discard(sub)
+
+    def publish(self, seller_id: str, event: dict):
+        """Queue an event for every socket subscribed to seller_id"""
+        self.published += 1
+        subs = self._by_seller.get(seller_id)
+        if not subs:
+            return
+        message = json.dumps(event, default=str)
+        for sub in subs:
+            sub.offer(message)
+        self.delivered += len(subs)
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._subscribers),
+            "sellers": len(self._by_seller),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": sum(sub.dropped for sub in self._subscribers),
+        }
+
+ws_hub = WebSocketHub(WS_SEND_QUEUE_SIZE)
+
+def order_events(order: dict) -> Dict[str, dict]:
+    """One new_order event per seller, carrying only that seller's lines"""
+    per_seller: Dict[str, dict] = {}
+    for it in order.get("items", []):
+        ev = per_seller.setdefault(it["seller_id"], {
+            "type": "new_order",
+            "order_id": order["id"],
+            "sellers": [it["seller_id"]],
+            "revenue": 0,
+            "items_count": 0,
+        })
+        ev["revenue"] += it["total"]
+        ev["items_count"] += it["quantity"]
+    return per_seller
+
+def purchase_events(purchase: dict) -> Dict[str, dict]:
+    seller_id = purchase.get("wholesaler_id")
+    if not seller_id:
+        return {}
+    return {seller_id: {
+        "type": "new_purchase",
+        "order_id": purchase["id"],
+        "sellers": [seller_id],
+        "revenue": purchase.get("total_amount", 0),
+        "items_count": purchase.get("quantity", 0),
+    }}
+
+EVENT_SOURCES = {"orders": order_events, "purchases": purchase_events}
+
+class EventCoalescer:
+    """Merges per-seller events over a short window before fan-out.
+
+    A burst of 100 orders for one retailer becomes one event with
+    orders_count=100 and summed revenue, instead of 100 dashboard refreshes.
+    """
+
+    MAX_IDS = 50
+
+    def __init__(self, hub: WebSocketHub, window_ms: int):
+        self._hub = hub
+        self._window = window_ms / 1000
+        self._pending: Dict[Tuple[str, str], dict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def add(self, seller_id: str, event: dict):
+        key = (seller_id, event["type"])
+        merged = self._pending.get(key)
+        if merged is None:
+            merged = self._pending[key] = {**event, "orders_count": 0, "order_ids": []}
+        else:
+            merged["revenue"] += event["revenue"]
+            merged["items_count"] += event["items_count"]
+            merged["order_id"] = event["order_id"]
+        merged["orders_count"] += 1
+        merged["order_ids"] = (merged["order_ids"] + [event["order_id"]])[-self.MAX_IDS:]
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self._window)
+        self.flush()
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        self._flush_task = None
+        for (seller_id, _), event in pending.items():
+            self._hub.publish(seller_id, event)
+
+ws_coalescer = EventCoalescer(ws_hub, EVENT_COALESCE_MS)
+
+def dispatch_document(collection: str, doc: dict):
+    """Event bus sink: route an inserted document to the WS/SSE streams or search indexes"""
+    if collection == "seller_events":
+        seller_streams.push(doc)
+        return
+    if collection == "catalog_events":
+        apply_catalog_event(doc)
+        return
+    for seller_id, event in EVENT_SOURCES[collection](doc).items():
+        ws_coalescer.add(seller_id, event)
+
+class LocalBroker:
+    """In-memory stand-in for a shared pub/sub channel.
+
+    Every bus attached to the same broker sees every document, which lets
+    tests run several "workers" in one process.
+    """
+
+    def __init__(self):
+        self.sinks = []
+
+    def send(self, collection: str, doc: dict):
+        for sink in list(self.sinks):
+            sink(collection, doc)
+
+class InProcessEventBus:
+    """Single-worker mode: documents are delivered straight to local sinks"""
+
+    def __init__(self, broker: Optional[LocalBroker] = None):
+        self._broker = broker or LocalBroker()
+        self._sink = None
+
+    async def start(self, sink):
+        self._sink = sink
+        self._broker.sinks.append(sink)
+
+    async def publish(self, collection: str, doc: dict):
+        self._broker.send(collection, doc)
+
+    async def stop(self):
+        if self._sink in self._broker.sinks:
+            self._broker.sinks.remove(self._sink)
+
+class ChangeStreamEventBus:
+    """Multi-worker mode: every worker tails inserts on orders/purchases.
+
+    The insert is the event, so publish() is a no-op. When change streams
+    are unavailable (standalone mongod) it falls back to local delivery.
+    """
+
+    def __init__(self, collections: List[str]):
+        self._collections = collections
+        self._sink = None
+        self._task: Optional[asyncio.Task] = None
+        self._resume_token = None
+        self._fallback = False
+
+    async def start(self, sink):
+        self._sink = sink
+        self._task = asyncio.create_task(self._watch())
+
+    async def publish(self, collection: str, doc: dict):
+        if self._fallback:
+            self._sink(collection, doc)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _watch(self):
+        pipeline = [{"$match": {"operationType": "insert", "ns.coll": {"$in": self._collections}}}]
+        backoff = 1
+        while True:
+            try:
+                async with db.watch(pipeline, resume_after=self._resume_token) as stream:
+                    backoff = 1
+                    async for change in stream:
+                        self._resume_token = stream.resume_token
+                        self._sink(change["ns"]["coll"], change["fullDocument"])
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == 40573:  # change streams need a replica set
+                    logger.warning("Change streams unavailable, realtime events stay on this worker")
+                    self._fallback = True
+                    return
+                logger.error(f"❌ Change stream failed: {e}")
+            except PyMongoError as e:
+                logger.error(f"❌ Change stream failed: {e}")
+            except Exception:
+                logger.exception("Realtime event dispatch failed")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+event_bus = (
+    InProcessEventBus() if EVENT_BUS_BACKEND == "inprocess"
+    else ChangeStreamEventBus(list(EVENT_SOURCES) + ["seller_events", "catalog_events"])
+)
+
+@app.on_event("startup")
+async def start_event_bus():
+    await event_bus.start(dispatch_document)
+
+@app.on_event("shutdown")
+async def stop_event_bus():
+    await event_bus.stop()
+
+@app.websocket("/ws")
+async def websocket_endpoint(ws: WebSocket):
+    await ws.accept()
+    sub = ws_hub.connect(ws)
+    sender = asyncio.create_task(sub.pump(ws_hub))
+    try:
+        while True:
+            msg = await ws.receive_json()
+            if not isinstance(msg, dict) or not msg.get("user_id"):
+                continue
+            if msg.get("type") == "subscribe":
+                ws_hub.subscribe(sub, str(msg["user_id"]))
+                sub.offer(json.dumps({"type": "subscribed", "user_id": msg["user_id"]}))
+            elif msg.get("type") == "unsubscribe":
+                ws_hub.unsubscribe(sub, str(msg["user_id"]))
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        ws_hub.disconnect(sub)
+        sender.cancel()
+
+# ================= SELLER DELTA STREAM (SSE) ==================
+# Order and stock paths insert one delta document per affected seller into
+# the capped seller_events collection. The event bus carries those inserts to
+# every worker, and the capped collection doubles as the Last-Event-ID replay
+# buffer, so it survives restarts and is shared by all workers.
+#
+# Each seller's events carry a seq from a per-seller counter in db.counters,
+# which is the SSE event id. A reconnect replays seq > Last-Event-ID from the
+# (seller_id, seq) index. Two workers can take seqs 5 and 6 and insert them
+# in the other order, so streams put events back in seq order (SeqOrder).
+def seller_seq_key(seller_id: str) -> str:
+    return f"seller_events:{seller_id}"
+
+async def next_seller_seq(seller_id: str) -> int:
+    doc = await db.counters.find_one_and_update(
+        {"_id": seller_seq_key(seller_id)},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["seq"]
+
+async def current_seller_seq(seller_id: str) -> int:
+    doc = await db.counters.find_one({"_id": seller_seq_key(seller_id)})
+    return (doc or {}).get("seq", 0)
+
+async def emit_seller_deltas(deltas: Dict[str, dict], product_ids: List[str]):
+    """Attach low-stock product ids and publish one delta per seller"""
+    low = await db.products.find(
+        {"id": {"$in": product_ids}, "stock": {"$lte": LOW_STOCK_THRESHOLD}},
+        {"_id": 0, "id": 1, "seller_id": 1},
+    ).to_list(None)
+    for p in low:
+        delta = deltas.setdefault(p["seller_id"], {"revenue_added": 0, "orders_added": 0})
+        delta.setdefault("low_stock_product_ids", []).append(p["id"])
+    if not deltas:
+        return
+
+    now = datetime.now(timezone.utc).isoformat()
+    seqs = await asyncio.gather(*[next_seller_seq(sid) for sid in deltas])
+    docs = [
+        {"seller_id": sid, "seq": seq, "low_stock_product_ids": [], **delta, "created_at": now}
+        for (sid, delta), seq in zip(deltas.items(), seqs)
+    ]
+    await db.seller_events.insert_many(docs)
+    for doc in docs:
+        await event_bus.publish("seller_events", doc)
+
+async def emit_order_deltas(order: dict):
+    deltas: Dict[str, dict] = {}
+    for seller_id, event in order_events(order).items():
+        deltas[seller_id] = {"revenue_added": event["revenue"], "orders_added": 1}
+    await emit_seller_deltas(deltas, list({it["product_id"] for it in order["items"]}))
+
+async def emit_purchase_deltas(purchase: dict, seller_id: str):
+    deltas = {seller_id: {"revenue_added": purchase["total_amount"], "orders_added": 1}}
+    await emit_seller_deltas(deltas, [purchase["product_id"]])
+
+class SSEListener:
+    def __init__(self, max_queue: int):
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self.overflowed = False
+
+    def offer(self, doc: dict):
+        # Deltas are additive, so never drop one silently: stop feeding the
+        # listener and let the client reconnect and replay instead.
+        if self.overflowed or self.queue.full():
+            self.overflowed = True
+            return
+        self.queue.put_nowait(doc)
+
+class SellerStreams:
+    """seller_id -> live SSE listeners"""
+
+    def __init__(self, max_queue: int):
+        self._max_queue = max_queue
+        self._listeners: Dict[str, Set[SSEListener]] = {}
+
+    def listen(self, seller_id: str) -> SSEListener:
+        listener = SSEListener(self._max_queue)
+        self._listeners.setdefault(seller_id, set()).add(listener)
+        return listener
+
+    def unlisten(self, seller_id: str, listener: SSEListener):
+        listeners = self._listeners.get(seller_id)
+        if listeners is not None:
+            listeners.discard(listener)
+            if not listeners:
+                del self._listeners[seller_id]
+
+    def push(self, doc: dict):
+        for listener in self._listeners.get(doc["seller_id"], ()):
+            listener.offer(doc)
+
+    def stats(self) -> dict:
+        return {
+            "sellers": len(self._listeners),
+            "listeners": sum(len(v) for v in self._listeners.values()),
+        }
+
+seller_streams = SellerStreams(WS_SEND_QUEUE_SIZE)
+
+async def replay_seller_events(seller_id: str, last: int) -> Optional[List[dict]]:
+    """Events after seq `last`, or None when the gap can't be replayed.
+
+    None means more than SSE_MAX_REPLAY events, or that the capped
+    collection has already overwritten some of them.
+    """
+    docs = await db.seller_events.find(
+        {"seller_id": seller_id, "seq": {"$gt": last}}
+    ).sort("seq", 1).limit(SSE_MAX_REPLAY + 1).to_list(SSE_MAX_REPLAY + 1)
+    if len(docs) > SSE_MAX_REPLAY:
+        return None
+    if docs:
+        first = docs[0]["seq"]
+    else:
+        current = await current_seller_seq(seller_id)
+        if last > current:
+            return None  # an id handed out before the counter was reset
+        first = current + 1
+    if first > last + 1 and not await db.seller_events.count_documents(
+        {"seller_id": seller_id, "seq": {"$lte": last}}, limit=1
+    ):
+        # nothing at or before `last` is left, so the events in between may be gone
+        return None
+    return docs
+
+class SeqOrder:
+    """Releases one seller's events in seq order, each once.
+
+    An event arriving ahead of a missing seq is held until the missing one
+    shows up or the stream gives up on it (skip_gap), e.g. because the
+    worker that took that seq died before inserting it.
+    """
+
+    def __init__(self, last: int):
+        self.last = last
+        self._held: Dict[int, dict] = {}
+
+    @property
+    def waiting(self) -> bool:
+        return bool(self._held)
+
+    def accept(self, doc: dict) -> List[dict]:
+        if doc["seq"] > self.last:
+            self._held[doc["seq"]] = doc
+        ready = []
+        while self.last + 1 in self._held:
+            self.last += 1
+            ready.append(self._held.pop(self.last))
+        return ready
+
+    def skip_gap(self) -> List[dict]:
+        ready = [self._held[seq] for seq in sorted(self._held)]
+        self._held.clear()
+        if ready:
+            self.last = ready[-1]["seq"]
+        return ready
+
+def sse_frame(doc: dict) -> str:
+    data = {
+        "revenue_added": doc.get("revenue_added", 0),
+        "orders_added": doc.get("orders_added", 0),
+        "low_stock_product_ids": doc.get("low_stock_product_ids", []),
+        "created_at": doc.get("created_at"),
+    }
+    return f"id: {doc['seq']}\nevent: delta\ndata: {json.dumps(data)}\n\n"
+
+def parse_event_id(last_event_id: Optional[str]) -> Optional[int]:
+    try:
+        return int(last_event_id)
+    except (TypeError, ValueError):
+        return None
+
+@api.get("/stream/seller/{seller_id}")
+async def stream_seller(
+    seller_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """Dashboard deltas as Server-Sent Events, resumable via Last-Event-ID"""
+    listener = seller_streams.listen(seller_id)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            order = None
+            if last_event_id:
+                last = parse_event_id(last_event_id)
+                backlog = await replay_seller_events(seller_id, last) if last is not None else None
+                if backlog is None:
+                    # Too far behind: the client should refetch the dashboard once
+                    yield "event: reset\ndata: {}\n\n"
+                else:
+                    order = SeqOrder(last)
+                    # what Mongo doesn't have now is a seq that was never inserted
+                    for doc in [ready for d in backlog for ready in order.accept(d)] + order.skip_gap():
+                        yield sse_frame(doc)
+            if order is None:
+                order = SeqOrder(await current_seller_seq(seller_id))
+
+            # events inserted while the replay ran arrive here too; SeqOrder drops them
+            while not (listener.overflowed and listener.queue.empty()):
+                try:
+                    doc = await asyncio.wait_for(
+                        listener.queue.get(), timeout=SSE_GAP_WAIT_SECONDS if order.waiting else 15,
+                    )
+                except asyncio.TimeoutError:
+                    if order.waiting:
+                        # the missing seqs may be in Mongo without having reached us
+                        fill = await replay_seller_events(seller_id, order.last) or []
+                        for doc in [ready for d in fill for ready in order.accept(d)] + order.skip_gap():
+                            yield sse_frame(doc)
+                        continue
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                for ready in order.accept(doc):
+                    yield sse_frame(ready)
+        finally:
+            seller_streams.unlisten(seller_id, listener)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ================= ORDER SIDE EFFECTS ==================
+async def after_order_saved(order: dict):
+    """Clear the cart and publish a saved order's stats and events.
+
+    Best-effort: the order already stands, so a failure here is logged and
+    the caller still reports success. Failing the request instead would
+    leave the cart in place for a retry that duplicates the order. Missed
+    seller_stats increments are recovered by `python server.py
+    rebuild-seller-stats`.
+    """
+    steps = [
+        ("cart clear", lambda: db.cart.delete_one({"user_id": order["user_id"]})),
+        ("seller stats", lambda: record_order_stats(order["items"])),
+        ("order event", lambda: event_bus.publish("orders", order)),
+        ("seller deltas", lambda: emit_order_deltas(order)),
+    ]
+    for name, step in steps:
+        try:
+            await step()
+        except Exception:
+            logger.exception(f"Order {order['id']} saved, but {name} failed")
+
 # ================= RAZORPAY PAYMENT ==================
 class RazorpayOrderRequest(BaseModel):
     amount: float
@@ -936,18 +3369,14 @@ class RazorpayVerifyRequest(BaseModel):
 async def create_razorpay_order(payload: RazorpayOrderRequest):
     """Create a Razorpay order for payment"""
     try:
-        if not razorpay_client:
+        if not payment_gateway:
             raise HTTPException(500, "Razorpay not configured")
         
         # Convert amount to paise (smallest currency unit)
         amount_in_paise = int(payload.amount * 100)
         
         # Create Razorpay order
-        razorpay_order = razorpay_client.order.create({
-            "amount": amount_in_paise,
-            "currency": payload.currency,
-            "payment_capture": 1  # Auto capture payment
-        })
+        razorpay_order = await payment_gateway.create_order(amount_in_paise, payload.currency)
         
         logger.info(f"✅ Razorpay order created: {razorpay_order['id']}")
         
@@ -957,6 +3386,11 @@ async def create_razorpay_order(payload: RazorpayOrderRequest):
             "currency": payload.currency,
             "key_id": RAZORPAY_KEY_ID
         }
+    except HTTPException:
+        raise
+    except httpx.TimeoutException:
+        logger.error("❌ Razorpay order creation timed out")
+        raise HTTPException(504, "Payment gateway timed out")
     except Exception as e:
         logger.error(f"❌ Razorpay order creation failed: {e}")
         raise HTTPException(500, f"Payment order creation failed: {str(e)}")
@@ -965,7 +3399,7 @@ async def create_razorpay_order(payload: RazorpayOrderRequest):
 async def verify_razorpay_payment(payload: RazorpayVerifyRequest):
     """Verify Razorpay payment signature and create order"""
     try:
-        if not razorpay_client:
+        if not payment_gateway:
             raise HTTPException(500, "Razorpay not configured")
         
         # Verify signature
@@ -986,31 +3420,7 @@ async def verify_razorpay_payment(payload: RazorpayVerifyRequest):
             raise HTTPException(404, f"User not found: {payload.user_id}")
         
         # Check stock and build order items
-        order_items = []
-        total = 0.0
-        
-        for it in payload.items:
-            pid = it["product_id"]
-            qty = safe_int(it["quantity"])
-            product = await db.products.find_one({"id": pid})
-            
-            if not product:
-                raise HTTPException(404, f"Product not found: {pid}")
-            
-            if product["stock"] < qty:
-                raise HTTPException(400, f"Insufficient stock for {product['name']}")
-            
-            subtotal = product["price"] * qty
-            total += subtotal
-            
-            order_items.append({
-                "product_id": pid,
-                "product_name": product["name"],
-                "quantity": qty,
-                "price": product["price"],
-                "total": subtotal,
-                "seller_id": product["seller_id"]
-            })
+        order_items, total = await build_order_items(payload.items)
         
         # Create order
         order = {
@@ -1027,18 +3437,9 @@ async def verify_razorpay_payment(payload: RazorpayVerifyRequest):
             "created_at": datetime.now(timezone.utc).isoformat(),
         }
         
-        # Save order
-        await db.orders.insert_one(order)
-        
-        # Reduce stock
-        for it in payload.items:
-            await db.products.update_one(
-                {"id": it["product_id"]}, 
-                {"$inc": {"stock": -safe_int(it["quantity"])}}
-            )
-        
-        # Clear cart
-        await db.cart.delete_one({"user_id": payload.user_id})
+        # Reserve stock, then save order
+        await save_reserved_order(order)
+        await after_order_saved(order)
         
         order.pop('_id', None)
         logger.info(f"✅ Order created after payment: {order['id']}")
@@ -1073,38 +3474,8 @@ async def place_order(uid: str, payload: dict = Body(...)):
         if not user:
             raise HTTPException(404, f"User not found: {uid}")
 
-        order_items = []
-        total = 0.0
-
-        # CHECK STOCK FIRST
-        for it in payload["items"]:
-            pid = it["product_id"]
-            qty = safe_int(it["quantity"])
-            product = await db.products.find_one({"id": pid})
-
-            if not product:
-                raise HTTPException(404, f"Product not found: {pid}")
-
-            if product["stock"] < qty:
-                raise HTTPException(400, f"Insufficient stock for {product['name']}")
-
-        # BUILD ORDER ITEMS
-        for it in payload["items"]:
-            pid = it["product_id"]
-            qty = safe_int(it["quantity"])
-            product = await db.products.find_one({"id": pid})
-
-            subtotal = product["price"] * qty
-            total += subtotal
-
-            order_items.append({
-                "product_id": pid,
-                "product_name": product["name"],
-                "quantity": qty,
-                "price": product["price"],
-                "total": subtotal,
-                "seller_id": product["seller_id"]
-            })
+        # CHECK STOCK AND BUILD ORDER ITEMS (one products query per basket)
+        order_items, total = await build_order_items(payload["items"])
 
         order = {
             "id": str(uuid.uuid4()),
@@ -1118,15 +3489,9 @@ async def place_order(uid: str, payload: dict = Body(...)):
             "created_at": datetime.now(timezone.utc).isoformat(),
         }
 
-        # SAVE ORDER
-        await db.orders.insert_one(order)
-
-        # REDUCE STOCK AFTER SAVING ORDER
-        for it in payload["items"]:
-            await db.products.update_one({"id": it["product_id"]}, {"$inc": {"stock": -safe_int(it["quantity"])}})
-
-        # CLEAR CART
-        await db.cart.delete_one({"user_id": uid})
+        # RESERVE STOCK, THEN SAVE ORDER (cart, stats and events follow best-effort)
+        await save_reserved_order(order)
+        await after_order_saved(order)
 
         # Remove MongoDB _id before returning
         order.pop('_id', None)
@@ -1139,9 +3504,14 @@ async def place_order(uid: str, payload: dict = Body(...)):
         raise HTTPException(500, f"Internal server error: {str(e)}")
 
 @api.get("/orders/{uid}")
-async def get_orders(uid: str):
-    items = await db.orders.find({"user_id": uid}, {"_id": 0}).to_list(1000)
-    return items
+async def get_orders(uid: str, cursor: Optional[str] = None, page_size: Optional[int] = None, stream: bool = False):
+    if paginated(cursor, page_size):
+        # Newest first
+        return fast_json(await fetch_page(db.orders, {"user_id": uid}, [("created_at", -1), ("id", -1)], cursor, page_size))
+    docs = db.orders.find({"user_id": uid}, {"_id": 0}).limit(LIST_LIMIT_MAX)
+    if stream:
+        return StreamingJSONArray(docs)
+    return fast_json(await docs.to_list(LIST_LIMIT_MAX))
 
 @api.get("/orders/detail/{oid}")
 async def get_order_detail(oid: str):
@@ -1156,30 +3526,12 @@ async def retailer_dashboard(user_id: Optional[str] = None):
     if not user_id:
         return {"products_count": 0, "orders_count": 0, "total_revenue": 0}
 
-    # Count retailer's products
-    products_count = await db.products.count_documents({"seller_id": user_id})
-
-    # Get orders where retailer sold products (as seller)
-    orders_as_seller = await db.orders.find({"items.seller_id": user_id}).to_list(2000)
-    
-    # Get purchases where retailer bought from wholesalers
-    purchases_from_wholesalers = await db.purchases.find({"retailer_id": user_id}).to_list(2000)
-
-    orders_count = 0
-    revenue = 0
-
-    # Calculate revenue from sales (as seller)
-    for order in orders_as_seller:
-        included = False
-        for item in order["items"]:
-            if item["seller_id"] == user_id:
-                included = True
-                revenue += item["total"]
-        if included:
-            orders_count += 1
+    stats = await get_seller_stats(user_id)
+    products_count = stats["products_count"]
+    revenue = stats["sales_revenue"]
 
-    # Add purchase count (buying from wholesalers)
-    orders_count += len(purchases_from_wholesalers)
+    # Sales as seller plus purchases made from wholesalers
+    orders_count = stats["sales_orders"] + stats["purchases_count"]
 
     print(f"🎯 Retailer Dashboard - User: {user_id}")
     print(f"🎯 Products: {products_count}, Orders: {orders_count}, Revenue: {revenue}")
@@ -1192,54 +3544,269 @@ async def retailer_dashboard(user_id: Optional[str] = None):
 
 @api.get("/dashboard/wholesaler")
 async def wholesaler_dashboard(user_id: str = Query(..., description="User ID")):
-    """SIMPLE WORKING VERSION - No complex logic"""
     try:
-        print(f"🎯 SIMPLE DASHBOARD for: {user_id}")
-        
-        # 1. Count products
-        products_count = await db.products.count_documents({"seller_id": user_id})
-        
-        # 2. SIMPLE: Get ALL purchases and filter manually
-        all_purchases = await db.purchases.find({}).to_list(1000)
+        stats = await get_seller_stats(user_id)
         
-        # Case-insensitive filter
-        matching_purchases = []
-        for purchase in all_purchases:
-            purchase_wholesaler = purchase.get("wholesaler_id", "")
-            if purchase_wholesaler.lower() == user_id.lower():
-                matching_purchases.append(purchase)
-        
-        orders_count = len(matching_purchases)
-        total_revenue = sum(p.get("total_amount", 0) for p in matching_purchases)
-        
-        print(f"💰 SIMPLE CALCULATION: {orders_count} orders, ₹{total_revenue} revenue")
-        
-        # 3. Return simple result
         result = {
-            "products_count": products_count,
-            "orders_count": orders_count,
-            "total_revenue": total_revenue
+            "products_count": stats["products_count"],
+            "orders_count": stats["wholesale_orders"],
+            "total_revenue": stats["wholesale_revenue"]
         }
         
-        print(f"✅ FINAL: {result}")
+        print(f"✅ Wholesaler Dashboard - User: {user_id}: {result}")
         return result
         
     except Exception as e:
-        print(f"❌ SIMPLE DASHBOARD ERROR: {str(e)}")
+        print(f"❌ WHOLESALER DASHBOARD ERROR: {str(e)}")
         return {
             "products_count": 0,
             "orders_count": 0,
             "total_revenue": 0
         }
 
+# ================= PURCHASES (RETAILER <- WHOLESALER) =====
+@api.post("/purchase/from-wholesaler")
+async def purchase_from_wholesaler(payload: dict = Body(...)):
+    """Retailer buys stock from a wholesaler and lists it at a markup"""
+    for field in ("wholesaler_id", "product_id", "retailer_id"):
+        if not payload.get(field):
+            raise HTTPException(400, f"{field} is required")
+
+    qty = safe_int(payload.get("quantity", 1))
+    if qty < 1:
+        raise HTTPException(400, "Quantity must be at least 1")
+    markup = safe_float(payload.get("markup_percent", 0))
+
+    product = await db.products.find_one({"id": payload["product_id"]}, PRODUCT_PROJECTION)
+    if not product:
+        raise HTTPException(404, f"Product not found: {payload['product_id']}")
+    if seller_key(product.get("seller_id")) != seller_key(payload["wholesaler_id"]):
+        raise HTTPException(400, "Product does not belong to this wholesaler")
+
+    # Take the wholesaler's stock only if enough is left
+    res = await db.products.update_one(
+        {"id": product["id"], "stock": {"$gte": qty}},
+        {"$inc": {"stock": -qty}}
+    )
+    if res.modified_count == 0:
+        raise HTTPException(400, f"Insufficient stock for {product['name']}")
+
+    # The product's owner is the one wholesaler id every consumer keys on:
+    # seller_stats (live and rebuilt), the /ws event and the SSE delta.
+    wholesaler_id = product["seller_id"]
+    unit_price = safe_float(product.get("price", 0))
+    purchase = {
+        "id": str(uuid.uuid4()),
+        "retailer_id": payload["retailer_id"],
+        "wholesaler_id": wholesaler_id,
+        "wholesaler_key": seller_key(wholesaler_id),
+        "product_id": product["id"],
+        "product_name": product["name"],
+        "quantity": qty,
+        "price": unit_price,
+        "total_amount": unit_price * qty,
+        "markup_percent": markup,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        await db.purchases.insert_one(purchase)
+    except Exception:
+        # Give the stock back, or a failed insert would lose it
+        await db.products.update_one({"id": product["id"]}, {"$inc": {"stock": qty}})
+        await invalidate_products([product["id"]], listing_changed=False)
+        raise
+
+    # Add the stock to the retailer's own listing
+    retail_id = f"{payload['retailer_id']}_{product['id']}"
+    before = await db.products.find_one_and_update(
+        {"id": retail_id},
+        {
+            "$inc": {"stock": qty},
+            "$set": {
+                "name": product["name"],
+                "category_id": product.get("category_id"),
+                "description": product.get("description", ""),
+                "image_url": product.get("image_url", ""),
+                "price": round(unit_price * (1 + markup / 100), 2),
+                "seller_id": payload["retailer_id"],
+                "source_product_id": product["id"],
+            },
+            "$setOnInsert": {"rating": 0.0},
+        },
+        projection={"_id": 0, "stock": 1, "rating": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+    await publish_catalog_change("product", {
+        "id": retail_id,
+        "name": product["name"],
+        "stock": (before or {}).get("stock", 0) + qty,
+        "rating": (before or {}).get("rating", 0.0),
+    })
+
+    await invalidate_products([product["id"], retail_id])
+
+    await bump_seller_stats({
+        wholesaler_id: {
+            "wholesale_orders": 1,
+            "wholesale_revenue": purchase["total_amount"],
+            f"units_sold.{product['id']}": qty,
+        },
+        payload["retailer_id"]: {
+            "purchases_count": 1,
+            "products_count": 1 if before is None else 0,
+        },
+    })
+
+    await event_bus.publish("purchases", purchase)
+    await emit_purchase_deltas(purchase, wholesaler_id)
+
+    purchase.pop("_id", None)
+    return {"message": "Purchase successful", "purchase": purchase, "retail_product_id": retail_id}
+
+# ================= MIGRATIONS =======================
+async def migrate_purchase_wholesaler_key():
+    """Backfill the lowercase wholesaler_key used by the wholesaler dashboard"""
+    res = await db.purchases.update_many(
+        {"wholesaler_key": {"$exists": False}},
+        [{"$set": {"wholesaler_key": {"$toLower": {"$ifNull": ["$wholesaler_id", ""]}}}}],
+    )
+    return res.modified_count
+
+async def migrate_product_types(batch_size: int = 1000) -> int:
+    """Coerce price/rating to double and stock to a non-negative int.
+
+    Mirrors what safe_float/safe_int did on every read: unparseable or
+    missing values become 0. Runs batch_size products per update_many.
+    """
+    untyped = {"$or": [
+        {"price": {"$not": {"$type": "double"}}},
+        {"rating": {"$not": {"$type": "double"}}},
+        {"stock": {"$not": {"$type": ["int", "long"]}}},
+        {"stock": {"$lt": 0}},
+    ]}
+
+    def to_double(field):
+        return {"$convert": {"input": f"${field}", "to": "double", "onError": 0.0, "onNull": 0.0}}
+
+    coerce = [{"$set": {
+        "price": to_double("price"),
+        "rating": to_double("rating"),
+        "stock": {"$max": [0, {"$toInt": to_double("stock")}]},
+    }}]
+
+    changed = 0
+    while True:
+        batch = await db.products.find(untyped, {"_id": 1}).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return changed
+        res = await db.products.update_many({"_id": {"$in": [d["_id"] for d in batch]}}, coerce)
+        if res.modified_count == 0:
+            return changed
+        changed += res.modified_count
+
+MIGRATIONS = [
+    ("purchases_wholesaler_key", migrate_purchase_wholesaler_key),
+    ("seller_stats_initial_build", rebuild_seller_stats),
+    ("products_typed_fields", migrate_product_types),
+]
+
+async def claim_migration(name: str) -> bool:
+    """Atomically record that this worker runs `name`; False if another did"""
+    try:
+        before = await db.migrations.find_one_and_update(
+            {"id": name},
+            {"$setOnInsert": {"state": "running", "claimed_at": datetime.now(timezone.utc).isoformat()}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+    except DuplicateKeyError:
+        return False  # a concurrent upsert from another worker won
+    if before is not None and before.get("state") == "running":
+        logger.info(f"Migration {name} is running elsewhere (delete its db.migrations record if that worker died)")
+    return before is None
+
+async def run_migrations():
+    """Apply each migration once, whichever worker claims it first.
+
+    A migration that fails drops its claim, so the next start retries it,
+    and stops the ones after it.
+    """
+    # claims rely on the unique id index; on a fresh database the background
+    # index build may not have reached it yet
+    await db.migrations.create_indexes(INDEX_CATALOGUE["migrations"])
+    for name, migrate in MIGRATIONS:
+        if not await claim_migration(name):
+            continue
+        try:
+            changed = await migrate()
+        except Exception:
+            await db.migrations.delete_one({"id": name, "state": "running"})
+            raise
+        await db.migrations.update_one({"id": name}, {"$set": {
+            "state": "applied",
+            "changed": changed,
+            "applied_at": datetime.now(timezone.utc).isoformat(),
+        }})
+        logger.info(f"Migration {name} applied ({changed} documents)")
+
+migration_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_migrations():
+    """Run pending migrations without holding up startup"""
+    global migration_task
+
+    async def run():
+        try:
+            await run_migrations()
+        except Exception:
+            logger.exception("Migrations failed (non-fatal)")
+
+    migration_task = asyncio.create_task(run())
+
 # ================= SHOPS ============================
 @api.get("/shops")
-async def get_shops():
-    return await db.shops.find({}, {"_id": 0}).to_list(1000)
+async def get_shops(request: Request, response: Response, cursor: Optional[str] = None, page_size: Optional[int] = None):
+    # shops has no write path in this API to bump a version, so tag the body
+    if paginated(cursor, page_size):
+        body = await fetch_page(db.shops, {}, [("id", 1)], cursor, page_size)
+    else:
+        body = await db.shops.find({}, {"_id": 0}).to_list(LIST_LIMIT_MAX)
+    return not_modified(request, response, body_etag(body)) or body
 
 # ----------------- REGISTER ROUTES -------------------
 app.include_router(api)
 
+# ----------------- MAINTENANCE CLI -------------------
+# python server.py rebuild-seller-stats [batch_size]
+# python server.py indexes [--dry-run]
+# python server.py check-query-plans      (exit status 1 on any COLLSCAN)
+# python server.py sweep-reservations [older_than_seconds]
+# python server.py migrate                (pending migrations, in the foreground)
+CLI_COMMANDS = {
+    "rebuild-seller-stats": lambda args: rebuild_seller_stats(*map(int, args)),
+    "indexes": lambda args: ensure_indexes(dry_run="--dry-run" in args),
+    "check-query-plans": lambda args: check_query_plans(),
+    "sweep-reservations": lambda args: sweep_reservations(*map(float, args)),
+    "migrate": lambda args: run_migrations(),
+}
+
+async def run_cli(command: str, args: List[str]):
+    await connect_db()
+    try:
+        result = await CLI_COMMANDS[command](args)
+        print(f"✅ {command}: {result}")
+        return result
+    finally:
+        client.close()
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    if sys.argv[1] not in CLI_COMMANDS:
+        sys.exit(f"Unknown command {sys.argv[1]!r}; expected one of {', '.join(CLI_COMMANDS)}")
+    result = asyncio.run(run_cli(sys.argv[1], sys.argv[2:]))
+    sys.exit(1 if result is False else 0)
+
 print("🔥 USING THIS EXACT SERVER FILE:", __file__)
 print("🔥 ROUTES LOADED:")
 for r in app.routes:
@@ -121,7 +121,8 @@ export const productsAPI = {
 // ⭐ CART API - FIXED VERSION
 // ======================================================
 export const cartAPI = {
-  getCart: (userId) => api.get(`/cart/${userId}`),
+  getCart: (userId, hydrate = false) =>
+    api.get(`/cart/${userId}`, { params: hydrate ? { hydrate: true } : undefined }),
 
   addItem: (userId, data) => api.post(`/cart/${userId}`, data),
 
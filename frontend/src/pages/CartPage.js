@@ -29,7 +29,7 @@ const CartPage = () => {
   const fetchCart = async () => {
     setLoading(true);
     try {
-      const response = await cartAPI.getCart(user.id);
+      const response = await cartAPI.getCart(user.id, true);
 
       const items = Array.isArray(response.data)
         ? response.data
@@ -54,7 +54,7 @@ const CheckoutPage = () => {
       }
 
       console.log("🛒 Fetching cart for user:", user.id);
-      const response = await cartAPI.getCart(user.id);
+      const response = await cartAPI.getCart(user.id, true);
 
       const rawItems = Array.isArray(response.data)
         ? response.data
@@ -70,6 +70,9 @@ const CheckoutPage = () => {
 
       const enriched = await Promise.all(
         rawItems.map(async (item) => {
+          if (item.product) {
+            return { ...item, quantity: Number(item.quantity) || 1 };
+          }
           try {
             const p = await productsAPI.getById(item.product_id);
             return { 
@@ -127,8 +127,8 @@ export default function RetailerBuyingPage() {
   // Test endpoint function - add this for debugging
   async function testEndpoint() {
     try {
-      console.log("🧪 Testing purchase endpoint...");
-      const testResp = await fetch("http://127.0.0.1:8000/api/purchase/test");
+      console.log("🧪 Testing backend connection...");
+      const testResp = await fetch("http://127.0.0.1:8000/api/health");
       const testData = await testResp.json();
       console.log("🧪 Endpoint test result:", testData);
       toast.success("Endpoint test successful!");
@@ -0,0 +1,101 @@
+"""Mongo round trips and latency per checkout, by basket size.
+
+    TEST_MONGO_URL=mongodb://localhost:27017 python tests/benchmarks/bench_checkout.py
+
+Seeds a throwaway database, then places orders through place_order with a
+pymongo CommandListener counting every command sent. The lookup phase is
+also timed against the old per-line find_one loop that build_order_items
+replaced. The database is dropped afterwards.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+import server  # noqa: E402
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event):
+        self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def per_line_lookup(items):
+    """The lookup build_order_items replaced: one find_one per basket line"""
+    return [await server.db.products.find_one({"id": it["product_id"]}, {"_id": 0}) for it in items]
+
+
+async def run(url: str, sizes, orders: int):
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(url, event_listeners=[counter])
+    name = f"bench_checkout_{uuid.uuid4().hex[:8]}"
+    server.db = client[name]
+    server.event_bus = server.InProcessEventBus()
+    try:
+        await server.ensure_indexes()
+        await server.db.users.insert_one({"id": "u1", "name": "bench"})
+        await server.db.products.insert_many([
+            {"id": f"p{i}", "name": f"Product {i}", "price": 10.0, "stock": 10**9, "seller_id": f"s{i % 5}"}
+            for i in range(max(sizes))
+        ])
+
+        print(f"{'basket':>7}{'cmds/order':>12}{'p50 ms':>9}{'lookup ms':>11}{'per-line ms':>13}  commands")
+        for size in sizes:
+            items = [{"product_id": f"p{i}", "quantity": 1} for i in range(size)]
+            payload = {"items": items, "delivery_address": "bench"}
+            counter.commands.clear()
+            latencies = []
+            for _ in range(orders):
+                started = time.perf_counter()
+                await server.place_order("u1", payload)
+                latencies.append(time.perf_counter() - started)
+            per_order = {k: v / orders for k, v in counter.commands.most_common()}
+
+            lookup, legacy = [], []
+            for _ in range(orders):
+                started = time.perf_counter()
+                await server.build_order_items(items)
+                lookup.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                await per_line_lookup(items)
+                legacy.append(time.perf_counter() - started)
+
+            detail = " ".join(f"{k}={v:g}" for k, v in per_order.items())
+            print(f"{size:>7}{sum(per_order.values()):>12.1f}{statistics.median(latencies) * 1000:>9.1f}"
+                  f"{statistics.median(lookup) * 1000:>11.2f}{statistics.median(legacy) * 1000:>13.2f}  {detail}")
+    finally:
+        await client.drop_database(name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,5,20,50")
+    parser.add_argument("--orders", type=int, default=20)
+    args = parser.parse_args()
+    url = os.getenv("TEST_MONGO_URL") or os.getenv("MONGO_URL")
+    if not url:
+        sys.exit("set TEST_MONGO_URL to a MongoDB the benchmark may create and drop a database on")
+    asyncio.run(run(url, [int(s) for s in args.sizes.split(",")], args.orders))
+
+
+if __name__ == "__main__":
+    main()
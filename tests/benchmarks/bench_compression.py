@@ -0,0 +1,70 @@
+"""Bandwidth and latency of response compression on catalog and order payloads.
+
+    python tests/benchmarks/bench_compression.py [--link-mbit 10]
+
+For each payload, compresses the orjson body with gzip at several levels and
+(when the brotli package is installed) brotli at several qualities, through
+the same new_compressor/compress_chunk the middleware uses. It reports size,
+ratio, CPU time and time-to-last-byte on a --link-mbit link (compress +
+transfer) next to sending it uncompressed. Payloads under COMPRESS_MIN_SIZE
+are shown but go out uncompressed in production.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import server  # noqa: E402
+from bench_json import orders, products  # noqa: E402
+
+
+def compress(encoding: str, level: int, body: bytes) -> bytes:
+    if encoding == "br":
+        server.BROTLI_QUALITY = level
+    else:
+        server.GZIP_LEVEL = level
+    compressor = server.new_compressor(encoding)
+    return server.compress_chunk(encoding, compressor, body, True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--link-mbit", type=float, default=10.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    bytes_per_ms = args.link_mbit * 1e6 / 8 / 1000
+
+    payloads = {
+        "product page (50)": products(50),
+        "/products (5000)": products(5000),
+        "/orders (1000)": orders(1000),
+        "product detail": products(1)[0],
+    }
+    settings = [("gzip", 1), ("gzip", server.GZIP_LEVEL), ("gzip", 9)]
+    if server.brotli:
+        settings += [("br", 1), ("br", server.BROTLI_QUALITY), ("br", 11)]
+    else:
+        print("brotli not installed; gzip only\n")
+
+    print(f"link {args.link_mbit:g} Mbit/s, COMPRESS_MIN_SIZE={server.COMPRESS_MIN_SIZE}\n")
+    print(f"{'payload':<20}{'setting':<10}{'bytes':>10}{'ratio':>7}{'cpu ms':>9}{'ttlb ms':>9}")
+    for name, doc in payloads.items():
+        body = server.fast_json(doc).body
+        print(f"{name:<20}{'none':<10}{len(body):>10}{1:>7.2f}{0:>9.2f}{len(body) / bytes_per_ms:>9.1f}")
+        for encoding, level in settings:
+            runs = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                out = compress(encoding, level, body)
+                runs.append(time.perf_counter() - started)
+            cpu = statistics.median(runs) * 1000
+            print(f"{'':<20}{f'{encoding}-{level}':<10}{len(out):>10}{len(body) / len(out):>7.2f}"
+                  f"{cpu:>9.2f}{cpu + len(out) / bytes_per_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
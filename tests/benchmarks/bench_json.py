@@ -0,0 +1,98 @@
+"""Response rendering: FastAPI's default path vs fast_json/StreamingJSONArray.
+
+    python tests/benchmarks/bench_json.py [--products 5000] [--orders 1000]
+
+The default path is what a plain `return docs` did before: jsonable_encoder
+walks the documents, then JSONResponse renders them with the stdlib json.
+fast_json hands the same documents straight to orjson. StreamingJSONArray
+is timed to its first chunk and to the end over an async source.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from server import StreamingJSONArray, fast_json  # noqa: E402
+
+
+def products(n: int):
+    return [{
+        "id": f"p{i}", "name": f"Product {i}", "category_id": f"c{i % 12}", "price": 10.0 + i % 500,
+        "stock": i % 40, "rating": 4.2, "seller_id": f"s{i % 50}", "description": "Fresh from the farm " * 3,
+        "image_url": f"https://cdn.example.com/p/{i}.jpg",
+    } for i in range(n)]
+
+
+def orders(n: int):
+    now = datetime.now(timezone.utc).isoformat()
+    return [{
+        "id": f"o{i}", "user_id": "u1", "total_amount": 250.0, "payment_status": "paid", "order_status": "placed",
+        "delivery_address": "12 Market Road", "payment_method": "online", "created_at": now,
+        "items": [{"product_id": f"p{j}", "product_name": f"Product {j}", "quantity": 2, "price": 25.0,
+                   "total": 50.0, "seller_id": f"s{j % 50}"} for j in range(5)],
+    } for i in range(n)]
+
+
+def cart(n: int):
+    lines = [{"product_id": p["id"], "quantity": 1, "product": p} for p in products(n)]
+    return {"user_id": "u1", "items": lines, "total": 10.0 * n}
+
+
+def timed(fn, repeat: int):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = fn()
+        runs.append(time.perf_counter() - started)
+    return statistics.median(runs) * 1000, out
+
+
+async def stream(docs):
+    async def source():
+        for doc in docs:
+            yield doc
+
+    started = time.perf_counter()
+    first, size = None, 0
+    async for chunk in StreamingJSONArray.encode(source(), 64 * 1024):
+        first = first or time.perf_counter() - started
+        size += len(chunk)
+    return first * 1000, (time.perf_counter() - started) * 1000, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--cart", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payloads = {
+        f"/products ({args.products})": products(args.products),
+        f"/orders ({args.orders})": orders(args.orders),
+        f"/cart hydrated ({args.cart})": cart(args.cart),
+    }
+    print(f"{'payload':<24}{'KiB':>8}{'default ms':>12}{'fast_json ms':>14}{'speedup':>9}"
+          f"{'stream 1st ms':>15}{'stream ms':>11}")
+    for name, body in payloads.items():
+        default_ms, rendered = timed(lambda: JSONResponse(jsonable_encoder(body)).body, args.repeat)
+        fast_ms, _ = timed(lambda: fast_json(body).body, args.repeat)
+        first, total = ("-", "-")
+        if isinstance(body, list):
+            first_ms, total_ms, _ = asyncio.run(stream(body))
+            first, total = f"{first_ms:.1f}", f"{total_ms:.1f}"
+        print(f"{name:<24}{len(rendered) / 1024:>8.0f}{default_ms:>12.1f}{fast_ms:>14.1f}"
+              f"{default_ms / fast_ms:>8.1f}x{first:>15}{total:>11}")
+
+
+if __name__ == "__main__":
+    main()
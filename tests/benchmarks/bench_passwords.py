@@ -0,0 +1,78 @@
+"""Login latency and event-loop stalls with bcrypt inline vs on password_pool.
+
+    python tests/benchmarks/bench_passwords.py [--logins 32] [--rounds 12]
+
+Fires --logins concurrent password checks, the way a burst of /auth/login
+requests does, and reports wall time, per-login p50/p99 and the worst
+event-loop stall seen by a 1 ms ticker, which is what every other request
+on the worker waits through.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+import server  # noqa: E402
+
+
+async def burst(hashed: str, logins: int, inline: bool):
+    worst, done = 0.0, False
+
+    async def ticker():
+        nonlocal worst
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            worst = max(worst, time.perf_counter() - started - 0.001)
+
+    async def login():
+        started = time.perf_counter()
+        if inline:
+            assert server.verify_pw("secret", hashed)
+            await asyncio.sleep(0)
+        else:
+            assert await server.verify_password("secret", hashed)
+        return time.perf_counter() - started
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*[login() for _ in range(logins)])
+    wall = time.perf_counter() - started
+    done = True
+    await tick
+    return wall, sorted(latencies), worst
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=server.BCRYPT_ROUNDS)
+    parser.add_argument("--workers", default="1,2,4")
+    args = parser.parse_args()
+
+    hashed = bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds=args.rounds)).decode()
+    print(f"{args.logins} concurrent logins, bcrypt rounds={args.rounds}, {os.cpu_count()} CPUs\n")
+    print(f"{'mode':<12}{'wall ms':>9}{'p50 ms':>9}{'p99 ms':>9}{'max stall ms':>14}")
+
+    runs = [("inline", None)] + [(f"pool x{n}", int(n)) for n in args.workers.split(",")]
+    for name, workers in runs:
+        if workers:
+            server.password_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        wall, latencies, stall = asyncio.run(burst(hashed, args.logins, workers is None))
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{name:<12}{wall * 1000:>9.0f}{statistics.median(latencies) * 1000:>9.0f}"
+              f"{p99 * 1000:>9.0f}{stall * 1000:>14.1f}")
+        if workers:
+            server.password_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
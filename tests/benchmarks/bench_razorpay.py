@@ -0,0 +1,80 @@
+"""Payment order latency and event-loop stalls, blocking SDK call vs RazorpayGateway.
+
+    python tests/benchmarks/bench_razorpay.py [--orders 64] [--latency-ms 100]
+
+Fires --orders concurrent /payment/create-order calls against fake_razorpay
+(mounted in-process, answering after --latency-ms) and reports wall time,
+per-order p50/p99 and the worst event-loop stall seen by a 1 ms ticker. The
+"blocking" row stands in for the old synchronous razorpay client, which held
+the loop for the whole round trip.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+import fake_razorpay  # noqa: E402
+import server  # noqa: E402
+
+
+async def burst(orders: int, latency: float, max_concurrency):
+    worst, done = 0.0, False
+    gateway = server.RazorpayGateway(
+        "rzp_test_key", "secret", "http://razorpay.test/v1", 30.0, max_concurrency or 1,
+        transport=httpx.ASGITransport(app=fake_razorpay.app),
+    )
+
+    async def ticker():
+        nonlocal worst
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            worst = max(worst, time.perf_counter() - started - 0.001)
+
+    async def create():
+        started = time.perf_counter()
+        if max_concurrency is None:
+            time.sleep(latency)
+            await asyncio.sleep(0)
+        else:
+            await gateway.create_order(10000, "INR")
+        return time.perf_counter() - started
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*[create() for _ in range(orders)])
+    wall = time.perf_counter() - started
+    done = True
+    await tick
+    await gateway.close()
+    return wall, sorted(latencies), worst
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=64)
+    parser.add_argument("--latency-ms", type=int, default=100)
+    parser.add_argument("--concurrency", default="4,16,64")
+    args = parser.parse_args()
+
+    fake_razorpay.LATENCY_MS = args.latency_ms
+    print(f"{args.orders} concurrent orders, gateway latency {args.latency_ms} ms\n")
+    print(f"{'mode':<14}{'wall ms':>9}{'p50 ms':>9}{'p99 ms':>9}{'max stall ms':>14}")
+
+    runs = [("blocking", None)] + [(f"gateway x{n}", int(n)) for n in args.concurrency.split(",")]
+    for name, max_concurrency in runs:
+        wall, latencies, stall = asyncio.run(burst(args.orders, args.latency_ms / 1000, max_concurrency))
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{name:<14}{wall * 1000:>9.0f}{statistics.median(latencies) * 1000:>9.0f}"
+              f"{p99 * 1000:>9.0f}{stall * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
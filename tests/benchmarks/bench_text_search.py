@@ -0,0 +1,92 @@
+"""Text-index product search latency vs the case-insensitive $regex scan it replaced.
+
+    TEST_MONGO_URL=mongodb://localhost:27017 python tests/benchmarks/bench_text_search.py [--products 200000]
+
+Seeds a throwaway database with the synthetic grocery catalogue from
+bench_trigram.py, builds the declared indexes, then times search_products
+(first page and the third page via cursors) against the old
+{"$or": [{name: /q/i}, {description: /q/i}]} query for the same page size.
+The database is dropped afterwards.
+"""
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import time
+import uuid
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import server  # noqa: E402
+from bench_trigram import catalogue  # noqa: E402
+
+QUERIES = ["milk", "basmati rice", "amul butter", "organic", "chilli powder", "honey"]
+
+
+async def timed(fn, repeat: int):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await fn()
+        runs.append(time.perf_counter() - started)
+    return statistics.median(runs) * 1000, result
+
+
+async def run(url: str, args):
+    client = AsyncIOMotorClient(url)
+    name = f"bench_search_{uuid.uuid4().hex[:8]}"
+    server.db = client[name]
+    try:
+        batch = []
+        for i, (pid, label) in enumerate(catalogue(args.products)):
+            batch.append({"id": pid, "name": label, "description": f"{label} from our store",
+                          "price": float(i % 500), "stock": i % 40, "seller_id": f"s{i % 50}"})
+            if len(batch) == 10_000:
+                await server.db.products.insert_many(batch)
+                batch = []
+        if batch:
+            await server.db.products.insert_many(batch)
+        await server.ensure_indexes()
+
+        size = args.page_size
+        print(f"{args.products} products, page size {size}\n")
+        print(f"{'query':<16}{'text p1 ms':>12}{'text p3 ms':>12}{'regex ms':>10}{'hits p1':>9}")
+        for query in QUERIES:
+            first_ms, first = await timed(lambda: server.search_products({}, query, None, size), args.repeat)
+            page, third_ms = first, float("nan")
+            for _ in range(2):
+                if page["next_cursor"] is None:
+                    break
+                cursor = page["next_cursor"]
+                third_ms, page = await timed(lambda: server.search_products({}, query, cursor, size), args.repeat)
+            regex = {"$regex": re.escape(query), "$options": "i"}
+            regex_ms, _ = await timed(
+                lambda: server.db.products.find({"$or": [{"name": regex}, {"description": regex}]}, {"_id": 0})
+                .limit(size).to_list(size),
+                args.repeat,
+            )
+            print(f"{query:<16}{first_ms:>12.1f}{third_ms:>12.1f}{regex_ms:>10.1f}{len(first['items']):>9}")
+    finally:
+        await client.drop_database(name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    url = os.getenv("TEST_MONGO_URL") or os.getenv("MONGO_URL")
+    if not url:
+        sys.exit("set TEST_MONGO_URL to a MongoDB the benchmark may create and drop a database on")
+    asyncio.run(run(url, args))
+
+
+if __name__ == "__main__":
+    main()
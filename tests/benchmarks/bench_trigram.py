@@ -0,0 +1,122 @@
+"""Fuzzy-search recall and latency on a synthetic grocery catalogue.
+
+    python tests/benchmarks/bench_trigram.py [--products 200000] [--max-scan N]
+
+Names are built from a small grocery vocabulary, so common words ("fresh",
+"milk", "rice") have long posting lists, like a real shop catalogue. Recall
+is measured against an uncapped search (max_scan=None), which is exact.
+The last section reports the worst event-loop stall while the queries run
+inline versus on search_pool, as fuzzy_search_products runs them.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from server import TrigramIndex, TRIGRAM_MAX_SCAN, search_pool  # noqa: E402
+
+BRANDS = ["Amul", "Tata", "Aashirvaad", "Fortune", "Britannia", "Nestle", "Haldiram", "Mother Dairy",
+          "Patanjali", "Daawat", "India Gate", "Parle", "MTR", "Everest", "Catch", "Saffola", "Dabur"]
+ADJECTIVES = ["Fresh", "Organic", "Premium", "Classic", "Pure", "Toned", "Full Cream", "Basmati",
+              "Whole", "Roasted", "Salted", "Crunchy", "Instant", "Natural", "Select", "Gold"]
+ITEMS = ["Milk", "Bread", "Rice", "Atta", "Sugar", "Salt", "Butter", "Paneer", "Curd", "Ghee", "Oil",
+         "Tea", "Coffee", "Biscuits", "Namkeen", "Dal", "Besan", "Poha", "Maggi", "Jam", "Honey",
+         "Cheese", "Eggs", "Onion", "Potato", "Tomato", "Banana", "Apple", "Masala", "Chilli Powder"]
+SIZES = ["100g", "200g", "250g", "500g", "1kg", "2kg", "5kg", "500ml", "1L", "Pack of 6", "Family Pack"]
+
+QUERIES = ["milk", "mlk", "fresh milk", "amul butter", "basmati rice", "bred", "atta 5kg",
+           "organic", "paneer", "chili powder", "britania biscuits", "tata salt", "honey", "coffe"]
+
+
+def catalogue(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    for i in range(n):
+        words = [rnd.choice(BRANDS)]
+        if rnd.random() < 0.6:
+            words.append(rnd.choice(ADJECTIVES))
+        words.append(rnd.choice(ITEMS))
+        words.append(rnd.choice(SIZES))
+        yield f"p{i}", " ".join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=200_000)
+    parser.add_argument("--max-scan", type=int, default=TRIGRAM_MAX_SCAN)
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    index = TrigramIndex()
+    started = time.perf_counter()
+    for key, name in catalogue(args.products):
+        index.upsert(key, name)
+    build = time.perf_counter() - started
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pairs = sum(len(p) for p in index._postings.values())
+    print(f"{len(index)} products, {len(index._keys)} slots, {pairs} (slot, trigram) pairs")
+    print(f"build {build:.1f}s, {memory / 2**20:.1f} MiB traced, {memory / pairs:.1f} bytes per pair")
+    print(f"max_scan={args.max_scan} limit={args.limit} threshold={args.threshold}\n")
+    print(f"{'query':<20}{'exact ms':>10}{'capped ms':>11}{'recall':>8}{'top-20':>8}")
+
+    recalls = []
+    for query in QUERIES:
+        timings = {}
+        for name, max_scan in (("exact", None), ("capped", args.max_scan)):
+            runs = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                hits = index.search(query, args.threshold, args.limit, max_scan=max_scan)
+                runs.append(time.perf_counter() - started)
+            timings[name] = (statistics.median(runs) * 1000, hits)
+        exact, capped = timings["exact"][1], timings["capped"][1]
+        # ties at the cut-off make the exact top-k ambiguous, so a capped hit
+        # counts when its true score reaches the lowest exact score
+        true = dict(index.search(query, args.threshold, len(index), max_scan=None))
+        floor = exact[-1][1] if exact else 1.0
+        recall = sum(true[k] >= floor for k, _ in capped) / len(exact) if exact else 1.0
+        top = exact[:20]
+        top_recall = sum(true[k] >= top[-1][1] for k, _ in capped[:20]) / len(top) if top else 1.0
+        recalls.append(recall)
+        print(f"{query:<20}{timings['exact'][0]:>10.1f}{timings['capped'][0]:>11.1f}{recall:>8.2f}{top_recall:>8.2f}")
+    print(f"\nmean recall {statistics.mean(recalls):.3f}")
+
+    for mode in ("inline", "search_pool"):
+        print(f"max loop stall, {mode}: {asyncio.run(loop_stall(index, args, mode == 'inline')):.1f} ms")
+
+
+async def loop_stall(index, args, inline: bool) -> float:
+    loop = asyncio.get_running_loop()
+    worst, done = 0.0, False
+
+    async def ticker():
+        nonlocal worst
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            worst = max(worst, time.perf_counter() - started - 0.001)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    for query in QUERIES:
+        if inline:
+            index.search(query, args.threshold, args.limit, max_scan=args.max_scan)
+            await asyncio.sleep(0)
+        else:
+            await loop.run_in_executor(search_pool, index.search, query, args.threshold, args.limit, args.max_scan)
+    done = True
+    await tick
+    return worst * 1000
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""WebSocketHub fan-out with many idle connections.
+
+    python tests/benchmarks/bench_ws_fanout.py [--connections 10000] [--sellers 1000]
+
+Opens --connections in-memory sockets, each with its pump task running as
+in /ws, spread over --sellers sellers, so nearly all of them sit idle. It
+reports memory per idle connection, the cost of a targeted publish(), the
+time for a burst of events to be sent, and the same burst through a
+broadcast-to-everyone loop (what the hub's seller index avoids).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from server import WebSocketHub, WS_SEND_QUEUE_SIZE  # noqa: E402
+
+
+class NullSocket:
+    sent = 0
+
+    async def send_text(self, message):
+        NullSocket.sent += 1
+
+    async def close(self):
+        pass
+
+
+async def drain(expected: int, timeout: float = 60):
+    deadline = time.perf_counter() + timeout
+    while NullSocket.sent < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0)
+
+
+async def run(args):
+    tracemalloc.start()
+    hub = WebSocketHub(WS_SEND_QUEUE_SIZE)
+    subs = []
+    for i in range(args.connections):
+        sub = hub.connect(NullSocket())
+        hub.subscribe(sub, f"s{i % args.sellers}")
+        subs.append(sub)
+    pumps = [asyncio.create_task(sub.pump(hub)) for sub in subs]
+    await asyncio.sleep(0)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_seller = args.connections // args.sellers
+    print(f"{args.connections} idle connections over {args.sellers} sellers ({per_seller} each)")
+    print(f"memory {memory / 2**20:.1f} MiB, {memory / args.connections / 1024:.1f} KiB per connection\n")
+
+    event = {"type": "new_order", "order_id": "o1", "revenue": 120.0, "items_count": 3, "orders_count": 1}
+    timings = []
+    for i in range(args.events):
+        started = time.perf_counter()
+        hub.publish(f"s{i % args.sellers}", event)
+        timings.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    await drain(args.events * per_seller)
+    sent = time.perf_counter() - started
+    print(f"targeted: publish p50 {statistics.median(timings) * 1e6:.0f} us, "
+          f"max {max(timings) * 1e6:.0f} us; {args.events} events sent in {sent * 1000:.0f} ms")
+
+    NullSocket.sent = 0
+    started = time.perf_counter()
+    for _ in range(min(args.events, 20)):
+        for sub in subs:  # naive hub: every socket gets every event and filters client-side
+            sub.offer('{"type": "new_order"}')
+    queued = time.perf_counter() - started
+    await drain(min(args.events, 20) * args.connections)
+    total = time.perf_counter() - started
+    print(f"broadcast: {min(args.events, 20)} events queued in {queued * 1000:.0f} ms, "
+          f"sent in {total * 1000:.0f} ms")
+
+    for pump in pumps:
+        pump.cancel()
+    await asyncio.gather(*pumps, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=10_000)
+    parser.add_argument("--sellers", type=int, default=1_000)
+    parser.add_argument("--events", type=int, default=1_000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,715 @@
+import copy
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError, InvalidOperation, WriteError
+
+# server.py lives in backend/ and is imported as a top-level module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+# ================= FAKE MONGO =====================
+# An in-memory stand-in for the slice of the Motor API server.py uses:
+# query and update operators, pipeline updates, bulk writes and the
+# aggregation stages of the listing/facet/search paths. Collections record
+# every call in `calls` and take failure injection (fail_next) and hooks
+# that run just before a call returns (after).
+
+MISSING = object()
+REMOVE = object()
+TEXT_WEIGHTS = {"name": 10, "description": 2}  # as in the product_text index
+
+
+def values_at(value, parts):
+    """Every value a dotted path reaches, expanding arrays like Mongo does"""
+    if not parts:
+        return [value] + (list(value) if isinstance(value, list) else [])
+    if isinstance(value, list):
+        if parts[0].isdigit():
+            i = int(parts[0])
+            return values_at(value[i], parts[1:]) if i < len(value) else []
+        return [v for el in value for v in values_at(el, parts)]
+    if isinstance(value, dict) and parts[0] in value:
+        return values_at(value[parts[0]], parts[1:])
+    return []
+
+
+def get_path(doc, path):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        elif isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return MISSING
+    return value
+
+
+def set_path(doc, path, value):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc[int(part)] if isinstance(doc, list) else doc.setdefault(part, {})
+    if isinstance(doc, list):
+        doc[int(leaf)] = value
+    else:
+        doc[leaf] = value
+
+
+def unset_path(doc, path):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.get(part) if isinstance(doc, dict) else None
+        if doc is None:
+            return
+    if isinstance(doc, dict):
+        doc.pop(leaf, None)
+
+
+def type_matches(value, name):
+    return {
+        "array": isinstance(value, list),
+        "double": isinstance(value, float),
+        "int": isinstance(value, int) and not isinstance(value, bool),
+        "long": isinstance(value, int) and not isinstance(value, bool),
+        "string": isinstance(value, str),
+        "object": isinstance(value, dict),
+        "bool": isinstance(value, bool),
+        "null": value is None,
+    }[name]
+
+
+def compare(values, target, op):
+    for v in values:
+        try:
+            if op(v, target):
+                return True
+        except TypeError:
+            pass
+    return False
+
+
+def equals(values, target):
+    return (target is None and not values) or any(v == target for v in values)
+
+
+def is_operator_dict(cond):
+    return isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond)
+
+
+def match_cond(values, cond):
+    if not is_operator_dict(cond):
+        return equals(values, cond)
+    for op, arg in cond.items():
+        if op == "$eq":
+            ok = equals(values, arg)
+        elif op == "$ne":
+            ok = not equals(values, arg)
+        elif op == "$in":
+            ok = any(equals(values, a) for a in arg)
+        elif op == "$nin":
+            ok = not any(equals(values, a) for a in arg)
+        elif op == "$gt":
+            ok = compare(values, arg, lambda a, b: a > b)
+        elif op == "$gte":
+            ok = compare(values, arg, lambda a, b: a >= b)
+        elif op == "$lt":
+            ok = compare(values, arg, lambda a, b: a < b)
+        elif op == "$lte":
+            ok = compare(values, arg, lambda a, b: a <= b)
+        elif op == "$exists":
+            ok = bool(values) == bool(arg)
+        elif op == "$not":
+            ok = not match_cond(values, arg)
+        elif op == "$type":
+            names = arg if isinstance(arg, list) else [arg]
+            ok = any(type_matches(v, n) for v in values for n in names)
+        elif op == "$regex":
+            flags = re.I if "i" in cond.get("$options", "") else 0
+            ok = any(isinstance(v, str) and re.search(arg, v, flags) for v in values)
+        elif op == "$options":
+            ok = True
+        elif op == "$elemMatch":
+            ok = any(isinstance(v, dict) and matches(v, arg) for v in values)
+        else:
+            raise NotImplementedError(f"query operator {op}")
+        if not ok:
+            return False
+    return True
+
+
+def text_score(doc, search):
+    terms = search.lower().split()
+    score = 0.0
+    for field, weight in TEXT_WEIGHTS.items():
+        words = re.findall(r"\w+", str(doc.get(field, "")).lower())
+        score += weight * sum(words.count(t) for t in terms)
+    return score
+
+
+def matches(doc, q):
+    for field, cond in q.items():
+        if field == "$and":
+            ok = all(matches(doc, c) for c in cond)
+        elif field == "$or":
+            ok = any(matches(doc, c) for c in cond)
+        elif field == "$nor":
+            ok = not any(matches(doc, c) for c in cond)
+        elif field == "$text":
+            ok = text_score(doc, cond["$search"]) > 0
+        else:
+            ok = match_cond(values_at(doc, field.split(".")), cond)
+        if not ok:
+            return False
+    return True
+
+
+def evaluate(expr, doc):
+    """The aggregation expressions used in pipeline updates and $group"""
+    if isinstance(expr, str) and expr == "$$REMOVE":
+        return REMOVE
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = get_path(doc, expr[1:])
+        return None if value is MISSING else value
+    if isinstance(expr, list):
+        return [evaluate(e, doc) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if not is_operator_dict(expr):
+        return {k: evaluate(v, doc) for k, v in expr.items()}
+
+    op, arg = next(iter(expr.items()))
+    if op == "$literal":
+        return arg
+    if op == "$cond":
+        if isinstance(arg, dict):
+            arg = [arg["if"], arg["then"], arg["else"]]
+        return evaluate(arg[1] if evaluate(arg[0], doc) else arg[2], doc)
+    if op == "$convert":
+        value = evaluate(arg["input"], doc)
+        if value is None:
+            return arg.get("onNull")
+        try:
+            return {"double": float, "int": int, "string": str}[arg["to"]](value)
+        except (TypeError, ValueError):
+            return arg.get("onError")
+    args = [evaluate(a, doc) for a in (arg if isinstance(arg, list) else [arg])]
+    if op == "$ifNull":
+        return next((a for a in args if a is not None), None)
+    if op == "$eq":
+        return args[0] == args[1]
+    if op == "$ne":
+        return args[0] != args[1]
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return compare([args[0]], args[1], {
+            "$gt": lambda a, b: a > b, "$gte": lambda a, b: a >= b,
+            "$lt": lambda a, b: a < b, "$lte": lambda a, b: a <= b,
+        }[op])
+    if op == "$add":
+        return sum(args)
+    if op == "$max":
+        return max(a for a in args if a is not None)
+    if op == "$min":
+        return min(a for a in args if a is not None)
+    if op == "$toInt":
+        return int(args[0])
+    if op == "$toDouble":
+        return float(args[0])
+    if op == "$toLower":
+        return (args[0] or "").lower()
+    if op == "$setDifference":
+        return [v for v in args[0] if v not in args[1]]
+    raise NotImplementedError(f"expression operator {op}")
+
+
+def project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        out = {k: copy.deepcopy(doc[k]) for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: copy.deepcopy(v) for k, v in doc.items() if projection.get(k, 1)}
+
+
+def sort_docs(docs, keys):
+    def key(field):
+        def value(doc):
+            v = get_path(doc, field)
+            return (0, 0) if v is MISSING or v is None else (1, v)
+        return value
+
+    for field, direction in reversed(keys):
+        if field == "$natural":
+            docs = docs if direction > 0 else docs[::-1]
+        else:
+            docs = sorted(docs, key=key(field), reverse=direction < 0)
+    return docs
+
+
+def positional_index(doc, q, array):
+    """Index of the first `array` element matched by the filter, for `$` updates"""
+    conds = {k[len(array) + 1:]: v for k, v in q.items() if k.startswith(array + ".")}
+    for i, el in enumerate(get_path(doc, array) or []):
+        if all(match_cond(values_at(el, f.split(".")), c) for f, c in conds.items()):
+            return i
+    raise WriteError("The positional operator did not find the match needed from the query.", 2)
+
+
+def apply_update(doc, update, q, inserting):
+    if isinstance(update, list):
+        for stage in update:
+            (op, fields), = stage.items()
+            if op == "$unset":
+                for f in [fields] if isinstance(fields, str) else fields:
+                    unset_path(doc, f)
+                continue
+            computed = {f: evaluate(e, doc) for f, e in fields.items()}
+            for f, value in computed.items():
+                if value is REMOVE:
+                    unset_path(doc, f)
+                else:
+                    set_path(doc, f, value)
+        return
+
+    def resolve(path):
+        if ".$." in path or path.endswith(".$"):
+            array = path.split(".$")[0]
+            return path.replace(".$", f".{positional_index(doc, q, array)}", 1)
+        return path
+
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, arg in fields.items():
+            path = resolve(path)
+            current = get_path(doc, path)
+            if op in ("$set", "$setOnInsert"):
+                set_path(doc, path, copy.deepcopy(arg))
+            elif op == "$unset":
+                unset_path(doc, path)
+            elif op == "$inc":
+                set_path(doc, path, (0 if current is MISSING else current) + arg)
+            elif op in ("$max", "$min"):
+                pick = max if op == "$max" else min
+                set_path(doc, path, arg if current is MISSING else pick(current, arg))
+            elif op in ("$push", "$addToSet", "$pull"):
+                if current is MISSING:
+                    current = []
+                    if op != "$pull":
+                        set_path(doc, path, current)
+                if not isinstance(current, list):
+                    raise WriteError(f"The field '{path}' must be an array", 2)
+                if op == "$pull":
+                    keep = [
+                        el for el in current
+                        if not (matches(el, arg) if isinstance(arg, dict) and not is_operator_dict(arg)
+                                else match_cond(values_at(el, []), arg))
+                    ]
+                    set_path(doc, path, keep)
+                    continue
+                items = arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg]
+                for item in items:
+                    if op == "$push" or item not in current:
+                        current.append(copy.deepcopy(item))
+            else:
+                raise NotImplementedError(f"update operator {op}")
+
+
+def upsert_seed(q):
+    """The equality fields of a filter, which an upsert starts its document from"""
+    doc = {}
+    for field, cond in q.items():
+        if not field.startswith("$") and not is_operator_dict(cond) and "." not in field:
+            doc[field] = copy.deepcopy(cond)
+    return doc
+
+
+class FakeCursor:
+    def __init__(self, docs, projection=None, on_read=None):
+        self._docs = docs
+        self._projection = projection
+        self._on_read = on_read
+        self._skip = 0
+        self._limit = None
+
+    def sort(self, key, direction=None):
+        keys = [(key, direction or 1)] if isinstance(key, str) else list(key)
+        self._docs = sort_docs(self._docs, keys)
+        return self
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n or None
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def _results(self):
+        docs = self._docs[self._skip:]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return [project(d, self._projection) for d in docs]
+
+    async def to_list(self, length=None):
+        docs = self._results()
+        if self._on_read:
+            await self._on_read()
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._results():
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, name="collection", docs=(), unique=()):
+        self.name = name
+        self.docs = []
+        self.unique = tuple(unique)
+        self.calls = []
+        self._failures = {}
+        self._hooks = {}
+        self.seed(*docs)
+
+    # ---- test helpers -------------------------------------------------
+    def seed(self, *docs):
+        for doc in docs:
+            doc = copy.deepcopy(doc)
+            doc.setdefault("_id", ObjectId())
+            self.docs.append(doc)
+
+    def get(self, **fields) -> dict:
+        """The stored document with these field values (no projection)"""
+        return next((d for d in self.docs if all(d.get(k) == v for k, v in fields.items())), None)
+
+    def fail_next(self, op, exc):
+        """Raise `exc` from the next `op` call instead of running it"""
+        self._failures[op] = exc
+
+    def after(self, op, fn):
+        """Await fn() after every `op` has run and before it returns; None removes it.
+
+        For find and aggregate the hook runs when the cursor is read.
+        """
+        self._hooks[op] = fn
+
+    def count(self, op) -> int:
+        return sum(1 for name, _ in self.calls if name == op)
+
+    async def _enter(self, op, *args):
+        self.calls.append((op, args))
+        exc = self._failures.pop(op, None)
+        if exc is not None:
+            raise exc
+
+    async def _leave(self, op):
+        hook = self._hooks.get(op)
+        if hook is not None:
+            await hook()
+
+    def _find(self, q):
+        return [d for d in self.docs if matches(d, q or {})]
+
+    def _check_unique(self, doc):
+        for fields in self.unique:
+            if not all(f in doc for f in fields):
+                continue
+            key = [doc[f] for f in fields]
+            if any(d is not doc and [d.get(f) for f in fields] == key for d in self.docs):
+                raise DuplicateKeyError(f"E11000 duplicate key error {self.name}.{'_'.join(fields)}: {key!r}")
+
+    def _insert(self, doc):
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        self.docs.append(doc)
+        return doc
+
+    def _update(self, q, update, upsert, many):
+        matched = self._find(q)
+        if not many:
+            matched = matched[:1]
+        modified = 0
+        for doc in matched:
+            before = copy.deepcopy(doc)
+            apply_update(doc, update, q, inserting=False)
+            modified += doc != before
+        upserted_id = None
+        if not matched and upsert:
+            doc = upsert_seed(q)
+            apply_update(doc, update, q, inserting=True)
+            upserted_id = self._insert(doc)["_id"]
+        return SimpleNamespace(matched_count=len(matched), modified_count=modified, upserted_id=upserted_id)
+
+    # ---- reads --------------------------------------------------------
+    def find(self, q=None, projection=None, **kwargs):
+        self.calls.append(("find", (q, projection)))
+        return FakeCursor(self._find(q), projection, lambda: self._leave("find"))
+
+    async def find_one(self, q=None, projection=None):
+        await self._enter("find_one", q, projection)
+        found = self._find(q)
+        result = project(found[0], projection) if found else None
+        await self._leave("find_one")
+        return result
+
+    async def count_documents(self, q, limit=None, **kwargs):
+        await self._enter("count_documents", q)
+        n = len(self._find(q))
+        return min(n, limit) if limit else n
+
+    async def distinct(self, field, q=None):
+        await self._enter("distinct", field, q)
+        out = []
+        for doc in self._find(q):
+            for v in values_at(doc, field.split(".")):
+                if not isinstance(v, list) and v not in out:
+                    out.append(v)
+        return out
+
+    def aggregate(self, pipeline, **kwargs):
+        self.calls.append(("aggregate", (pipeline,)))
+        docs = [copy.deepcopy(d) for d in self.docs]
+        return FakeCursor(run_pipeline(docs, pipeline), on_read=lambda: self._leave("aggregate"))
+
+    # ---- writes -------------------------------------------------------
+    async def create_indexes(self, models):
+        await self._enter("create_indexes", models)
+        return [m.document.get("name", "index") for m in models]
+
+    async def insert_one(self, doc):
+        await self._enter("insert_one", doc)
+        stored = self._insert(doc)
+        doc.setdefault("_id", stored["_id"])  # pymongo sets _id on the caller's dict
+        await self._leave("insert_one")
+        return SimpleNamespace(inserted_id=stored["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        await self._enter("insert_many", docs)
+        ids = []
+        for doc in docs:
+            stored = self._insert(doc)
+            doc.setdefault("_id", stored["_id"])
+            ids.append(stored["_id"])
+        await self._leave("insert_many")
+        return SimpleNamespace(inserted_ids=ids)
+
+    async def update_one(self, q, update, upsert=False):
+        await self._enter("update_one", q, update)
+        result = self._update(q, update, upsert, many=False)
+        await self._leave("update_one")
+        return result
+
+    async def update_many(self, q, update, upsert=False):
+        await self._enter("update_many", q, update)
+        result = self._update(q, update, upsert, many=True)
+        await self._leave("update_many")
+        return result
+
+    async def replace_one(self, q, doc, upsert=False):
+        await self._enter("replace_one", q, doc)
+        return self._replace(q, doc, upsert)
+
+    def _replace(self, q, doc, upsert):
+        found = self._find(q)[:1]
+        if found:
+            _id = found[0]["_id"]
+            found[0].clear()
+            found[0].update(copy.deepcopy(doc), _id=_id)
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        upserted_id = self._insert(doc)["_id"] if upsert else None
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=upserted_id)
+
+    async def delete_one(self, q):
+        await self._enter("delete_one", q)
+        found = self._find(q)[:1]
+        for doc in found:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=len(found))
+
+    async def delete_many(self, q):
+        await self._enter("delete_many", q)
+        found = self._find(q)
+        for doc in found:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=len(found))
+
+    async def find_one_and_update(self, q, update, projection=None, upsert=False, return_document=False, **kwargs):
+        await self._enter("find_one_and_update", q, update)
+        found = self._find(q)[:1]
+        if found:
+            before = copy.deepcopy(found[0])
+            apply_update(found[0], update, q, inserting=False)
+            result = project(found[0] if return_document else before, projection)
+        elif upsert:
+            doc = upsert_seed(q)
+            apply_update(doc, update, q, inserting=True)
+            doc = self._insert(doc)
+            result = project(doc, projection) if return_document else None
+        else:
+            result = None
+        await self._leave("find_one_and_update")
+        return result
+
+    async def find_one_and_delete(self, q, projection=None):
+        await self._enter("find_one_and_delete", q)
+        found = self._find(q)[:1]
+        if not found:
+            return None
+        self.docs.remove(found[0])
+        return project(found[0], projection)
+
+    async def bulk_write(self, ops, ordered=True):
+        await self._enter("bulk_write", ops)
+        if not ops:
+            raise InvalidOperation("No operations to execute")
+        matched = modified = upserted = inserted = 0
+        for op in ops:
+            if isinstance(op, InsertOne):
+                self._insert(op._doc)
+                inserted += 1
+                continue
+            if isinstance(op, ReplaceOne):
+                result = self._replace(op._filter, op._doc, op._upsert)
+            elif isinstance(op, UpdateOne):
+                result = self._update(op._filter, op._doc, op._upsert, many=False)
+            else:
+                raise NotImplementedError(type(op).__name__)
+            matched += result.matched_count
+            modified += result.modified_count
+            upserted += result.upserted_id is not None
+        await self._leave("bulk_write")
+        return SimpleNamespace(
+            matched_count=matched, modified_count=modified, upserted_count=upserted, inserted_count=inserted,
+        )
+
+
+def run_pipeline(docs, pipeline):
+    for stage in pipeline:
+        (op, arg), = stage.items()
+        if op == "$match":
+            scored = []
+            for doc in docs:
+                if "$text" in arg:
+                    doc.setdefault("__score", text_score(doc, arg["$text"]["$search"]))
+                if matches(doc, arg):
+                    scored.append(doc)
+            docs = scored
+        elif op in ("$addFields", "$set"):
+            for doc in docs:
+                for field, expr in arg.items():
+                    meta = expr.get("$meta") if isinstance(expr, dict) else None
+                    doc[field] = doc.get("__score", 0.0) if meta == "textScore" else evaluate(expr, doc)
+        elif op == "$sort":
+            docs = sort_docs(docs, list(arg.items()))
+        elif op == "$skip":
+            docs = docs[arg:]
+        elif op == "$limit":
+            docs = docs[:arg]
+        elif op == "$project":
+            docs = [project(d, arg) for d in docs]
+        elif op == "$count":
+            docs = [{arg: len(docs)}] if docs else []
+        elif op == "$facet":
+            docs = [{name: run_pipeline([copy.deepcopy(d) for d in docs], sub) for name, sub in arg.items()}]
+        elif op == "$group":
+            docs = group(docs, arg)
+        elif op == "$bucket":
+            docs = bucket(docs, arg)
+        else:
+            raise NotImplementedError(f"pipeline stage {op}")
+    for doc in docs:
+        doc.pop("__score", None)
+    return docs
+
+
+def accumulate(docs, fields):
+    out = {}
+    for name, acc in fields.items():
+        (op, expr), = acc.items()
+        if op != "$sum":
+            raise NotImplementedError(f"accumulator {op}")
+        out[name] = sum(evaluate(expr, d) or 0 for d in docs)
+    return out
+
+
+def group(docs, spec):
+    groups = {}
+    for doc in docs:
+        key = evaluate(spec["_id"], doc)
+        groups.setdefault(repr(key), (key, []))[1].append(doc)
+    return [
+        {"_id": key, **accumulate(members, {k: v for k, v in spec.items() if k != "_id"})}
+        for key, members in groups.values()
+    ]
+
+
+def bucket(docs, spec):
+    bounds = spec["boundaries"]
+    buckets = {}
+    for doc in docs:
+        value = evaluate(spec["groupBy"], doc)
+        key = spec["default"]
+        for lo, hi in zip(bounds, bounds[1:]):
+            if compare([value], lo, lambda a, b: a >= b) and compare([value], hi, lambda a, b: a < b):
+                key = lo
+                break
+        buckets.setdefault(key, []).append(doc)
+    order = [b for b in bounds if b in buckets] + ([spec["default"]] if spec["default"] in buckets else [])
+    return [{"_id": key, **accumulate(buckets[key], spec["output"])} for key in order]
+
+
+class FakeDB:
+    """Collections spring into existence on first use, like Mongo's.
+
+    `unique` maps a collection to the field tuples of its unique indexes.
+    """
+
+    def __init__(self, unique=None):
+        self._collections = {}
+        self._unique = unique or {}
+
+    def __getitem__(self, name) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name, unique=self._unique.get(name, ()))
+        return self._collections[name]
+
+    def __getattr__(self, name) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self):
+        return list(self._collections)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """server.db backed by FakeDB, with the process-wide caches reset"""
+    import server
+
+    db = FakeDB({
+        coll: [tuple(m.document["key"]) for m in models if m.document.get("unique")]
+        for coll, models in server.INDEX_CATALOGUE.items()
+    })
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "product_cache", server.LocalProductCache(100, 60))
+    monkeypatch.setattr(server, "catalog_versions", server.TTLCache(16, 60))
+    monkeypatch.setattr(server, "facet_cache", server.TTLCache(100, 60))
+    monkeypatch.setattr(server, "read_flights", server.SingleFlight())
+    monkeypatch.setattr(server, "stock_bumps", server.DeferredVersionBumps(server.CATALOG_STOCK_BUMP_SECONDS))
+    return db
@@ -0,0 +1,120 @@
+import asyncio
+
+import orjson
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+import server
+
+UID = "user-1"
+
+
+@pytest.fixture
+def shop(fake_db):
+    fake_db.products.seed(
+        {"id": "p1", "name": "Milk", "price": 30.0, "stock": 5, "seller_id": "s1"},
+        {"id": "p2", "name": "Bread", "price": 45.5, "stock": 1, "seller_id": "s1"},
+    )
+    return fake_db
+
+
+def add(pid, quantity=1):
+    return asyncio.run(server.add_to_cart(UID, {"product_id": pid, "quantity": quantity}))
+
+
+def test_add_creates_the_cart_then_bumps_the_line(shop):
+    add("p1", 2)
+    cart = add("p1", 3)
+    assert cart["items"] == [{"product_id": "p1", "quantity": 5}]
+    assert len(shop.cart.docs) == 1
+
+
+def test_push_guard_never_duplicates_a_line(shop):
+    shop.cart.seed({"user_id": UID, "items": [{"product_id": "p2", "quantity": 1}]})
+
+    async def racer():
+        # Another request adds p1 between our $inc miss and our $push
+        shop.cart.after("find_one_and_update", None)
+        shop.cart.get(user_id=UID)["items"].append({"product_id": "p1", "quantity": 1})
+
+    shop.cart.after("find_one_and_update", racer)
+    cart = add("p1", 2)
+
+    assert cart["items"] == [{"product_id": "p2", "quantity": 1}, {"product_id": "p1", "quantity": 3}]
+    assert len(shop.cart.docs) == 1
+
+
+def test_racing_cart_creation_retries_as_a_bump(shop):
+    async def racer():
+        # Another request creates the cart between our $inc miss and our upsert
+        shop.cart.after("find_one_and_update", None)
+        shop.cart.seed({"user_id": UID, "items": [{"product_id": "p1", "quantity": 1}]})
+
+    shop.cart.after("find_one_and_update", racer)
+    cart = add("p1", 2)
+
+    assert cart["items"] == [{"product_id": "p1", "quantity": 3}]
+    assert len(shop.cart.docs) == 1
+
+
+def test_duplicate_key_on_push_is_retried(shop):
+    async def fail_push():
+        # The items guard runs just before the push; arm the failure once
+        shop.cart.after("update_one", None)
+        shop.cart.fail_next("find_one_and_update", DuplicateKeyError("E11000 duplicate key error"))
+
+    shop.cart.after("update_one", fail_push)
+    cart = add("p1")
+    assert cart["items"] == [{"product_id": "p1", "quantity": 1}]
+    assert shop.cart.count("find_one_and_update") == 4  # miss, failed push, miss, push
+
+
+def test_malformed_items_are_reset_before_the_push(shop):
+    shop.cart.seed({"user_id": UID, "items": "corrupt"})
+    cart = add("p1", 2)
+    assert cart["items"] == [{"product_id": "p1", "quantity": 2}]
+
+
+def test_unknown_product_is_rejected(shop):
+    with pytest.raises(HTTPException) as err:
+        add("nope")
+    assert err.value.status_code == 400
+    assert shop.cart.docs == []
+
+
+def test_update_distinguishes_missing_cart_from_missing_item(shop):
+    with pytest.raises(HTTPException) as err:
+        asyncio.run(server.update_cart_item(UID, "p1", quantity=2))
+    assert (err.value.status_code, err.value.detail) == (404, "Cart not found")
+
+    add("p2")
+    with pytest.raises(HTTPException) as err:
+        asyncio.run(server.update_cart_item(UID, "p1", quantity=2))
+    assert (err.value.status_code, err.value.detail) == (404, "Item not in cart")
+
+    cart = asyncio.run(server.update_cart_item(UID, "p2", quantity=4))
+    assert cart["items"] == [{"product_id": "p2", "quantity": 4}]
+
+
+def test_hydrated_cart_carries_line_totals_and_stock_flags(shop):
+    shop.cart.seed({"user_id": UID, "items": [
+        {"product_id": "p1", "quantity": 2},
+        {"product_id": "p2", "quantity": 3},
+        {"product_id": "gone", "quantity": 1},
+    ]})
+
+    cart = orjson.loads(asyncio.run(server.get_cart(UID, hydrate=True)).body)
+
+    lines = {it["product_id"]: it for it in cart["items"]}
+    assert (lines["p1"]["line_total"], lines["p1"]["in_stock"]) == (60.0, True)
+    assert (lines["p2"]["line_total"], lines["p2"]["in_stock"]) == (136.5, False)
+    assert (lines["gone"]["line_total"], lines["gone"]["in_stock"], lines["gone"]["product"]) == (0.0, False, None)
+    assert lines["p1"]["product"]["name"] == "Milk"
+    assert cart["totals"] == {"subtotal": 196.5, "item_count": 6, "all_in_stock": False}
+    assert shop.products.count("find") == 1
+
+
+def test_hydrated_cart_in_stock_when_every_line_fits(shop):
+    cart = asyncio.run(server.hydrate_cart({"user_id": UID, "items": [{"product_id": "p1", "quantity": 5}]}))
+    assert cart["totals"] == {"subtotal": 150.0, "item_count": 5, "all_in_stock": True}
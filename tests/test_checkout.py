@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+@pytest.fixture
+def basket(fake_db):
+    fake_db.products.seed(
+        {"id": "p1", "name": "Milk", "price": 30.0, "stock": 5, "seller_id": "s1"},
+        {"id": "p2", "name": "Bread", "price": 50.0, "stock": 1, "seller_id": "s2"},
+    )
+    return fake_db.products
+
+
+def test_basket_is_priced_with_one_products_query(basket):
+    items = [
+        {"product_id": "p1", "quantity": 2},
+        {"product_id": "p2", "quantity": 1},
+        {"product_id": "p1", "quantity": 3},
+    ]
+    order_items, total = asyncio.run(server.build_order_items(items))
+    assert basket.count("find") == 1
+    assert [(it["product_id"], it["quantity"]) for it in order_items] == [("p1", 2), ("p2", 1), ("p1", 3)]
+    assert total == 30.0 * 5 + 50.0
+
+
+def test_stock_is_checked_against_the_basket_total(basket):
+    # 3 + 3 of p1 exceeds its stock of 5 although each line fits
+    items = [{"product_id": "p1", "quantity": 3}, {"product_id": "p1", "quantity": 3}]
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(server.build_order_items(items))
+    assert e.value.status_code == 400
+
+
+def test_unknown_product_is_404(basket):
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(server.build_order_items([{"product_id": "nope", "quantity": 1}]))
+    assert e.value.status_code == 404
+
+
+@pytest.mark.parametrize("items", [[], [{"product_id": "p1", "quantity": 0}], [{"product_id": "p1", "quantity": -2}]])
+def test_empty_baskets_and_non_positive_quantities_are_400(basket, items):
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(server.build_order_items(items))
+    assert e.value.status_code == 400
+    assert basket.get(id="p1")["stock"] == 5
+
+
+def order(*lines):
+    items = [
+        {"product_id": pid, "product_name": pid, "quantity": qty, "price": 1.0, "total": qty, "seller_id": "s1"}
+        for pid, qty in lines
+    ]
+    return {"id": "o1", "user_id": "u1", "items": items}
+
+
+def stock(fake_db):
+    return {d["id"]: d["stock"] for d in fake_db.products.docs}
+
+
+def test_reservation_is_all_or_nothing(basket, fake_db):
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(server.save_reserved_order(order(("p1", 2), ("p2", 3))))
+    assert e.value.status_code == 400 and "p2" in e.value.detail
+    assert stock(fake_db) == {"p1": 5, "p2": 1}
+    assert fake_db.orders.docs == [] and fake_db.reservations.docs == []
+    assert all("reserved_by" not in d for d in fake_db.products.docs)
+
+
+def test_partial_reservation_restores_only_its_own_lines(basket, fake_db):
+    # p2 is held by another checkout and has too little stock for this one
+    fake_db.products.get(id="p2")["reserved_by"] = ["o-other"]
+    with pytest.raises(HTTPException):
+        asyncio.run(server.reserve_stock("o1", order(("p1", 2), ("p2", 3))["items"]))
+    assert stock(fake_db) == {"p1": 5, "p2": 1}
+    assert fake_db.products.get(id="p2")["reserved_by"] == ["o-other"]
+
+
+def test_failed_order_insert_releases_the_reservation(basket, fake_db):
+    fake_db.orders.fail_next("insert_one", RuntimeError("primary stepped down"))
+    with pytest.raises(RuntimeError):
+        asyncio.run(server.save_reserved_order(order(("p1", 2), ("p2", 1))))
+    assert stock(fake_db) == {"p1": 5, "p2": 1}
+    assert fake_db.reservations.docs == []
+    assert all("reserved_by" not in d for d in fake_db.products.docs)
+
+
+def test_order_is_inserted_only_after_every_line_is_reserved(basket, fake_db):
+    seen = []
+
+    async def at_insert():
+        seen.append(stock(fake_db))
+
+    fake_db.orders.after("insert_one", at_insert)
+    asyncio.run(server.save_reserved_order(order(("p1", 2), ("p2", 1))))
+    assert seen == [{"p1": 3, "p2": 0}]
+    assert [d["id"] for d in fake_db.orders.docs] == ["o1"]
+    assert fake_db.reservations.docs == []
+    assert all("reserved_by" not in d for d in fake_db.products.docs)
+
+
+def test_reservation_markers_never_reach_product_reads(basket, fake_db):
+    fake_db.products.get(id="p1")["reserved_by"] = ["o-secret"]
+    assert "reserved_by" not in asyncio.run(server.load_product("p1"))
+    page = asyncio.run(server.fetch_page(fake_db.products, {}, [("id", 1)], None, 10, server.PRODUCT_PROJECTION))
+    items = asyncio.run(server.load_products(None, None, None, None, True, None, 10, None, None, "id", False, 0.3, False))
+    assert all("reserved_by" not in d for d in page["items"] + items)
+
+
+def test_sweep_settles_checkouts_that_never_finished(basket, fake_db):
+    async def crash_after_reserve(order_id, lines):
+        await server.reserve_stock(order_id, order(*lines)["items"])
+
+    asyncio.run(crash_after_reserve("o-lost", [("p1", 2)]))
+    asyncio.run(crash_after_reserve("o-saved", [("p2", 1)]))
+    fake_db.orders.seed({"id": "o-saved"})
+    assert asyncio.run(server.sweep_reservations(older_than=60)) == 0
+
+    assert asyncio.run(server.sweep_reservations(older_than=-1)) == 2
+    # the lost checkout's stock comes back; the saved order keeps its stock
+    assert stock(fake_db) == {"p1": 5, "p2": 0}
+    assert fake_db.reservations.docs == []
+    assert all("reserved_by" not in d for d in fake_db.products.docs)
@@ -0,0 +1,112 @@
+import gzip
+import json
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+import server
+from server import CompressionMiddleware, choose_encoding
+
+BIG = [{"id": f"p{i}", "name": "Fresh Milk 500ml"} for i in range(200)]
+
+
+def make_client():
+    app = FastAPI(default_response_class=server.FastJSONResponse)
+
+    @app.get("/big")
+    def big():
+        return BIG
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream():
+        async def chunks():
+            for i in range(3):
+                yield json.dumps(BIG).encode() if i == 1 else b" "
+        return StreamingResponse(chunks(), media_type="application/json")
+
+    @app.get("/events")
+    def events():
+        return StreamingResponse(iter([b"data: 1\n\n" * 500]), media_type="text/event-stream")
+
+    @app.get("/image")
+    def image():
+        return Response(b"\x89PNG" + b"\0" * 5000, media_type="image/png")
+
+    @app.get("/text")
+    def text():
+        return PlainTextResponse("milk " * 1000)
+
+    app.add_middleware(CompressionMiddleware)
+    return TestClient(app)
+
+
+def test_choose_encoding():
+    assert choose_encoding("") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("*") == ("br" if server.brotli else "gzip")
+    assert choose_encoding("br;q=0, gzip") == "gzip"
+    assert choose_encoding("GZIP;q=0.5") == "gzip"
+    assert choose_encoding("br") == ("br" if server.brotli else None)
+
+
+def test_large_json_is_gzipped_with_vary_and_length():
+    client = make_client()
+    # httpx decodes for us; check the wire headers and the decoded body
+    r = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in r.headers["vary"]
+    assert int(r.headers["content-length"]) < len(json.dumps(BIG))
+    assert r.json() == BIG
+
+
+def test_small_and_binary_and_event_streams_pass_through():
+    client = make_client()
+    for path in ("/small", "/image", "/events"):
+        r = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in r.headers, path
+    r = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers and r.json() == BIG
+
+
+def test_streamed_bodies_are_compressed_chunk_by_chunk():
+    client = make_client()
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as r:
+        assert r.headers["content-encoding"] == "gzip"
+        assert "content-length" not in r.headers
+        raw = b"".join(r.iter_raw())
+    assert json.loads(gzip.decompress(raw)) == BIG
+    r = client.get("/text", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip" and r.text == "milk " * 1000
+
+
+@pytest.mark.skipif(server.brotli is None, reason="brotli not installed")
+def test_brotli_is_preferred_when_available():
+    client = make_client()
+    with client.stream("GET", "/big", headers={"Accept-Encoding": "gzip, br"}) as r:
+        raw = b"".join(r.iter_raw())
+    assert r.headers["content-encoding"] == "br"
+    assert json.loads(server.brotli.decompress(raw)) == BIG
+
+
+def test_large_chunks_compress_on_the_pool(monkeypatch):
+    threads = []
+    compress_chunk = server.compress_chunk
+
+    def tracked(*args):
+        threads.append(threading.current_thread().name)
+        return compress_chunk(*args)
+
+    monkeypatch.setattr(server, "compress_chunk", tracked)
+    monkeypatch.setattr(server, "COMPRESS_OFFLOAD_SIZE", 100)
+    r = make_client().get("/big", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip" and r.json() == BIG
+    assert threads and threads[0].startswith("compress")
@@ -0,0 +1,130 @@
+import asyncio
+
+import orjson
+from fastapi import Request, Response
+from fastapi.testclient import TestClient
+
+import server
+from server import TTLCache
+
+
+def test_etag_reads_mongo_once_per_ttl(fake_db):
+    fake_db.catalog_versions.seed({"_id": "products", "epoch": "e1", "v": 7})
+    fake_db.catalog_versions.after("find_one", lambda: asyncio.sleep(0))
+
+    async def scenario():
+        tags = await asyncio.gather(*[server.catalog_etag("products") for _ in range(20)])
+        tags.append(await server.catalog_etag("products"))
+        return tags
+
+    assert set(asyncio.run(scenario())) == {'W/"products.e1.7"'}
+    assert fake_db.catalog_versions.count("find_one") == 1
+
+
+def test_own_bump_changes_the_tag_without_a_read(fake_db):
+    async def scenario():
+        before = await server.catalog_etag("products")
+        await server.bump_catalog_version("products")
+        return before, await server.catalog_etag("products")
+
+    before, after = asyncio.run(scenario())
+    epoch = fake_db.catalog_versions.get(_id="products")["epoch"]
+    assert (before, after) == ('W/"products.0.0"', f'W/"products.{epoch}.1"')
+    assert fake_db.catalog_versions.count("find_one") == 1
+
+
+def test_other_workers_bumps_show_after_the_ttl(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "catalog_versions", TTLCache(16, 0))
+    fake_db.catalog_versions.seed({"_id": "products", "epoch": "e1", "v": 1})
+    assert asyncio.run(server.catalog_etag("products")) == 'W/"products.e1.1"'
+    fake_db.catalog_versions.get(_id="products")["v"] = 2
+    assert asyncio.run(server.catalog_etag("products")) == 'W/"products.e1.2"'
+
+
+def test_late_read_never_steps_the_version_back(fake_db):
+    server.remember_catalog_version("products", {"epoch": "e1", "v": 5})
+    assert server.remember_catalog_version("products", {"epoch": "e1", "v": 4}) == ("e1", 5)
+    # a recreated database starts a new epoch, which always wins
+    assert server.remember_catalog_version("products", {"epoch": "e2", "v": 1}) == ("e2", 1)
+
+
+def request(etag=None):
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def list_products(req):
+    response = Response()
+    return asyncio.create_task(server.get_products(
+        req, response, limit=1000, similarity=0.3, available_only=True,
+    )), response
+
+
+def test_product_tag_describes_the_body_sent(fake_db):
+    fake_db.products.seed({"id": "p1", "name": "Milk", "stock": 5})
+    client = TestClient(server.app)
+    first = client.get("/api/products/p1")
+    assert first.headers["etag"] == server.body_etag(first.json())
+
+    # this worker's cache still holds stock 5 after another worker's write:
+    # the tag follows the copy served, so clients can't pin the old body
+    # under a newer version
+    fake_db.products.get(id="p1")["stock"] = 4
+    asyncio.run(server.bump_catalog_version("products"))
+    again = client.get("/api/products/p1", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+
+    asyncio.run(server.product_cache.evict(["p1"]))
+    fresh = client.get("/api/products/p1", headers={"If-None-Match": first.headers["etag"]})
+    assert fresh.status_code == 200 and fresh.json()["stock"] == 4
+    assert fresh.headers["etag"] == server.body_etag(fresh.json())
+
+
+def test_listing_after_a_write_never_joins_an_older_flight(fake_db):
+    fake_db.products.seed({"id": "p1", "name": "Milk", "stock": 5})
+    gate = asyncio.Event()
+    reads = []
+
+    async def first_read_waits():
+        reads.append(1)
+        if len(reads) == 1:
+            await gate.wait()
+
+    fake_db.products.after("find", first_read_waits)
+
+    async def scenario():
+        before, before_response = list_products(request())
+        while not reads:
+            await asyncio.sleep(0)
+        # a write lands on this worker while the first listing is in flight
+        fake_db.products.get(id="p1")["stock"] = 4
+        await server.bump_catalog_version("products")
+        after, after_response = list_products(request())
+        # a joined flight would only finish once the gate opens
+        asyncio.get_running_loop().call_later(0.05, gate.set)
+        return (await before, before_response), (await after, after_response)
+
+    (old, old_response), (new, new_response) = asyncio.run(scenario())
+    assert orjson.loads(old.body)[0]["stock"] == 5
+    assert orjson.loads(new.body)[0]["stock"] == 4
+    assert old.headers["etag"] != new.headers["etag"]
+    assert len(reads) == 2
+
+
+def test_stock_only_writes_bump_the_listing_version_once_per_window(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "stock_bumps", server.DeferredVersionBumps(0.01))
+
+    async def scenario():
+        before = await server.catalog_etag("products")
+        for _ in range(5):
+            await server.invalidate_products(["p1"], listing_changed=False)
+        unchanged = await server.catalog_etag("products")
+        await asyncio.sleep(0.05)
+        return before, unchanged, await server.catalog_etag("products")
+
+    before, unchanged, after = asyncio.run(scenario())
+    assert before == unchanged != after
+    assert fake_db.catalog_versions.count("find_one_and_update") == 1
+
+    asyncio.run(server.invalidate_products(["p1"]))
+    assert fake_db.catalog_versions.count("find_one_and_update") == 2
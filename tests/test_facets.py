@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+import server
+
+
+def seed(fake_db):
+    fake_db.products.seed(
+        {"id": "p1", "category_id": "c1", "price": 60.0, "stock": 5},
+        {"id": "p2", "category_id": "c1", "price": 70.0, "stock": 0},
+        {"id": "p3", "category_id": "c1", "price": 8000.0, "stock": 2},
+        {"id": "p4", "category_id": "c2", "price": 20.0, "stock": 1},
+        {"id": "p5", "category_id": "c2", "price": 5.0, "stock": 3},
+    )
+
+
+def test_each_facet_ignores_the_filter_on_its_own_field(fake_db):
+    seed(fake_db)
+    facets = asyncio.run(server.product_facets({"category_id": "c1", "price": {"$gte": 10}}, None))
+    # categories ignore category_id: every product priced >= 10
+    assert facets["categories"] == [{"category_id": "c1", "count": 3}, {"category_id": "c2", "count": 1}]
+    # price bands ignore price: every c1 product
+    assert facets["price_bands"] == [{"min": 50, "max": 100, "count": 2}, {"min": None, "max": None, "count": 1}]
+    # stock counts apply both filters
+    assert (facets["in_stock"], facets["total"]) == (2, 3)
+
+
+def test_facets_are_cached_per_filter_set(fake_db):
+    seed(fake_db)
+    filters = {"category_id": "c1", "price": {"$gte": 10}}
+    first = asyncio.run(server.product_facets(filters, None))
+    assert asyncio.run(server.product_facets(dict(reversed(filters.items())), None)) == first
+    assert fake_db.products.count("aggregate") == 1
+
+
+
+def test_product_writes_leave_facets_to_expire_on_the_ttl(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "facet_cache", server.TTLCache(100, 0.05))
+    seed(fake_db)
+    filters = {"category_id": "c1"}
+    asyncio.run(server.product_facets(filters, None))
+
+    asyncio.run(server.invalidate_products(["p1"]))
+    asyncio.run(server.product_facets(filters, None))
+    assert fake_db.products.count("aggregate") == 1
+
+    time.sleep(0.06)
+    asyncio.run(server.product_facets(filters, None))
+    assert fake_db.products.count("aggregate") == 2
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+import server
+from server import GoogleTokenVerifier, StaticKeySource
+
+CLIENT_ID = "client.apps.googleusercontent.com"
+
+
+class CountingKeySource(StaticKeySource):
+    def __init__(self, keys, max_age=3600):
+        super().__init__(keys, max_age)
+        self.fetches = 0
+
+    async def fetch(self):
+        self.fetches += 1
+        return await super().fetch()
+
+
+@pytest.fixture(scope="module")
+def keys():
+    return {kid: rsa.generate_private_key(public_exponent=65537, key_size=2048) for kid in ("k1", "k2")}
+
+
+def sign(private_key, kid, **claims):
+    payload = {
+        "iss": "https://accounts.google.com",
+        "aud": CLIENT_ID,
+        "sub": "123",
+        "email": "a@example.com",
+        "exp": int(time.time()) + 600,
+        **claims,
+    }
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+def test_keys_are_fetched_once_for_many_verifications(keys):
+    source = CountingKeySource({"k1": keys["k1"].public_key()})
+    verifier = GoogleTokenVerifier(source, CLIENT_ID)
+    token = sign(keys["k1"], "k1")
+
+    async def scenario():
+        return await asyncio.gather(*[verifier.verify(token) for _ in range(10)])
+
+    claims = asyncio.run(scenario())
+    assert all(c["email"] == "a@example.com" for c in claims)
+    assert source.fetches == 1
+
+
+def test_wrong_audience_and_bad_signature_are_rejected(keys):
+    verifier = GoogleTokenVerifier(StaticKeySource({"k1": keys["k1"].public_key()}), CLIENT_ID)
+    with pytest.raises(jwt.InvalidAudienceError):
+        asyncio.run(verifier.verify(sign(keys["k1"], "k1", aud="someone-else")))
+    with pytest.raises(jwt.InvalidSignatureError):
+        asyncio.run(verifier.verify(sign(keys["k2"], "k1")))
+
+
+def test_unknown_kid_refetches_at_most_once_per_interval(keys):
+    source = CountingKeySource({"k1": keys["k1"].public_key()})
+    verifier = GoogleTokenVerifier(source, CLIENT_ID, min_refetch_seconds=3600)
+    asyncio.run(verifier.verify(sign(keys["k1"], "k1")))
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            asyncio.run(verifier.verify(sign(keys["k2"], "k2")))
+    assert source.fetches == 1
+
+
+def test_rotated_key_is_picked_up(keys):
+    source = CountingKeySource({"k1": keys["k1"].public_key()})
+    verifier = GoogleTokenVerifier(source, CLIENT_ID, min_refetch_seconds=0)
+    asyncio.run(verifier.verify(sign(keys["k1"], "k1")))
+    source._keys = {"k2": keys["k2"].public_key()}
+    assert asyncio.run(verifier.verify(sign(keys["k2"], "k2")))["sub"] == "123"
+    assert source.fetches == 2
+
+
+def test_keys_expire_after_the_reported_max_age(keys):
+    source = CountingKeySource({"k1": keys["k1"].public_key()}, max_age=0)
+    verifier = GoogleTokenVerifier(source, CLIENT_ID)
+    token = sign(keys["k1"], "k1")
+    asyncio.run(verifier.verify(token))
+    asyncio.run(verifier.verify(token))
+    assert source.fetches == 2
+
+
+def test_cache_max_age():
+    assert server.cache_max_age("public, max-age=19845, must-revalidate") == 19845
+    assert server.cache_max_age(None) == 300
+
+
+def test_verify_google_token_checks_issuer(keys, monkeypatch):
+    verifier = GoogleTokenVerifier(StaticKeySource({"k1": keys["k1"].public_key()}), CLIENT_ID)
+    monkeypatch.setattr(server, "google_verifier", verifier)
+    user = asyncio.run(server.verify_google_token(sign(keys["k1"], "k1", name="A")))
+    assert user == {"email": "a@example.com", "name": "A", "google_id": "123", "picture": ""}
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(server.verify_google_token(sign(keys["k1"], "k1", iss="evil.example.com")))
+    assert e.value.status_code == 401
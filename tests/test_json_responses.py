@@ -0,0 +1,38 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from fastapi.responses import Response
+
+import server
+
+
+def test_fast_json_encodes_mongo_types_and_keeps_headers():
+    response = Response()
+    response.headers["ETag"] = 'W/"products.e1.3"'
+    oid = ObjectId()
+    when = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    rendered = server.fast_json({"_id": oid, "at": when, 1: "x"}, response)
+    assert json.loads(rendered.body) == {"_id": str(oid), "at": "2024-05-01T12:00:00+00:00", "1": "x"}
+    assert rendered.headers["etag"] == 'W/"products.e1.3"'
+    assert rendered.headers["content-length"] == str(len(rendered.body))
+
+
+def collect(docs, chunk_size):
+    async def source():
+        for doc in docs:
+            yield doc
+
+    async def run():
+        return [chunk async for chunk in server.StreamingJSONArray.encode(source(), chunk_size)]
+    return asyncio.run(run())
+
+
+def test_streamed_array_is_valid_json_in_bounded_chunks():
+    assert collect([], 64) == [b"[]"]
+    docs = [{"id": f"p{i}", "name": "x" * 20} for i in range(50)]
+    chunks = collect(docs, 256)
+    assert len(chunks) > 1
+    assert all(len(c) < 256 + 64 for c in chunks)
+    assert json.loads(b"".join(chunks)) == docs
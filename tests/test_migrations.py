@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import server
+
+
+@pytest.fixture
+def migrations(fake_db, monkeypatch):
+    runs = []
+
+    def migration(name):
+        async def migrate():
+            runs.append(name)
+            await asyncio.sleep(0)
+            return 1
+        return name, migrate
+
+    monkeypatch.setattr(server, "MIGRATIONS", [migration("a"), migration("b")])
+    return runs
+
+
+def test_concurrent_workers_run_each_migration_once(fake_db, migrations):
+    async def two_workers():
+        await asyncio.gather(server.run_migrations(), server.run_migrations())
+
+    asyncio.run(two_workers())
+    assert sorted(migrations) == ["a", "b"]
+    assert {d["id"]: d["state"] for d in fake_db.migrations.docs} == {"a": "applied", "b": "applied"}
+    asyncio.run(server.run_migrations())
+    assert sorted(migrations) == ["a", "b"]
+
+
+def test_losing_a_claim_race_skips_only_that_migration(fake_db, migrations):
+    fake_db.migrations.fail_next("find_one_and_update", DuplicateKeyError("E11000"))
+    asyncio.run(server.run_migrations())
+    assert migrations == ["b"]
+
+
+def test_failed_migration_drops_its_claim_for_a_retry(fake_db, monkeypatch):
+    async def broken():
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(server, "MIGRATIONS", [("broken", broken)])
+    with pytest.raises(RuntimeError):
+        asyncio.run(server.run_migrations())
+    assert fake_db.migrations.docs == []
+
+
+def test_product_types_are_coerced_in_batches(fake_db):
+    fake_db.products.seed(
+        {"id": "p1", "price": "12.5", "stock": "7", "rating": 4},
+        {"id": "p2", "price": "n/a", "stock": -3},
+        {"id": "p3", "price": 9.0, "stock": 2.0, "rating": "4.5"},
+        {"id": "typed", "price": 20.0, "stock": 1, "rating": 3.5},
+    )
+
+    changed = asyncio.run(server.migrate_product_types(batch_size=2))
+
+    assert changed == 3
+    fields = {d["id"]: (d["price"], d["stock"], d["rating"]) for d in fake_db.products.docs}
+    assert fields == {
+        "p1": (12.5, 7, 4.0),
+        "p2": (0.0, 0, 0.0),
+        "p3": (9.0, 2, 4.5),
+        "typed": (20.0, 1, 3.5),
+    }
+    assert all(type(d["stock"]) is int and type(d["price"]) is float for d in fake_db.products.docs)
+    assert fake_db.products.count("update_many") == 2
+    assert asyncio.run(server.migrate_product_types()) == 0
@@ -0,0 +1,60 @@
+import asyncio
+import hashlib
+import hmac
+
+import pytest
+
+import server
+from server import RazorpayVerifyRequest
+
+BASKET = [{"product_id": "p1", "quantity": 2}]
+
+
+@pytest.fixture
+def shop(fake_db):
+    fake_db.users.seed({"id": "user-1", "email": "a@b.c"})
+    fake_db.products.seed({"id": "p1", "name": "Milk", "price": 30.0, "stock": 5, "seller_id": "s1"})
+    fake_db.cart.seed({"user_id": "user-1", "items": BASKET})
+    return fake_db
+
+
+def fail(*args, **kwargs):
+    raise RuntimeError("rollup store unavailable")
+
+
+async def fail_async(*args, **kwargs):
+    fail()
+
+
+def test_order_stands_when_stats_and_events_fail(shop, monkeypatch):
+    monkeypatch.setattr(server, "record_order_stats", fail_async)
+    monkeypatch.setattr(server, "emit_order_deltas", fail_async)
+    order = asyncio.run(server.place_order("user-1", {"items": BASKET, "delivery_address": "12 Market Road"}))
+    assert [o["id"] for o in shop.orders.docs] == [order["id"]]
+    assert shop.cart.docs == []  # a retry finds an empty cart, not a second order
+    assert shop.products.get(id="p1")["stock"] == 3
+
+
+def test_paid_order_stands_when_publishing_fails(shop, monkeypatch):
+    monkeypatch.setattr(server, "payment_gateway", object())
+    monkeypatch.setattr(server, "RAZORPAY_KEY_SECRET", "secret")
+    monkeypatch.setattr(server.event_bus, "publish", fail_async)
+    signature = hmac.new(b"secret", b"order_1|pay_1", hashlib.sha256).hexdigest()
+    payload = RazorpayVerifyRequest(
+        razorpay_order_id="order_1", razorpay_payment_id="pay_1", razorpay_signature=signature,
+        user_id="user-1", items=BASKET, delivery_address="12 Market Road", total_amount=60.0,
+    )
+    result = asyncio.run(server.verify_razorpay_payment(payload))
+    assert result["success"] and len(shop.orders.docs) == 1
+    assert shop.cart.docs == []
+    assert shop.seller_stats.get(id="s1")["sales_orders"] == 1
+
+
+def test_dashboard_stats_leave_units_sold_out(fake_db):
+    fake_db.seller_stats.seed({
+        "id": "s1", "sales_orders": 3, "sales_revenue": 90.0,
+        "units_sold": {f"p{i}": i for i in range(1000)},
+    })
+    stats = asyncio.run(server.get_seller_stats("S1"))
+    assert "units_sold" not in stats
+    assert (stats["sales_orders"], stats["sales_revenue"], stats["products_count"]) == (3, 90.0, 0)
@@ -0,0 +1,64 @@
+import asyncio
+import random
+from functools import cmp_to_key
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def sort_docs(docs, sort):
+    def compare(a, b):
+        for field, direction in sort:
+            if a[field] != b[field]:
+                return direction if a[field] > b[field] else -direction
+        return 0
+    return sorted(docs, key=cmp_to_key(compare))
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    values = [12.5, "2024-01-01T00:00:00+00:00", "p/1"]
+    assert server.decode_cursor(server.encode_cursor(values), 3) == values
+    for bad in ("not-base64!", server.encode_cursor([1, 2]), server.encode_cursor({"a": 1})):
+        with pytest.raises(HTTPException) as e:
+            server.decode_cursor(bad, 3)
+        assert e.value.status_code == 400
+
+
+def test_keyset_filter_shape():
+    assert server.keyset_filter([("price", 1), ("id", 1)], [10, "p5"]) == {"$or": [
+        {"price": {"$gt": 10}},
+        {"price": 10, "id": {"$gt": "p5"}},
+    ]}
+
+
+@pytest.mark.parametrize("sort", [
+    [("price", 1), ("id", 1)],
+    [("price", -1), ("id", 1)],
+    [("rating", -1), ("price", 1), ("id", -1)],
+])
+def test_pages_cover_every_document_once_in_order(fake_db, sort):
+    rng = random.Random(len(sort))
+    docs = [
+        {"id": f"p{i:03d}", "price": rng.choice([10, 20, 30]), "rating": rng.choice([1, 2])}
+        for i in range(97)
+    ]
+    fake_db.products.seed(*docs)
+
+    async def walk():
+        seen, cursor = [], None
+        while True:
+            page = await server.fetch_page(fake_db.products, {}, sort, cursor, 10)
+            seen += page["items"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return seen
+
+    assert asyncio.run(walk()) == sort_docs(docs, sort)
+
+
+def test_page_size_is_clamped():
+    assert server.clamp_page_size(None) == server.PAGE_SIZE_DEFAULT
+    assert server.clamp_page_size(0) == server.PAGE_SIZE_DEFAULT
+    assert server.clamp_page_size(10**6) == server.PAGE_SIZE_MAX
@@ -0,0 +1,30 @@
+import asyncio
+import threading
+
+import server
+
+
+def test_hash_and_verify_run_on_the_password_pool(monkeypatch):
+    monkeypatch.setattr(server, "BCRYPT_ROUNDS", 4)
+    threads = []
+    hashpw = server.bcrypt.hashpw
+
+    def tracked(*args):
+        threads.append(threading.current_thread().name)
+        return hashpw(*args)
+
+    monkeypatch.setattr(server.bcrypt, "hashpw", tracked)
+
+    async def scenario():
+        hashed = await server.hash_password("secret")
+        results = await asyncio.gather(
+            server.verify_password("secret", hashed),
+            server.verify_password("wrong", hashed),
+        )
+        return hashed, results
+
+    hashed, results = asyncio.run(scenario())
+    assert hashed.startswith("$2b$04$")
+    assert results == [True, False]
+    assert threads and all(name.startswith("bcrypt") for name in threads)
+    assert server.password_pool_stats()["pending"] == 0
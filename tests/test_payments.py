@@ -0,0 +1,70 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import fake_razorpay
+import server
+
+
+def gateway(timeout=5.0, max_concurrency=4):
+    return server.RazorpayGateway(
+        "rzp_test_key", "secret", "http://razorpay.test/v1", timeout, max_concurrency,
+        transport=httpx.ASGITransport(app=fake_razorpay.app),
+    )
+
+
+def create_order(monkeypatch, payment_gateway, amount):
+    monkeypatch.setattr(server, "payment_gateway", payment_gateway)
+    payload = server.RazorpayOrderRequest(
+        amount=amount, user_id="u1", items=[{"product_id": "p1", "quantity": 1}], delivery_address="Home",
+    )
+
+    async def scenario():
+        try:
+            return await server.create_razorpay_order(payload)
+        finally:
+            await payment_gateway.close()
+
+    return asyncio.run(scenario())
+
+
+def test_create_order_goes_through_the_gateway(monkeypatch):
+    result = create_order(monkeypatch, gateway(), 249.5)
+
+    assert result["order_id"].startswith("order_")
+    assert result["amount"] == 249.5
+    assert fake_razorpay.orders[result["order_id"]]["amount"] == 24950
+
+
+def test_gateway_rejection_becomes_a_500(monkeypatch):
+    with pytest.raises(HTTPException) as err:
+        create_order(monkeypatch, gateway(), 0.5)
+
+    assert err.value.status_code == 500
+    assert "400" in err.value.detail
+
+
+def test_slow_gateway_becomes_a_504(monkeypatch):
+    monkeypatch.setattr(fake_razorpay, "LATENCY_MS", 500)
+
+    with pytest.raises(HTTPException) as err:
+        create_order(monkeypatch, gateway(timeout=0.05), 10)
+
+    assert err.value.status_code == 504
+
+
+def test_calls_beyond_max_concurrency_wait_for_a_slot(monkeypatch):
+    monkeypatch.setattr(fake_razorpay, "LATENCY_MS", 50)
+    payment_gateway = gateway(max_concurrency=2)
+
+    async def scenario():
+        started = asyncio.get_running_loop().time()
+        orders = await asyncio.gather(*[payment_gateway.create_order(1000, "INR") for _ in range(4)])
+        await payment_gateway.close()
+        return orders, asyncio.get_running_loop().time() - started
+
+    orders, elapsed = asyncio.run(scenario())
+    assert len({o["id"] for o in orders}) == 4
+    assert elapsed >= 0.1
@@ -0,0 +1,42 @@
+import asyncio
+
+import server
+from server import LocalProductCache
+
+
+def test_load_product_caches_when_nothing_changed(fake_db):
+    fake_db.products.seed({"id": "p1", "stock": 5})
+
+    assert asyncio.run(server.load_product("p1")) == {"id": "p1", "stock": 5}
+    assert asyncio.run(server.product_cache.get("p1")) == {"id": "p1", "stock": 5}
+
+
+def test_invalidation_during_read_skips_the_set(fake_db):
+    fake_db.products.seed({"id": "p1", "stock": 5})
+    cache = server.product_cache
+
+    async def write_lands():
+        # the write commits after our read and evicts before we set
+        fake_db.products.get(id="p1")["stock"] = 0
+        await cache.evict(["p1"])
+
+    fake_db.products.after("find_one", write_lands)
+    assert asyncio.run(server.load_product("p1"))["stock"] == 5
+    assert asyncio.run(cache.get("p1")) is None
+    assert asyncio.run(cache.stats())["stale_sets"] == 1
+
+    fake_db.products.after("find_one", None)
+    assert asyncio.run(server.load_product("p1"))["stock"] == 0
+    assert asyncio.run(cache.get("p1"))["stock"] == 0
+
+
+def test_eviction_only_invalidates_its_own_products():
+    cache = LocalProductCache(10, 60)
+
+    async def scenario():
+        generation = await cache.generation("p1")
+        await cache.evict(["p2"])
+        await cache.set("p1", {"id": "p1"}, generation)
+        return await cache.get("p1")
+
+    assert asyncio.run(scenario()) == {"id": "p1"}
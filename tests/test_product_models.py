@@ -0,0 +1,33 @@
+import pytest
+from pydantic import ValidationError
+
+from server import ProductCreate, ProductUpdate
+
+
+def test_create_coerces_typed_fields_and_keeps_the_rest():
+    product = ProductCreate(name="Milk", price="30", stock="5", seller_id="s1")
+    assert product.model_dump() == {
+        "id": None, "price": 30.0, "stock": 5, "rating": 0.0, "name": "Milk", "seller_id": "s1",
+    }
+
+
+@pytest.mark.parametrize("fields", [{"price": -1}, {"stock": -1}, {"rating": -0.5}, {"stock": "lots"}])
+def test_create_rejects_bad_typed_fields(fields):
+    with pytest.raises(ValidationError):
+        ProductCreate(name="Milk", **fields)
+
+
+def test_update_keeps_only_the_fields_sent():
+    assert ProductUpdate(stock="3", name="Oat milk").model_dump(exclude_unset=True) == {"stock": 3, "name": "Oat milk"}
+    assert ProductUpdate().model_dump(exclude_unset=True) == {}
+
+
+@pytest.mark.parametrize("field", ["price", "stock", "rating"])
+def test_update_rejects_null_typed_fields(field):
+    with pytest.raises(ValidationError, match="may be omitted but not null"):
+        ProductUpdate(**{field: None})
+
+
+def test_update_rejects_negative_values():
+    with pytest.raises(ValidationError):
+        ProductUpdate(price=-5)
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import PyMongoError
+
+import server
+
+
+@pytest.fixture
+def wholesale(fake_db):
+    fake_db.products.seed({"id": "w1", "name": "Rice 25kg", "price": 1000.0, "stock": 10, "seller_id": "Wholesaler-1"})
+    return fake_db
+
+
+def purchase(**overrides):
+    payload = {"wholesaler_id": "wholesaler-1", "product_id": "w1", "retailer_id": "r1", "quantity": 4,
+               "markup_percent": 10}
+    payload.update(overrides)
+    return asyncio.run(server.purchase_from_wholesaler(payload))
+
+
+def test_purchase_moves_stock_to_the_retail_listing(wholesale):
+    result = purchase()
+
+    assert result["retail_product_id"] == "r1_w1"
+    assert wholesale.products.get(id="w1")["stock"] == 6
+    listing = wholesale.products.get(id="r1_w1")
+    assert (listing["stock"], listing["price"], listing["seller_id"]) == (4, 1100.0, "r1")
+    assert wholesale.purchases.get(id=result["purchase"]["id"])["wholesaler_id"] == "Wholesaler-1"
+
+
+def test_purchase_from_another_wholesaler_is_rejected(wholesale):
+    with pytest.raises(HTTPException) as err:
+        purchase(wholesaler_id="wholesaler-2")
+
+    assert (err.value.status_code, err.value.detail) == (400, "Product does not belong to this wholesaler")
+    assert wholesale.products.get(id="w1")["stock"] == 10
+    assert wholesale.purchases.docs == []
+
+
+def test_insufficient_stock_leaves_everything_untouched(wholesale):
+    with pytest.raises(HTTPException) as err:
+        purchase(quantity=11)
+
+    assert err.value.status_code == 400
+    assert wholesale.products.get(id="w1")["stock"] == 10
+    assert wholesale.products.get(id="r1_w1") is None
+
+
+def test_failed_purchase_record_gives_the_stock_back(wholesale):
+    asyncio.run(server.load_product("w1"))  # cached at stock 10, then evicted by the restore
+    wholesale.purchases.fail_next("insert_one", PyMongoError("primary stepped down"))
+
+    with pytest.raises(PyMongoError):
+        purchase()
+
+    assert wholesale.products.get(id="w1")["stock"] == 10
+    assert wholesale.products.get(id="r1_w1") is None
+    assert asyncio.run(server.product_cache.get("w1")) is None
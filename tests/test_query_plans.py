@@ -0,0 +1,38 @@
+"""Hot query shapes must be served by an index from INDEX_CATALOGUE.
+
+The explain check needs a real MongoDB: set TEST_MONGO_URL (a throwaway
+database is created and dropped). It is the same check as
+`python server.py check-query-plans`.
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+
+TEST_MONGO_URL = os.getenv("TEST_MONGO_URL")
+
+
+def test_hot_queries_target_catalogued_collections():
+    for coll, _, _ in server.HOT_QUERIES:
+        assert coll in server.INDEX_CATALOGUE, coll
+
+
+@pytest.mark.skipif(not TEST_MONGO_URL, reason="TEST_MONGO_URL not set")
+def test_hot_queries_avoid_collscan(monkeypatch):
+    async def run():
+        client = AsyncIOMotorClient(TEST_MONGO_URL)
+        name = f"test_plans_{uuid.uuid4().hex[:8]}"
+        monkeypatch.setattr(server, "db", client[name])
+        try:
+            await server.ensure_indexes()
+            assert await server.diff_indexes() == {}
+            return await server.check_query_plans()
+        finally:
+            await client.drop_database(name)
+            client.close()
+
+    assert asyncio.run(run())
@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+import server
+from server import WebSocketHub
+
+
+class FakeSocket:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+        self.closed = False
+
+    async def send_text(self, message):
+        if self.fail:
+            raise RuntimeError("connection reset")
+        self.sent.append(json.loads(message))
+
+    async def close(self):
+        self.closed = True
+
+
+def test_events_reach_only_the_sellers_subscribers():
+    hub = WebSocketHub(10)
+    a, b = hub.connect(FakeSocket()), hub.connect(FakeSocket())
+    hub.subscribe(a, "s1")
+    hub.subscribe(b, "s2")
+    hub.publish("s1", {"type": "new_order", "order_id": "o1"})
+    hub.publish("nobody", {"type": "new_order", "order_id": "o2"})
+    assert a.queue.qsize() == 1 and b.queue.qsize() == 0
+    assert hub.stats()["delivered"] == 1 and hub.stats()["published"] == 2
+
+    hub.disconnect(a)
+    hub.publish("s1", {"type": "new_order", "order_id": "o3"})
+    assert hub.stats()["connections"] == 1 and hub.stats()["sellers"] == 1
+
+
+def test_slow_subscriber_drops_oldest():
+    hub = WebSocketHub(2)
+    sub = hub.connect(FakeSocket())
+    hub.subscribe(sub, "s1")
+    for i in range(5):
+        hub.publish("s1", {"order_id": i})
+    assert [json.loads(sub.queue.get_nowait())["order_id"] for _ in range(2)] == [3, 4]
+    assert hub.stats()["dropped"] == 3
+
+
+def test_pump_delivers_in_order_and_drops_dead_sockets():
+    hub = WebSocketHub(10)
+
+    async def scenario():
+        live, dead = hub.connect(FakeSocket()), hub.connect(FakeSocket(fail=True))
+        hub.subscribe(live, "s1")
+        hub.subscribe(dead, "s1")
+        pumps = [asyncio.create_task(sub.pump(hub)) for sub in (live, dead)]
+        for i in range(3):
+            hub.publish("s1", {"order_id": i})
+        await asyncio.sleep(0.01)
+        pumps[0].cancel()
+        await asyncio.wait_for(pumps[1], 1)  # returns once its send fails
+        return live, dead
+
+    live, dead = asyncio.run(scenario())
+    assert [m["order_id"] for m in live.ws.sent] == [0, 1, 2]
+    assert dead.ws.closed
+    assert hub.stats()["connections"] == 1
+    left = dead.queue.qsize()
+    hub.publish("s1", {"order_id": 3})
+    assert dead.queue.qsize() == left
+
+
+def test_order_events_are_split_per_seller():
+    order = {"id": "o1", "items": [
+        {"seller_id": "s1", "total": 10.0, "quantity": 1},
+        {"seller_id": "s2", "total": 5.0, "quantity": 2},
+        {"seller_id": "s1", "total": 4.0, "quantity": 3},
+    ]}
+    events = server.order_events(order)
+    assert events["s1"]["revenue"] == 14.0 and events["s1"]["items_count"] == 4
+    assert events["s2"]["sellers"] == ["s2"]
+
+
+def new_order(order_id, seller_id="s1", total=10.0):
+    return {"id": order_id, "items": [{"seller_id": seller_id, "total": total, "quantity": 1}]}
+
+
+def test_coalescer_merges_a_burst_into_one_event():
+    hub = WebSocketHub(10)
+    sub = hub.connect(FakeSocket())
+    hub.subscribe(sub, "s1")
+
+    async def scenario():
+        coalescer = server.EventCoalescer(hub, window_ms=20)
+        for i in range(100):
+            for seller_id, event in server.order_events(new_order(f"o{i}")).items():
+                coalescer.add(seller_id, event)
+        assert sub.queue.empty()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert sub.queue.qsize() == 1
+    event = json.loads(sub.queue.get_nowait())
+    assert event["orders_count"] == 100 and event["revenue"] == 1000.0
+    assert event["order_id"] == "o99"
+    assert len(event["order_ids"]) == server.EventCoalescer.MAX_IDS
+
+
+def test_workers_sharing_a_broker_all_fan_out():
+    broker = server.LocalBroker()
+
+    def worker():
+        hub = WebSocketHub(10)
+        coalescer = server.EventCoalescer(hub, window_ms=0)
+        bus = server.InProcessEventBus(broker)
+        sub = hub.connect(FakeSocket())
+        hub.subscribe(sub, "s1")
+
+        def sink(collection, doc):
+            for seller_id, event in server.EVENT_SOURCES[collection](doc).items():
+                coalescer.add(seller_id, event)
+        return bus, sink, sub
+
+    async def scenario():
+        workers = [worker() for _ in range(3)]
+        for bus, sink, _ in workers:
+            await bus.start(sink)
+        # the order is placed on worker 0 only
+        await workers[0][0].publish("orders", new_order("o1"))
+        await asyncio.sleep(0.01)
+        await workers[2][0].stop()
+        await workers[0][0].publish("orders", new_order("o2"))
+        await asyncio.sleep(0.01)
+        return [[json.loads(m)["order_ids"] for m in list(sub.queue._queue)] for _, _, sub in workers]
+
+    assert asyncio.run(scenario()) == [[["o1"], ["o2"]], [["o1"], ["o2"]], [["o1"]]]
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+import server
+from server import SellerStreams, SeqOrder
+
+
+class Request:
+    async def is_disconnected(self):
+        return False
+
+
+@pytest.fixture
+def streams(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "seller_streams", SellerStreams(100))
+    monkeypatch.setattr(server, "SSE_GAP_WAIT_SECONDS", 0.01)
+    return server.seller_streams
+
+
+def seed_events(fake_db, seller_id, seqs):
+    fake_db.seller_events.seed(*[{"seller_id": seller_id, "seq": seq, "revenue_added": seq} for seq in seqs])
+    fake_db.counters.seed({"_id": server.seller_seq_key(seller_id), "seq": max(seqs)})
+
+
+def event(seq, seller_id="s1"):
+    return {"seller_id": seller_id, "seq": seq, "revenue_added": seq}
+
+
+def read(last_event_id=None, count=1, before=None):
+    """The first `count` event frames, as ids or "reset" """
+    async def run():
+        response = await server.stream_seller("s1", Request(), last_event_id)
+        if before:
+            before()
+        out = []
+        try:
+            async for chunk in response.body_iterator:
+                if chunk.startswith("event: reset"):
+                    out.append("reset")
+                elif chunk.startswith("id: "):
+                    out.append(int(chunk.split("\n")[0][4:]))
+                if len(out) == count:
+                    break
+        finally:
+            await response.body_iterator.aclose()
+        return out
+    return asyncio.run(asyncio.wait_for(run(), 5))
+
+
+def test_reconnect_replays_after_the_last_seq(fake_db, streams):
+    seed_events(fake_db, "s1", range(1, 6))
+    seed_events(fake_db, "s2", range(1, 9))
+    assert read("2", count=3) == [3, 4, 5]
+
+
+def test_events_landing_during_replay_are_sent_once(fake_db, streams):
+    seed_events(fake_db, "s1", range(1, 6))
+
+    def live():
+        for seq in (4, 5, 6):
+            streams.push(event(seq))
+
+    assert read("2", count=4, before=live) == [3, 4, 5, 6]
+
+
+def test_live_events_go_out_in_seq_order(fake_db, streams):
+    def live():
+        for seq in (2, 1, 1, 3):
+            streams.push(event(seq))
+
+    assert read(count=3, before=live) == [1, 2, 3]
+
+
+def test_a_missing_seq_is_fetched_or_skipped_after_the_gap_wait(fake_db, streams):
+    # seq 2 was inserted but its bus message never arrived; 3 never existed
+    seed_events(fake_db, "s1", [2])
+    fake_db.counters.get(_id=server.seller_seq_key("s1"))["seq"] = 1
+
+    def live():
+        streams.push(event(4))
+
+    assert read(count=2, before=live) == [2, 4]
+
+
+@pytest.mark.parametrize("last_event_id, seqs", [
+    ("0", range(1, 8)),        # more than SSE_MAX_REPLAY behind
+    ("2", range(6, 9)),        # 3..5 already overwritten in the capped collection
+    ("50", range(1, 4)),       # an id from before the counter was reset
+    ("65f0c0ffee", range(1, 4)),  # not a seq at all
+])
+def test_unreplayable_gaps_reset_the_client(fake_db, streams, monkeypatch, last_event_id, seqs):
+    monkeypatch.setattr(server, "SSE_MAX_REPLAY", 5)
+    seed_events(fake_db, "s1", seqs)
+    assert read(last_event_id) == ["reset"]
+
+
+def test_an_overflowed_listener_ends_the_stream_after_draining(fake_db, monkeypatch):
+    monkeypatch.setattr(server, "seller_streams", SellerStreams(2))
+
+    def burst():
+        for seq in range(1, 6):
+            server.seller_streams.push(event(seq))
+
+    # only what fit in the queue goes out, then the stream closes so the
+    # client reconnects and replays the rest
+    assert read(count=10, before=burst) == [1, 2]
+
+
+def test_emitted_deltas_number_each_sellers_events(fake_db):
+    fake_db.products.seed({"id": "p1", "stock": 50, "seller_id": "s1"}, {"id": "p2", "stock": 50, "seller_id": "s2"})
+
+    def order(*sellers):
+        return {"id": "o", "items": [
+            {"product_id": f"p{s[-1]}", "seller_id": s, "total": 10.0, "quantity": 1} for s in sellers
+        ]}
+
+    async def scenario():
+        await server.emit_order_deltas(order("s1", "s2"))
+        await server.emit_order_deltas(order("s1"))
+
+    asyncio.run(scenario())
+    seqs = [(d["seller_id"], d["seq"]) for d in fake_db.seller_events.docs]
+    assert sorted(seqs) == [("s1", 1), ("s1", 2), ("s2", 1)]
+
+
+def test_seq_order_holds_events_behind_a_gap():
+    order = SeqOrder(0)
+    assert order.accept(event(2)) == [] and order.waiting
+    assert [d["seq"] for d in order.accept(event(1))] == [1, 2]
+    assert order.accept(event(2)) == []
+    order.accept(event(5))
+    assert [d["seq"] for d in order.skip_gap()] == [5] and order.last == 5
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from server import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"id": "p1"}
+
+    async def scenario():
+        results = await asyncio.gather(*[flights.do(("product", "p1"), load) for _ in range(10)])
+        await flights.do(("product", "p1"), load)  # after completion: a fresh call
+        await flights.do(("product", "p2"), load)
+        return results
+
+    results = asyncio.run(scenario())
+    assert calls == 3
+    assert all(r is results[0] for r in results)
+    assert flights.stats() == {
+        "inflight": 0,
+        "endpoints": {"product": {"calls": 3, "coalesced": 9, "fan_in": 4.0}},
+    }
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    flights = SingleFlight()
+    attempts = 0
+
+    async def load():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0.01)
+        if attempts == 1:
+            raise LookupError("missing")
+        return "ok"
+
+    async def scenario():
+        results = await asyncio.gather(*[flights.do(("k",), load) for _ in range(3)], return_exceptions=True)
+        return results, await flights.do(("k",), load)
+
+    results, retried = asyncio.run(scenario())
+    assert all(isinstance(r, LookupError) for r in results)
+    assert retried == "ok"
+
+
+def test_a_cancelled_waiter_does_not_cancel_the_others():
+    flights = SingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.02)
+        return 42
+
+    async def scenario():
+        first = asyncio.create_task(flights.do(("k",), load))
+        second = asyncio.create_task(flights.do(("k",), load))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == 42
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+import server
+from server import PrefixIndex
+
+
+def brute_force(index, prefix, k):
+    prefix = index.normalize(prefix)[:index.max_depth]
+    hits = sorted(
+        (tuple(-x for x in rank) + (key,), key)
+        for key, (rank, _, terms) in index._entries.items()
+        if any(term[:index.max_depth].startswith(prefix) for term in terms)
+    )
+    return [index._entries[key][1] for _, key in hits[:min(k, index.cap)]]
+
+
+def test_word_prefixes_match_inside_labels():
+    index = PrefixIndex()
+    index.upsert("p1", "Fresh Milk", (1, 4.5), {"id": "p1"})
+    index.upsert("p2", "Milk Bread", (1, 3.0), {"id": "p2"})
+    assert index.suggest("mil") == [{"id": "p1"}, {"id": "p2"}]
+    assert index.suggest("fresh m") == [{"id": "p1"}]
+    assert index.suggest("xyz") == []
+
+
+def test_removing_top_entry_refills_from_the_rest():
+    index = PrefixIndex(cap=3)
+    for i in range(10):
+        index.upsert(f"p{i}", f"apple {i}", (i,), {"id": f"p{i}"})
+    assert [p["id"] for p in index.suggest("a")] == ["p9", "p8", "p7"]
+    index.remove("p9")
+    index.upsert("p8", "banana", (8,), {"id": "p8"})
+    assert [p["id"] for p in index.suggest("a")] == ["p7", "p6", "p5"]
+    assert [p["id"] for p in index.suggest("b")] == ["p8"]
+
+
+@pytest.mark.parametrize("cap,max_depth", [(5, 4), (3, 32), (1, 3)])
+def test_matches_brute_force_under_random_edits(cap, max_depth):
+    rng = random.Random(cap * 100 + max_depth)
+    words = ["apple", "apricot", "milk", "milky", "bread", "brown", "ab", "a", "fresh", "fr"]
+    index = PrefixIndex(cap=cap, max_depth=max_depth)
+    for step in range(1500):
+        key = f"k{rng.randrange(80)}"
+        if rng.random() < 0.3:
+            index.remove(key)
+        else:
+            label = " ".join(rng.choices(words, k=rng.randint(1, 3)))
+            index.upsert(key, label, (rng.randint(0, 1), rng.randint(0, 5)), {"id": key})
+        if step % 10 == 0:
+            for prefix in ("a", "ap", "fr", "m", "b", "apple", "fresh m", "x"):
+                assert index.suggest(prefix, 5) == brute_force(index, prefix, 5), (step, prefix)
+
+
+def test_catalog_events_update_search_indexes(monkeypatch):
+    monkeypatch.setattr(server, "product_suggest", PrefixIndex())
+    monkeypatch.setattr(server, "product_trigrams", server.TrigramIndex())
+    server.apply_catalog_event({"kind": "product", "id": "p1", "name": "Basmati Rice", "stock": 5, "rating": 4.0})
+    assert [p["id"] for p in server.product_suggest.suggest("bas")] == ["p1"]
+    server.apply_catalog_event({"kind": "product", "id": "p1", "deleted": True})
+    assert server.product_suggest.suggest("bas") == []
+    assert len(server.product_trigrams) == 0
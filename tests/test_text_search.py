@@ -0,0 +1,39 @@
+import asyncio
+
+import server
+
+NAMES = ["Milk", "Milk Powder", "Fresh Milk Milk", "Bread", "Milk Bread", "Toned Milk"]
+
+
+def seed(fake_db):
+    fake_db.products.seed(*[
+        {"id": f"p{i}", "name": name, "description": "", "stock": 0 if name == "Toned Milk" else 5}
+        for i, name in enumerate(NAMES)
+    ])
+
+
+def test_search_ranks_by_relevance_and_applies_filters(fake_db):
+    seed(fake_db)
+    page = asyncio.run(server.search_products({"stock": {"$gt": 0}}, "milk", None, 10))
+    names = [d["name"] for d in page["items"]]
+    assert names[0] == "Fresh Milk Milk"
+    assert set(names) == {"Milk", "Milk Powder", "Fresh Milk Milk", "Milk Bread"}
+    assert all("_id" not in d for d in page["items"])
+    assert page["next_cursor"] is None
+
+
+def test_cursor_pages_cover_every_hit_once_in_rank_order(fake_db):
+    seed(fake_db)
+    everything = asyncio.run(server.search_products({}, "milk", None, 10))["items"]
+
+    async def walk():
+        seen, cursor = [], None
+        while True:
+            page = await server.search_products({}, "milk", cursor, 2)
+            seen += page["items"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return seen
+
+    assert [d["id"] for d in asyncio.run(walk())] == [d["id"] for d in everything]
+    assert len(everything) == 5
@@ -0,0 +1,87 @@
+import asyncio
+import random
+import re
+import threading
+
+import pytest
+
+import server
+from server import TrigramIndex
+
+
+def brute_force(names, text, threshold):
+    """Best Jaccard similarity over each name and its words"""
+    query = TrigramIndex.trigrams(text)
+    scores = {}
+    for key, name in names.items():
+        words = re.findall(r"\w+", name.lower())
+        terms = [" ".join(words)] + words
+        best = max(len(query & g) / len(query | g) for g in map(TrigramIndex.trigrams, terms))
+        if best >= threshold:
+            scores[key] = best
+    return scores
+
+
+def test_typos_match_and_rank_best_first():
+    index = TrigramIndex()
+    index.upsert("p1", "Bread (Retail)")
+    index.upsert("p2", "Brown Bread")
+    index.upsert("p3", "Fresh Milk")
+    hits = index.search("bred")
+    assert {key for key, _ in hits} == {"p1", "p2"}
+    assert index.search("milk")[0][0] == "p3"
+    assert index.search("") == []
+
+
+@pytest.mark.parametrize("threshold", [0.2, 0.3, 0.5])
+def test_uncapped_search_is_exact_under_edits(threshold):
+    rng = random.Random(int(threshold * 10))
+    words = ["fresh", "milk", "amul", "butter", "bread", "brown", "rice", "basmati", "tata", "salt", "5kg"]
+    index, names = TrigramIndex(), {}
+    for step in range(600):
+        key = f"p{rng.randrange(60)}"
+        if rng.random() < 0.3:
+            index.remove(key)
+            names.pop(key, None)
+        else:
+            names[key] = " ".join(rng.choices(words, k=rng.randint(1, 4)))
+            index.upsert(key, names[key])
+        if step % 50 == 0:
+            for query in ("milk", "mlk", "fresh milk", "tata salt", "basmati rice 5kg", "bred"):
+                got = dict(index.search(query, threshold, limit=len(names) + 1, max_scan=None))
+                expected = brute_force(names, query, threshold)
+                assert got.keys() == expected.keys(), (step, query)
+                assert all(got[k] == pytest.approx(expected[k]) for k in got)
+
+
+def test_scan_cap_bounds_candidates_but_keeps_scores_sound():
+    index, names = TrigramIndex(), {}
+    for i in range(300):
+        names[f"p{i}"] = f"Tata Salt {i}" if i % 3 else f"Amul Butter {i}"
+        index.upsert(f"p{i}", names[f"p{i}"])
+    exact = brute_force(names, "tata salt", 0.3)
+    capped = index.search("tata salt", 0.3, limit=1000, max_scan=50)
+    assert capped
+    # the truncated posting goes uncounted for some hits, so scores may be
+    # low, but none is above its true similarity
+    assert all(score <= exact[key] + 1e-9 for key, score in capped)
+    assert any(score < exact[key] - 1e-9 for key, score in capped)
+
+
+def test_fuzzy_search_runs_on_the_search_pool(fake_db, monkeypatch):
+    threads = []
+    index = TrigramIndex()
+    index.upsert("p1", "Fresh Milk")
+    search = index.search
+
+    def tracked(*args):
+        threads.append(threading.current_thread().name)
+        return search(*args)
+
+    monkeypatch.setattr(index, "search", tracked)
+    monkeypatch.setattr(server, "product_trigrams", index)
+
+    fake_db.products.seed({"id": "p1", "name": "Fresh Milk"})
+    page = asyncio.run(server.fuzzy_search_products({}, "milk", 0.3, 10))
+    assert [d["id"] for d in page["items"]] == ["p1"]
+    assert threads and threads[0].startswith("trigram")
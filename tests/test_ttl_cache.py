@@ -0,0 +1,54 @@
+import server
+from server import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(server.time, "monotonic", clock)
+    cache = TTLCache(10, ttl=30)
+    cache.set("a", 1)
+    clock.now += 29
+    assert cache.get("a") == 1
+    clock.now += 2
+    assert cache.get("a") is None
+    assert cache.stats() == {"size": 0, "hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_least_recently_used_is_evicted_first():
+    cache = TTLCache(2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_peek_leaves_order_and_counters_alone():
+    cache = TTLCache(2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.peek("a") == 1 and cache.peek("zz", "d") == "d"
+    cache.set("c", 3)
+    assert cache.peek("a") is None
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
+
+
+def test_pop_and_clear():
+    cache = TTLCache(10, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.pop("a")
+    cache.pop("missing")
+    assert cache.get("a", "gone") == "gone"
+    cache.clear()
+    assert cache.stats()["size"] == 0